@@ -1,53 +1,281 @@
-import time
-from controller import Controller
+import time, json
+from controller import Controller, scores_key, decode_scores, MATCH_INDEX
+from league import RANKING_KEY, AWARDS_KEY
+from league import match_points, award_deltas, tally, decode_awards, is_finalised
+from knockout import FEEDS_KEY, SEEDS_KEY, advancing, fill_slot
 from twisted.internet import reactor, task
 
 from controller import ENTER_TIME, BOOT_TIME, LIVE_TIME, SETTLE_TIME
 from controller import FULL_MATCH_INTERVAL, PRE_START_INTERVAL, POST_START_INTERVAL
 
+# adds to a zone's score and publishes the change, numbered with the match's
+# score sequence so that listeners can tell if they have missed one
+ADD_SCORE = """
+local score = redis.call('HINCRBY', KEYS[1], ARGV[2], ARGV[3])
+local seq = redis.call('HINCRBY', KEYS[1], 'seq', 1)
+redis.call('PUBLISH', KEYS[2], cjson.encode({match = ARGV[1], seq = seq,
+                                             zone = tonumber(ARGV[2]),
+                                             delta = tonumber(ARGV[3]),
+                                             score = score}))
+return {score, seq}
+"""
+
+# zeroes a match's scores, unless it has them already: LIVE is announced
+# again after a panic, mid-match, and the scores so far must stand
+INIT_SCORES = """
+if redis.call('HEXISTS', KEYS[1], 'seq') == 1 then
+    return 0
+end
+for zone = 0, tonumber(ARGV[1]) - 1 do
+    redis.call('HSET', KEYS[1], zone, 0)
+end
+redis.call('HSET', KEYS[1], 'seq', 0)
+return 1
+"""
+
 class ArenaController(Controller):
     name = "arena"
 
     def configure(self):
+        self._add_score = self.r.register_script(ADD_SCORE)
+        self._init_scores = self.r.register_script(INIT_SCORES)
+        self._convert_score_lists()
+        # which teams are disqualified, so that the league is only rebuilt
+        # when that changes
+        keys = self.r.keys('teams.*.disqualified')
+        flags = self.r.mget(keys) if keys else []
+        self._disqualified_teams = set(key.split('.')[1]
+                                           for key, flag in zip(keys, flags)
+                                           if flag == 'true')
+        self._rebuild_league()
         self._update_arena_state()
 
     def _register_subscriptions(self, ps):
         ps.subscribe('comp.state')
+        ps.psubscribe('teams.*')
 
     def handle_channel_message(self, channel, data):
-        if channel == 'comp.state':
+        if channel.startswith('teams.'):
+            # only a team being disqualified, reinstated or removed with
+            # points in the league changes the standings
+            if channel == 'teams.imported':
+                tlas = data.split(' ')
+            elif data == 'updated':
+                tlas = [channel.split('.', 1)[1]]
+            elif data == 'gone':
+                tla = channel.split('.', 1)[1]
+                self._disqualified_teams.discard(tla)
+                if self.r.zscore(RANKING_KEY, tla):
+                    self._rebuild_league()
+                return
+            else:
+                return
+            if self._update_disqualified(tlas):
+                self._rebuild_league()
+        elif channel == 'comp.state':
             gstate, mstate = data.split(' ')
             self._update_arena_state()
             if gstate == 'MATCH':
                 cmatch = self.r.get('match.current')
-                team_count = self.r.llen('match.schedule.{0}.teams'.format(cmatch))
                 if mstate == 'LIVE':
-                    for i in xrange(team_count):
-                        self.r.rpush('match.schedule.{0}.scores'.format(cmatch), '0')
-                    self._transmit_scores()
+                    team_count = self.r.llen('match.schedule.{0}.teams'.format(cmatch))
+                    if self._init_scores(keys = [scores_key(cmatch)],
+                                         args = [team_count]):
+                        scores = dict([(str(zone), 0) for zone in xrange(team_count)] +
+                                      [('seq', 0)])
+                        self.log.append('scores', match = cmatch, scores = scores)
+                        self._transmit_scores(cmatch)
                 elif mstate == 'SETTLE':
-                    self._transmit_scores()
+                    self._transmit_scores(cmatch)
+                    self._finalise_league_match(cmatch)
+                    self._advance_knockout(cmatch)
+
+    def _transmit_scores(self, match):
+        # the full scores, which listeners resynchronise from
+        pipe = self.r.pipeline()
+        pipe.hgetall(scores_key(match))
+        pipe.llen('match.schedule.{0}.teams'.format(match))
+        fields, team_count = pipe.execute()
+        seq, scores = decode_scores(fields, team_count)
+        self.r.publish('match.current.scores',
+                       json.dumps({'match': match, 'seq': seq, 'scores': scores}))
+
+    def _convert_score_lists(self):
+        # convert scores from older versions, which were lists
+        for key in self.r.keys('match.schedule.*.scores'):
+            if self.r.type(key) == 'list':
+                scores = self.r.lrange(key, 0, -1)
+                pipe = self.r.pipeline()
+                pipe.delete(key)
+                pipe.hmset(key, dict([(str(zone), score)
+                                          for zone, score in enumerate(scores)] +
+                                     [('seq', 0)]))
+                pipe.execute()
+
+    def command_score_add(self, zone, points, match = None):
+        if match is None:
+            match = self.r.get('match.current')
+            if match is None:
+                raise ValueError('no match is in progress')
+        if not self.r.hexists(scores_key(match), 'seq'):
+            raise ValueError('match {0} has no scores'.format(match))
+        team_count = self.r.llen('match.schedule.{0}.teams'.format(match))
+        if not 0 <= int(zone) < team_count:
+            raise ValueError('match {0} has no zone {1}'.format(match, zone))
+        channel = ('match.current.scores' if match == self.r.get('match.current')
+                       else 'match.scores')
+        score, seq = self._add_score(keys = [scores_key(match), channel],
+                                     args = [match, int(zone), int(points)])
+        self.log.append('score', match = match, zone = int(zone),
+                        score = score, seq = seq)
+        if self.r.hexists(AWARDS_KEY, match):
+            # correcting a match which has already counted in the league
+            self._finalise_league_match(match)
+        if (match != self.r.get('match.current') or
+                self.r.get('comp.state.match') == 'SETTLE'):
+            # correcting a knockout match which has finished
+            self._advance_knockout(match)
+
+    def _update_disqualified(self, tlas):
+        """Refresh whether the teams are disqualified, returning whether any
+        has changed."""
+        flags = self.r.mget(['teams.{0}.disqualified'.format(tla) for tla in tlas])
+        disqualified = set(tla for tla, flag in zip(tlas, flags) if flag == 'true')
+        changed = disqualified.symmetric_difference(
+                      self._disqualified_teams.intersection(tlas))
+        self._disqualified_teams.difference_update(tlas)
+        self._disqualified_teams.update(disqualified)
+        return bool(changed)
+
+    def _disqualified(self, teams):
+        teams = sorted(set(teams))
+        if not teams:
+            return set()
+        flags = self.r.mget(['teams.{0}.disqualified'.format(tla) for tla in teams])
+        return set(tla for tla, flag in zip(teams, flags) if flag == 'true')
+
+    def _finalise_league_match(self, match):
+        # apply what the match awards to the standings, less whatever it
+        # awarded if it was finalised before
+        pipe = self.r.pipeline(transaction = False)
+        pipe.get('match.schedule.{0}.type'.format(match))
+        pipe.lrange('match.schedule.{0}.teams'.format(match), 0, -1)
+        pipe.hgetall(scores_key(match))
+        pipe.hget(AWARDS_KEY, match)
+        type, teams, fields, previous = pipe.execute()
+        if type != 'LEAGUE' or not fields:
+            return
+        _, scores = decode_scores(fields, len(teams))
+        awarded = match_points(teams, scores, self._disqualified(teams))
+        pipe = self.r.pipeline()
+        for tla, delta in award_deltas(awarded, decode_awards(previous)).items():
+            pipe.zincrby(RANKING_KEY, tla, delta)
+        pipe.hset(AWARDS_KEY, match, json.dumps(awarded))
+        pipe.publish('league.updated', match)
+        pipe.execute()
+
+    def _rebuild_league(self):
+        # one pass over the schedule index, reading every match in one go
+        pipe = self.r.pipeline(transaction = False)
+        pipe.zrange(MATCH_INDEX, 0, -1)
+        pipe.get('match.current')
+        pipe.get('comp.state.match')
+        matches, current, mstate = pipe.execute()
+        pipe = self.r.pipeline(transaction = False)
+        for match in matches:
+            pipe.get('match.schedule.{0}.type'.format(match))
+            pipe.get('match.schedule.{0}.state'.format(match))
+            pipe.lrange('match.schedule.{0}.teams'.format(match), 0, -1)
+            pipe.hgetall(scores_key(match))
+        results = pipe.execute()
+        finalised = []
+        for index, match in enumerate(matches):
+            type, state, teams, fields = results[index * 4:index * 4 + 4]
+            if (type == 'LEAGUE' and fields and
+                    is_finalised(match, state, current, mstate)):
+                finalised.append((match, teams, decode_scores(fields, len(teams))[1]))
+        disqualified = self._disqualified(tla for _, teams, _ in finalised
+                                              for tla in teams)
+        awards = dict((match, match_points(teams, scores, disqualified))
+                          for match, teams, scores in finalised)
+        totals = tally(awards.values())
+        pipe = self.r.pipeline()
+        pipe.delete(RANKING_KEY, AWARDS_KEY)
+        if totals:
+            pipe.zadd(RANKING_KEY, *[value for tla, score in totals.items()
+                                               for value in (score, tla)])
+            pipe.hmset(AWARDS_KEY, dict((match, json.dumps(awarded))
+                                            for match, awarded in awards.items()))
+        pipe.publish('league.updated', '*')
+        pipe.execute()
+        print "league rebuilt from {0} match(es)".format(len(awards))
+
+    def _advance_knockout(self, match):
+        # put the teams going through into the matches this one feeds,
+        # unless they have begun already
+        pipe = self.r.pipeline(transaction = False)
+        pipe.get('match.schedule.{0}.type'.format(match))
+        pipe.lrange('match.schedule.{0}.teams'.format(match), 0, -1)
+        pipe.hgetall(scores_key(match))
+        pipe.hgetall(FEEDS_KEY)
+        pipe.hgetall(SEEDS_KEY)
+        type, teams, fields, feeds, seeds = pipe.execute()
+        if type != 'KNOCKOUT' or not fields:
+            return
+        fed = []
+        for name, data in feeds.items():
+            upstream = json.loads(data)
+            if match in upstream:
+                fed.append((name, upstream.index(match)))
+        if not fed:
+            return
+        _, scores = decode_scores(fields, len(teams))
+        through = advancing(teams, scores,
+                            dict((tla, int(seed)) for tla, seed in seeds.items()))
+        pipe = self.r.pipeline(transaction = False)
+        for name, _ in fed:
+            pipe.get('match.schedule.{0}.state'.format(name))
+            pipe.lrange('match.schedule.{0}.teams'.format(name), 0, -1)
+        results = pipe.execute()
+        # all the matches fed are updated together
+        pipe = self.r.pipeline()
+        records = []
+        for index, (name, slot) in enumerate(fed):
+            state, current_teams = results[index * 2:index * 2 + 2]
+            if state != 'UPCOMING':
+                continue
+            key = 'match.schedule.{0}.teams'.format(name)
+            new_teams = fill_slot(current_teams, slot, through)
+            pipe.delete(key)
+            pipe.rpush(key, *new_teams)
+            records.append({'kind': 'match-teams', 'name': name, 'teams': new_teams})
+        pipe.publish('match.reschedule', 'trigger')
+        pipe.execute()
+        self.log.extend(records)
+        print "{0} go through from match {1}".format(', '.join(through), match)
 
-    def _transmit_scores(self):
-        cmatch = self.r.get('match.current')
-        self.r.publish('match.current.scores', ' '.join(str(x) for x in self.r.lrange('match.schedule.{0}.scores'.format(cmatch), 0, -1)))
+    def command_league_rebuild(self):
+        self._rebuild_league()
 
     def status_message(self):
         return 'running, {0}'.format(self.r.get('comp.state.arena'))
 
     def command_tinker(self):
         self.r.set('comp.state.tinker', 'true')
+        self.log.append('tinker', tinker = True)
         self._update_arena_state()
 
     def command_briefing(self):
         self.r.set('comp.state.tinker', 'false')
+        self.log.append('tinker', tinker = False)
         self._update_arena_state()
 
     def _update_arena_state(self):
-        prev_state = self.r.get('comp.state.arena')
-        gstate, mstate, tstate = (self.r.get('comp.state.global'),
-                                  self.r.get('comp.state.match'),
-                                  self.r.get('comp.state.tinker') == 'true')
+        prev_state, gstate, mstate, tstate = self.r.mget(('comp.state.arena',
+                                                          'comp.state.global',
+                                                          'comp.state.match',
+                                                          'comp.state.tinker'))
+        tstate = tstate == 'true'
         if gstate == 'FAIL':
             next_state = 'HARD-CLOSED'
         elif gstate == 'DOWNTIME':
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Benchmark how long compdctl takes to start up.
+
+Each subcommand given on the command line (by default, 'state' and
+'team-list') is run repeatedly in a fresh interpreter, and the fastest and
+median wall-clock times are reported along with which of the expensive
+modules were imported to resolve the subcommand.
+
+Run this from the controllers directory. Without compd running, the times
+include failing to connect to redis.
+"""
+import sys, os, subprocess, time
+
+RUNS = 20
+HEAVY_MODULES = ('redis', 'parsedatetime', 'parsedatetime.parsedatetime')
+
+PROBE = """
+import sys
+from compdctl_commands import load_command
+load_command({0!r})
+print ' '.join(name for name in {1!r} if name in sys.modules)
+"""
+
+def time_command(*args):
+    """Run the interpreter with the given arguments RUNS times, returning a
+    sorted list of the wall-clock times taken."""
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in xrange(RUNS):
+            start = time.time()
+            subprocess.call([sys.executable] + list(args),
+                            stdout = devnull, stderr = devnull)
+            timings.append(time.time() - start)
+    return sorted(timings)
+
+def imported_modules(command):
+    """Determine which of HEAVY_MODULES are imported just by looking up the
+    given subcommand."""
+    output = subprocess.check_output([sys.executable, '-c',
+                                      PROBE.format(command, HEAVY_MODULES)])
+    return output.split()
+
+def main(commands):
+    """Run the benchmark."""
+    baseline = time_command('-c', 'pass')
+    print 'bare interpreter: {0:.1f}ms'.format(baseline[0] * 1000)
+    for command in commands or ('state', 'team-list'):
+        timings = time_command('compdctl.py', command)
+        print '{0}: min {1:.1f}ms, median {2:.1f}ms; imports: {3}'.format(
+                command, timings[0] * 1000, timings[len(timings) // 2] * 1000,
+                ', '.join(imported_modules(command)) or 'nothing heavy')
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Benchmark a simulated competition day.
+
+A scratch redis server is started on a port of its own, and the state,
+arena and screen controllers are driven through a day of league matches,
+with a pause, a panic, a delay and a knockout, against a simulated clock
+(see simulation.py). For each controller, this reports:
+
+    * the real time spent handling its messages and timers
+    * the number of messages delivered to it
+    * the number of redis commands it sent, in total and by command, and
+      the round trips they took
+
+along with how much faster than real time the day ran, and what the
+screens were sent. With the same --seed, the same commands are sent every
+run, so the counts can be compared between versions; --json saves the
+results to compare against.
+
+Requires redis-server, as compd does. Run this from the controllers
+directory.
+"""
+import sys, os, json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import simulation
+
+def report(results):
+    print 'simulated {0}s in {1:.1f}s, {2:.0f}x real time'.format(
+              results['simulated'], results['wall'],
+              results['simulated'] / results['wall'])
+    print
+    print '{0:<10} {1:>10} {2:>10} {3:>10} {4:>11}  {5}'.format(
+              'controller', 'seconds', 'messages', 'commands', 'round trips',
+              'top commands')
+    for name, stats in sorted(results['controllers'].items()):
+        top = sorted(stats['by_command'].items(), key = lambda item: -item[1])[:4]
+        print '{0:<10} {1:>10.2f} {2:>10} {3:>10} {4:>11}  {5}'.format(
+                  name, stats['seconds'], stats['messages'], stats['commands'],
+                  stats['round_trips'],
+                  ', '.join('{0} {1}'.format(command, count)
+                                for command, count in top))
+    print
+    print 'screens were sent {0} event(s), {1} byte(s)'.format(
+              results['screens']['events'], results['screens']['bytes'])
+
+def main(args):
+    """Run the benchmark.
+
+    Options: --matches N and --teams N size the league; --seed N; --port N
+    runs the scratch redis server on another port; --json FILE saves the
+    results to FILE.
+    """
+    options = dict(zip(args[::2], args[1::2]))
+    port = int(options.get('--port', simulation.SIMULATION_PORT))
+    server = simulation.ScratchRedis(port)
+    server.start()
+    try:
+        day = simulation.Simulation(port, int(options.get('--seed', simulation.SEED)))
+        try:
+            start = day.now
+            wall = day.day(int(options.get('--matches', 60)),
+                           int(options.get('--teams', 32)))
+            results = day.report()
+            results['simulated'] = day.now - start
+            results['wall'] = wall
+        finally:
+            day.close()
+    finally:
+        server.stop()
+    report(results)
+    if '--json' in options:
+        with open(options['--json'], 'w') as handle:
+            json.dump(results, handle, indent = 1, sort_keys = True)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
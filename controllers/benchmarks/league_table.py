@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Benchmark computing the league table over a 500 match league.
+
+A league of MATCHES matches between TEAMS teams, four to a match, with
+random (but repeatable) scores, is finalised one match at a time. After
+each match, the standings are brought up to date:
+
+    * naively, by totalling every match finalised so far, as reading every
+      match.schedule.* key back would
+    * incrementally, by applying the difference the match makes, as
+      League.finalise does
+
+and the whole league is then rebuilt once from scratch, as League.rebuild
+does. The results of all three are checked against each other.
+
+Only the computation is timed; the redis commands each approach needs are
+counted from the way it reads the schedule, and reported alongside.
+
+Run this from the controllers directory.
+"""
+import sys, os, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import league
+
+MATCHES = 500
+TEAMS = 60
+TEAMS_PER_MATCH = 4
+SEED = 2013
+
+def make_league():
+    """Generate the matches, as a list of (teams, scores)."""
+    rng = random.Random(SEED)
+    tlas = ['T{0:02d}'.format(n) for n in xrange(TEAMS)]
+    return [(rng.sample(tlas, TEAMS_PER_MATCH),
+             [rng.randint(0, 30) for _ in xrange(TEAMS_PER_MATCH)])
+                for _ in xrange(MATCHES)]
+
+def ranked(totals):
+    return sorted(totals.items(), key = lambda item: (-item[1], item[0]))
+
+def naive(matches):
+    standings = None
+    for count in xrange(1, len(matches) + 1):
+        awards = [league.match_points(teams, scores)
+                      for teams, scores in matches[:count]]
+        standings = ranked(league.tally(awards))
+    return standings
+
+def incremental(matches):
+    totals = {}
+    standings = None
+    for teams, scores in matches:
+        awarded = league.match_points(teams, scores)
+        for tla, delta in league.award_deltas(awarded).iteritems():
+            totals[tla] = totals.get(tla, 0) + delta
+        # what ZREVRANGE on league.ranking reads
+        standings = ranked(totals)
+    return standings
+
+def rebuild(matches):
+    return ranked(league.tally(league.match_points(teams, scores)
+                                   for teams, scores in matches))
+
+def timed(function, matches):
+    start = time.time()
+    result = function(matches)
+    return time.time() - start, result
+
+def main():
+    matches = make_league()
+    n = len(matches)
+    results = []
+    for name, function, updates, commands, round_trips in (
+            # KEYS, then type, teams and scores of every match so far
+            ('naive', naive, n, n * (n + 1) * 3 / 2 + n, n * (n + 1) / 2 + n),
+            # one read pipeline, MGET of the teams' flags, one transaction
+            # of at most four ZINCRBYs, HSET and PUBLISH
+            ('incremental', incremental, n, n * 11, n * 3),
+            # ZRANGE of match.index and the current match, one read
+            # pipeline over the index, MGET, one transaction of DEL, ZADD,
+            # HMSET and PUBLISH
+            ('rebuild', rebuild, 1, 3 + n * 4 + 1 + 4, 4)):
+        elapsed, standings = timed(function, matches)
+        results.append(standings)
+        print '{0:<12} {1:>4} update(s) {2:>10.1f}ms {3:>9.1f}us/update ' \
+              '{4:>8} redis command(s) {5:>7} round trip(s)'.format(
+                  name, updates, elapsed * 1000, elapsed * 1e6 / updates,
+                  commands, round_trips)
+    assert results[0] == results[1] == results[2], 'standings differ'
+    print
+    print 'top of the table:'
+    for tla, score in results[2][:5]:
+        print '  {0} {1:>4} {2:>6}'.format(tla, *league.decode_ranking(score))
+
+if __name__ == "__main__":
+    main()
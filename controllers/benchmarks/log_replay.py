@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Benchmark reading and folding the competition log, before and after
+compaction.
+
+A log of a competition day is generated in a temporary directory: TEAMS
+teams, MATCHES league matches each scored SCORES_PER_MATCH times and moving
+through their states, with a pause and a delay every PAUSE_EVERY matches,
+and a command record for every change, as the controllers would write it.
+The log is then:
+
+    * read and folded into the state replay writes to redis
+    * compacted into a single snapshot
+    * read and folded again, from the snapshot
+
+and the two folds are checked to agree. Writing to redis is not timed: it is
+one transaction, whatever the length of the log.
+
+Run this from the controllers directory.
+"""
+import sys, os, time, random, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import eventlog
+
+TEAMS = 60
+MATCHES = 500
+SCORES_PER_MATCH = 20
+PAUSE_EVERY = 50
+SEED = 2013
+
+def day_records():
+    rng = random.Random(SEED)
+    tlas = ['T{0:02d}'.format(n) for n in xrange(TEAMS)]
+    records = [{'kind': 'sync-reset'}, {'kind': 'sync', 'real': 0, 'competition': 0}]
+    for tla in tlas:
+        records.append({'kind': 'command', 'command': {'command': 'add-team',
+                                                       'tla': tla, 'name': tla}})
+        records.append({'kind': 'team', 'tla': tla, 'name': tla, 'college': tla,
+                        'info': '', 'notes': '', 'disqualified': False})
+    for n in xrange(MATCHES):
+        name = 'L{0}'.format(n)
+        records.append({'kind': 'match', 'name': name, 'type': 'LEAGUE',
+                        'start': 600 + n * 420, 'stage': None,
+                        'teams': rng.sample(tlas, 4)})
+    for n in xrange(MATCHES):
+        name = 'L{0}'.format(n)
+        if n:
+            records.append({'kind': 'match-state', 'name': 'L{0}'.format(n - 1),
+                            'state': 'COMPLETED'})
+        records.append({'kind': 'match-state', 'name': name, 'state': 'IN-PROGRESS'})
+        records.append({'kind': 'current', 'match': name})
+        for state in ('ENTER', 'BOOT', 'LIVE'):
+            records.append({'kind': 'state', 'global': 'MATCH', 'match': state})
+        records.append({'kind': 'scores', 'match': name,
+                        'scores': {'0': 0, '1': 0, '2': 0, '3': 0, 'seq': 0}})
+        totals = [0] * 4
+        for seq in xrange(1, SCORES_PER_MATCH + 1):
+            zone = rng.randrange(4)
+            totals[zone] += rng.randint(1, 3)
+            records.append({'kind': 'command', 'command': {'command': 'score-add',
+                                                           'zone': zone}})
+            records.append({'kind': 'score', 'match': name, 'zone': zone,
+                            'score': totals[zone], 'seq': seq})
+        records.append({'kind': 'state', 'global': 'MATCH', 'match': 'SETTLE'})
+        if n % PAUSE_EVERY == PAUSE_EVERY - 1:
+            records.append({'kind': 'pause', 'competition': 600 + n * 420})
+            records.append({'kind': 'unpause'})
+            records.append({'kind': 'sync', 'real': 900 + n * 420,
+                            'competition': 600 + n * 420})
+            for later in xrange(n + 1, MATCHES):
+                records.append({'kind': 'match-start', 'name': 'L{0}'.format(later),
+                                'start': 600 + later * 420 + 60})
+    return records
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return time.time() - start, result
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'competition.log')
+        log = eventlog.EventLog('benchmark', path)
+        records = day_records()
+        log.extend(records)
+        size = os.path.getsize(path)
+        elapsed, full = timed(lambda: eventlog.fold(eventlog.read_records(path)))
+        print '{0:<10} {1:>7} record(s) {2:>9} byte(s) {3:>8.1f}ms {4:>9.0f} record(s)/s'.format(
+                  'full log', len(records), size, elapsed * 1000, len(records) / elapsed)
+        elapsed, folded = timed(log.compact)
+        print '{0:<10} {1:>7} record(s) {2:>9} byte(s) {3:>8.1f}ms'.format(
+                  'compacting', folded, os.path.getsize(path), elapsed * 1000)
+        elapsed, compacted = timed(lambda: eventlog.fold(eventlog.read_records(path)))
+        print '{0:<10} {1:>7} record(s) {2:>9} byte(s) {3:>8.1f}ms'.format(
+                  'snapshot', 1, os.path.getsize(path), elapsed * 1000)
+        assert full == compacted, 'the snapshot does not match the log'
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Benchmark how long the bundled parsedatetime takes to become usable.
+
+Each stage is timed inside a fresh interpreter, RUNS times over:
+
+    * import: importing parsedatetime.parsedatetime
+    * calendar: building the first Calendar, and so the shared Constants
+    * parse: the first parse, which compiles the patterns it needs
+
+once loading locales and compiling patterns on demand, as parsedatetime
+now does, and once loading every locale on import and compiling every
+pattern with the shared Constants, as it used to.
+
+Run this from the controllers directory. If PYTHONDONTWRITEBYTECODE is set,
+the import stage includes compiling the modules' source.
+"""
+import sys, subprocess
+
+RUNS = 20
+STAGES = ('import', 'calendar', 'parse')
+
+PROBE = """
+import sys, time
+start = time.time()
+import parsedatetime.parsedatetime as pt
+import parsedatetime.parsedatetime_consts as ptc
+if {0}:
+    for localeID in ptc.pdtLocales:
+        ptc.pdtLocales[localeID]
+imported = time.time()
+calendar = pt.Calendar()
+if {0}:
+    calendar.ptc.compilePatterns()
+built = time.time()
+calendar.parse('5 minutes from now')
+parsed = time.time()
+print imported - start, built - imported, parsed - built
+"""
+
+def time_stages(up_front):
+    """Time each stage RUNS times, returning a list of sorted timings for
+    each stage."""
+    timings = [[] for stage in STAGES]
+    for _ in xrange(RUNS):
+        output = subprocess.check_output([sys.executable, '-c',
+                                          PROBE.format(up_front)])
+        for stage, timing in zip(timings, output.split()):
+            stage.append(float(timing))
+    return [sorted(stage) for stage in timings]
+
+def report(name, timings):
+    print '{0}:'.format(name)
+    for stage, stage_timings in zip(STAGES, timings):
+        print '  {0:<10} min {1:6.2f}ms, median {2:6.2f}ms'.format(
+                stage, stage_timings[0] * 1000,
+                stage_timings[len(stage_timings) // 2] * 1000)
+    total = sorted(sum(run) for run in zip(*timings))
+    print '  {0:<10} min {1:6.2f}ms, median {2:6.2f}ms'.format(
+            'total', total[0] * 1000, total[len(total) // 2] * 1000)
+
+def main():
+    """Run the benchmark."""
+    report('on demand', time_stages(False))
+    report('up front', time_stages(True))
+
+if __name__ == "__main__":
+    main()
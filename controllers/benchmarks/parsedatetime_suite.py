@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""Benchmark the bundled parsedatetime parser against its own test corpora.
+
+The parsedatetime unit tests are run once with Calendar.parse and
+Calendar.evalRanges wrapped, to collect every phrase they parse along with its
+locale and source time. Each phrase is then parsed again to measure:
+
+    * the time per parse, in microseconds
+    * the number of regular expression evaluations per parse
+    * the number of objects allocated per parse, net of those freed, as
+      counted by the garbage collector (Python 2 has no tracemalloc)
+
+Results are grouped by the test which used the phrase. With --json, the
+results are also saved so that a later run can be compared against them with
+--baseline.
+
+Run this from the controllers directory.
+"""
+import sys, os, time, gc, re, copy, json, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import parsedatetime.parsedatetime as pt
+
+PARSES_PER_SAMPLE = 50
+SAMPLES = 3
+COUNTED_METHODS = ('search', 'match', 'finditer', 'findall', 'sub', 'split')
+
+class Counter(object):
+    """A running count of regular expression evaluations."""
+    def __init__(self):
+        self.count = 0
+
+class CountingPattern(object):
+    """Wrap a compiled pattern, counting evaluations of it."""
+    def __init__(self, pattern, counter):
+        self._pattern = pattern
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._pattern, name)
+        if name not in COUNTED_METHODS:
+            return attribute
+        def counted(*args, **kwargs):
+            self._counter.count += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+class CountingRe(object):
+    """Stand in for the re module, counting evaluations and compilations of
+    patterns which are not precompiled."""
+    def __init__(self, counter):
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(re, name)
+        if name not in COUNTED_METHODS + ('compile',):
+            return attribute
+        def counted(*args, **kwargs):
+            self._counter.count += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+def collect_corpus():
+    """Run the parsedatetime tests, returning a list of (group, method,
+    constants, phrase, source time) for every top-level parse they make."""
+    corpus = []
+    seen = set()
+    current = {'test': None, 'depth': 0}
+
+    def recording(method):
+        original = getattr(pt.Calendar, method)
+        def wrapper(calendar, phrase, sourceTime=None):
+            if current['depth'] == 0:
+                key = (current['test'], method, id(calendar.ptc),
+                       calendar.ptc.localeID, phrase)
+                if key not in seen:
+                    seen.add(key)
+                    corpus.append((current['test'], method, calendar.ptc,
+                                   phrase, sourceTime))
+            current['depth'] += 1
+            try:
+                return original(calendar, phrase, sourceTime)
+            finally:
+                current['depth'] -= 1
+        return original, wrapper
+
+    class RecordingResult(unittest.TestResult):
+        def startTest(self, test):
+            unittest.TestResult.startTest(self, test)
+            module, _, method = test.id().split('.')[-3:]
+            current['test'] = '{0}.{1}'.format(module, method)
+
+    originals = {}
+    for method in ('parse', 'evalRanges'):
+        originals[method], wrapper = recording(method)
+        setattr(pt.Calendar, method, wrapper)
+    try:
+        suite = unittest.defaultTestLoader.discover(
+                    os.path.join(os.path.dirname(pt.__file__), 'tests'),
+                    pattern = 'Test*.py',
+                    top_level_dir = os.path.dirname(os.path.dirname(pt.__file__)))
+        suite.run(RecordingResult())
+    finally:
+        for method, original in originals.items():
+            setattr(pt.Calendar, method, original)
+    return corpus
+
+def counting_calendar(ptc, counter):
+    """Build a Calendar using a copy of the given constants whose patterns
+    count their evaluations."""
+    ptc = copy.copy(ptc)
+    ptc.compilePatterns()
+    for name in ptc.cre_keys:
+        setattr(ptc, name, CountingPattern(getattr(ptc, name), counter))
+    return pt.Calendar(ptc)
+
+def measure(method, ptc, phrase, sourceTime):
+    """Measure parsing a single phrase, returning (microseconds per parse,
+    regex evaluations per parse, allocations per parse)."""
+    calendar = pt.Calendar(ptc)
+    function = getattr(calendar, method)
+    function(phrase, sourceTime)
+    timings = []
+    for _ in xrange(SAMPLES):
+        start = time.time()
+        for _ in xrange(PARSES_PER_SAMPLE):
+            function(phrase, sourceTime)
+        timings.append((time.time() - start) / PARSES_PER_SAMPLE)
+
+    counter = Counter()
+    counting = getattr(counting_calendar(ptc, counter), method)
+    original_re, pt.re = pt.re, CountingRe(counter)
+    try:
+        counting(phrase, sourceTime)
+    finally:
+        pt.re = original_re
+
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        function(phrase, sourceTime)
+        allocations = gc.get_count()[0] - before
+    finally:
+        gc.enable()
+
+    return min(timings) * 1e6, counter.count, allocations
+
+def run():
+    """Collect the corpus and measure every phrase in it, returning a list of
+    result dictionaries."""
+    results = []
+    for group, method, ptc, phrase, sourceTime in collect_corpus():
+        micros, evaluations, allocations = measure(method, ptc, phrase,
+                                                   sourceTime)
+        results.append({'group': group, 'method': method,
+                        'locale': ptc.localeID, 'phrase': phrase,
+                        'micros': micros, 'regexes': evaluations,
+                        'allocations': allocations})
+    return results
+
+def result_key(result):
+    return (result['group'], result['locale'], result['phrase'])
+
+def report(results, baseline = None):
+    """Print per-phrase results, then totals per group and overall."""
+    previous = {}
+    if baseline is not None:
+        previous = dict((result_key(result), result) for result in baseline)
+    print '{0:<40} {1:<30} {2:>9} {3:>7} {4:>7}'.format(
+            'test', 'phrase', 'us/parse', 'regexes', 'allocs')
+    groups = {}
+    for result in results:
+        line = '{0:<40} {1:<30} {2:>9.1f} {3:>7} {4:>7}'.format(
+                result['group'], repr(result['phrase'])[:30],
+                result['micros'], result['regexes'], result['allocations'])
+        old = previous.get(result_key(result))
+        if old is not None:
+            line += ' ({0:+.0%} time, {1:+d} regexes)'.format(
+                        result['micros'] / old['micros'] - 1,
+                        result['regexes'] - old['regexes'])
+        print line
+        totals = groups.setdefault(result['group'].split('.')[0], [0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += result['micros']
+        totals[2] += result['regexes']
+    print
+    print '{0:<40} {1:>7} {2:>12} {3:>14}'.format(
+            'suite', 'phrases', 'mean us', 'mean regexes')
+    for group, (count, micros, evaluations) in sorted(groups.items()):
+        print '{0:<40} {1:>7} {2:>12.1f} {3:>14.1f}'.format(
+                group, count, micros / count, float(evaluations) / count)
+    count = len(results)
+    if count:
+        print '{0:<40} {1:>7} {2:>12.1f} {3:>14.1f}'.format(
+                'all', count, sum(r['micros'] for r in results) / count,
+                float(sum(r['regexes'] for r in results)) / count)
+
+def main(args):
+    """Run the benchmark.
+
+    Options: --json FILE saves the results to FILE; --baseline FILE compares
+    against results previously saved.
+    """
+    options = dict(zip(args[::2], args[1::2]))
+    baseline = None
+    if '--baseline' in options:
+        with open(options['--baseline']) as handle:
+            baseline = json.load(handle)
+    results = run()
+    report(results, baseline)
+    if '--json' in options:
+        with open(options['--json'], 'w') as handle:
+            json.dump(results, handle, indent = 1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Measure the bytes a screen downloads each time it boots.
+
+A screen booting fetches the page, its stylesheet and the fonts the
+stylesheet uses. Each is requested from the screen controller's asset
+resource, over HTTP, and this reports the response bodies sent for them:
+
+    * as served before, uncompressed, when nothing is cached
+    * on a screen's first boot, compressed
+    * on every later boot, when the page is revalidated with its ETag
+      (a 304 with no body) and the versioned assets come from the cache
+
+Only response bodies are counted, not headers, nor the id request and event
+stream which are the same either way. Requires twisted and redis-py, as the
+screen controller does.
+
+Run this from the controllers directory.
+"""
+import sys, os, re
+from twisted.test.proto_helpers import StringTransport
+from twisted.web import server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import static_assets
+from screens import AssetResource
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+def boot_assets(catalogue):
+    """The assets fetched by a booting screen, besides the page."""
+    stylesheet = catalogue.lookup('assets/style.css')
+    fetched = [stylesheet]
+    for url in re.findall(r'url\("?([^")]+)"?\)', stylesheet.variants['identity']):
+        fetched.append(catalogue.lookup('assets/' + url))
+    return fetched
+
+def fetch(asset, headers = ()):
+    """Request an asset, returning the status, headers and body of the
+    response."""
+    channel = server.Site(AssetResource(asset)).buildProtocol(None)
+    transport = StringTransport()
+    channel.makeConnection(transport)
+    channel.dataReceived('GET / HTTP/1.1\r\nHost: screen\r\n' +
+                         ''.join('{0}: {1}\r\n'.format(name, value)
+                                     for name, value in headers) + '\r\n')
+    head, _, body = transport.value().partition('\r\n\r\n')
+    lines = head.split('\r\n')
+    fields = dict((name.lower(), value)
+                      for name, _, value in (line.partition(': ') for line in lines[1:]))
+    channel.connectionLost(None)
+    return int(lines[0].split(' ')[1]), fields, body
+
+def main():
+    catalogue = static_assets.AssetCatalogue(os.path.join(os.path.dirname(__file__), '..'))
+    assets = [catalogue.page] + boot_assets(catalogue)
+    print '{0:<32} {1:>10} {2:>10} {3:>10}'.format('file', 'before', 'first', 'later')
+    totals = [0, 0, 0]
+    requests = [0, 0, 0]
+    for asset in assets:
+        before = len(fetch(asset)[2])
+        _, fields, body = fetch(asset, [('Accept-Encoding', ACCEPT_ENCODING)])
+        first = len(body)
+        later = 0
+        if asset is catalogue.page:
+            # the page is revalidated; everything else is cached
+            status, _, body = fetch(asset, [('Accept-Encoding', ACCEPT_ENCODING),
+                                            ('If-None-Match', fields['etag'])])
+            assert status == 304, 'the page was not revalidated'
+            later = len(body)
+        print '{0:<32} {1:>10} {2:>10} {3:>10}'.format(asset.path, before, first, later)
+        for i, size in enumerate((before, first, later)):
+            totals[i] += size
+        requests[0] += 1
+        requests[1] += 1
+        requests[2] += 1 if asset is catalogue.page else 0
+    print '{0:<32} {1:>10} {2:>10} {3:>10}'.format('total bytes', *totals)
+    print '{0:<32} {1:>10} {2:>10} {3:>10}'.format('requests', *requests)
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,167 @@
-from twisted.internet import reactor, protocol, error
+import sys, os, time, socket
+from twisted.internet import reactor, protocol, error, task
 
-from arena import ArenaController
-from screens import ScreenController
-from state import StateController
-#from music import MusicController
+from controller import when_redis_ready
+from eventlog import read_records, fold, replay
+from screens import HTTP_PORT
 
 SERVER_COMMAND = '/usr/local/bin/redis-server'
+CONTROLLER_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 
-def bring_up_controllers():
-    print "Bringing up state controller..."
-    state = StateController()
-    print "Bringing up arena controller..."
-    arena = ArenaController()
-    print "Bringing up screen controller..."
-    screens = ScreenController()
-    #print "Bringing up music controller..."
-    #music = MusicController()
-    print "compd started"
-
-def bring_up_redis():
+# each controller runs in its own process, from its module's __main__
+CONTROLLERS = [('state', 'state.py'),
+               ('arena', 'arena.py'),
+               #('music', 'music.py'),
+               ('screens', 'screens.py')]
+
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+# a controller which ran for this long before exiting is restarted promptly,
+# rather than backing off
+STABLE_TIME = 60.0
+
+class ControllerProcess(protocol.ProcessProtocol):
+    def __init__(self, supervisor, name, args, fds):
+        self.supervisor = supervisor
+        self.name = name
+        self.args = args
+        self.fds = fds
+        self.started = None
+        self.quick_exits = 0
+        self.restarts = 0
+        self._partial = ''
+
+    def spawn(self):
+        self.started = time.time()
+        child_fds = {0: 'w', 1: 'r', 2: 'r'}
+        child_fds.update((fd, fd) for fd in self.fds)
+        reactor.spawnProcess(self, sys.executable,
+                             [sys.executable, '-u'] + self.args,
+                             env = os.environ, path = CONTROLLER_DIRECTORY,
+                             childFDs = child_fds)
+
+    def received(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            print "[{0}] {1}".format(self.name, line)
+
+    outReceived = received
+    errReceived = received
+
+    def processEnded(self, status):
+        self.transport = None
+        if self._partial:
+            self.received('\n')
+        self.supervisor.controller_exited(self, status.value)
+
+class Supervisor(object):
+    """Runs each controller in a process of its own, restarting any which
+    exit, and reports on them over controller.[name].heartbeat."""
+    name = "supervisor"
+
+    def __init__(self, r, screen_workers = 1):
+        self.r = r
+        self.processes = []
+        self.stopping = False
+        self._pending = {}
+        self._sockets = []
+        for name, module in CONTROLLERS:
+            if name == 'screens' and screen_workers > 1:
+                # the workers share one listening socket, and the kernel
+                # hands each new screen connection to one of them
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(('', HTTP_PORT))
+                sock.listen(50)
+                sock.setblocking(False)
+                self._sockets.append(sock)
+                fd = sock.fileno()
+                for worker in xrange(1, screen_workers + 1):
+                    self.processes.append(ControllerProcess(self,
+                        '{0}-{1}'.format(name, worker),
+                        [module, '--worker', str(worker), '--listen-fd', str(fd)],
+                        [fd]))
+            else:
+                self.processes.append(ControllerProcess(self, name, [module], []))
+
+    def start(self):
+        for process in self.processes:
+            print "Bringing up {0} controller...".format(process.name)
+            process.spawn()
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+        heartbeat_task = task.LoopingCall(self._transmit_heartbeat)
+        heartbeat_task.start(4.0)
+        print "compd started"
+
+    def stop(self):
+        self.stopping = True
+        for call in self._pending.values():
+            call.cancel()
+        self._pending.clear()
+        for process in self.processes:
+            if process.transport is not None:
+                try:
+                    process.transport.signalProcess('TERM')
+                except error.ProcessExitedAlready:
+                    pass
+
+    def controller_exited(self, process, reason):
+        if self.stopping:
+            return
+        if time.time() - process.started < STABLE_TIME:
+            process.quick_exits += 1
+        else:
+            process.quick_exits = 0
+        delay = min(RESTART_DELAY * 2 ** max(process.quick_exits - 1, 0),
+                    MAX_RESTART_DELAY)
+        if isinstance(reason, error.ProcessTerminated):
+            if reason.signal is not None:
+                cause = 'killed by signal {0}'.format(reason.signal)
+            else:
+                cause = 'exit {0}'.format(reason.exitCode)
+        else:
+            cause = 'exit 0'
+        message = 'exited ({0}), restarting in {1:g}s'.format(cause, delay)
+        print "{0} controller {1}".format(process.name, message)
+        self._publish(process.name, message)
+        def restart():
+            del self._pending[process.name]
+            process.restarts += 1
+            process.spawn()
+            self._publish(process.name,
+                          'restarted ({0} restart(s))'.format(process.restarts))
+        self._pending[process.name] = reactor.callLater(delay, restart)
+
+    def _publish(self, name, message):
+        try:
+            self.r.publish('controller.{0}.heartbeat'.format(name), message)
+        except Exception as e:
+            print "error reporting on {0} controller:".format(name), e
+
+    def status_message(self):
+        running = sum(1 for process in self.processes
+                          if process.transport is not None)
+        restarts = sum(process.restarts for process in self.processes)
+        return '{0}/{1} controller(s) running, {2} restart(s)'.format(
+                    running, len(self.processes), restarts)
+
+    def _transmit_heartbeat(self):
+        self._publish(self.name, self.status_message())
+
+def bring_up_controllers(r, screen_workers = 1):
+    supervisor = Supervisor(r, screen_workers)
+    supervisor.start()
+    return supervisor
+
+def replay_log(r):
+    records = read_records()
+    matches, teams = replay(r, fold(records))
+    print "\treplayed {0} record(s) from the log: {1} match(es), {2} team(s)".format(
+              len(records), matches, teams)
+    return r
+
+def bring_up_redis(screen_workers = 1, replay_first = False):
     class RedisProtocol(protocol.ProcessProtocol):
         def processExited(self, status):
             import sys
@@ -33,14 +176,28 @@ def bring_up_redis():
         errReceived = received
 
         def connectionMade(self):
-            print "\tredis started."
-            reactor.callLater(2.8, bring_up_controllers)
+            print "\tredis started, waiting for it to accept commands..."
+            ready = when_redis_ready()
+            if replay_first:
+                # rebuild the competition from the log before anything reads it
+                ready.addCallback(replay_log)
+            ready.addCallbacks(bring_up_controllers, self.not_ready,
+                               callbackArgs = (screen_workers,))
+
+        def not_ready(self, failure):
+            print "could not bring up the controllers:", failure.getErrorMessage()
+            self.transport.signalProcess('TERM')
 
     process = RedisProtocol()
     reactor.spawnProcess(process, SERVER_COMMAND, [SERVER_COMMAND, 'redis.conf'])
 
 if __name__ == "__main__":
+    args = sys.argv[1:]
+    replay_first = '--replay' in args
+    if replay_first:
+        args.remove('--replay')
+    options = dict(zip(args[::2], args[1::2]))
+    screen_workers = int(options.get('--screen-workers', 1))
     print "Bringing up redis server..."
-    bring_up_redis()
+    bring_up_redis(screen_workers, replay_first)
     reactor.run()
-
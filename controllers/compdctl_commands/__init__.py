@@ -0,0 +1,309 @@
+"""The subcommands of the compdctl tool, and the helpers they share.
+
+Subcommands are grouped into modules within this package. Since compdctl is
+run many times over during a competition, each module is only imported when
+one of its subcommands is invoked, and neither redis nor parsedatetime are
+imported until they are actually needed.
+"""
+import sys, os, time, json, socket, itertools
+from copy import copy
+
+SUBCOMMANDS = {}
+
+# Subcommand name prefixes, and the module of this package which defines the
+# subcommands with that prefix. The first matching prefix is used.
+COMMAND_MODULES = [('screen-', 'screen'),
+                   ('team-', 'team'),
+                   ('match-', 'match'),
+                   ('import-', 'match'),
+                   ('knockout-', 'match'),
+                   ('log-', 'log'),
+                   ('score-', 'scores'),
+                   ('league', 'scores'),
+                   ('music-', 'music'),
+                   ('sound-', 'music'),
+                   ('shell', 'shell'),
+                   ('batch', 'shell'),
+                   ('', 'competition')]
+
+_CONNECTION = []
+
+def connection():
+    """Get the connection to redis, connecting on first use."""
+    if not _CONNECTION:
+        import redis
+        _CONNECTION.append(redis.StrictRedis())
+    return _CONNECTION[0]
+
+def is_connection_error(exception):
+    """Determine whether an exception indicates that compd is down.
+
+    >>> is_connection_error(CommandError('panic: not acknowledged within 5.0s'))
+    False
+    """
+    # redis is only imported once something needs a connection
+    redis = sys.modules.get('redis')
+    return (redis is not None and
+            isinstance(exception, redis.exceptions.ConnectionError))
+
+def load_command(command):
+    """Look up a subcommand by name, importing the module defining it.
+
+    A KeyError is raised if there is no such subcommand.
+    """
+    if command not in SUBCOMMANDS:
+        for prefix, module in COMMAND_MODULES:
+            if command.startswith(prefix):
+                __import__('{0}.{1}'.format(__name__, module))
+                break
+    if command not in SUBCOMMANDS:
+        load_all_commands()
+    return SUBCOMMANDS[command]
+
+def load_all_commands():
+    """Import every subcommand module, returning a list of the modules."""
+    modules = []
+    for _, module in COMMAND_MODULES:
+        name = '{0}.{1}'.format(__name__, module)
+        __import__(name)
+        if sys.modules[name] not in modules:
+            modules.append(sys.modules[name])
+    return modules
+
+def parse_location(location):
+    """Given a user-inputted location, parse it and return a URL safe for
+    transmitting to the controllers.
+
+    >>> parse_location('http://www.example.com')
+    'http://www.example.com'
+    >>> parse_location('http://moo/bees in my eyes')
+    'http://moo/bees%20in%20my%20eyes'
+    >>> parse_location('/dev/null')
+    'file:///dev/null'
+    """
+    import os.path, urlparse, urllib
+    parts = urlparse.urlparse(location)
+    if parts.scheme == '': # pylint: disable=E1101
+        path = os.path.realpath(location)
+        return 'file://{0}'.format(urllib.quote(path if os.path.exists(path)
+                                                     else location))
+    else:
+        return urlparse.urlunparse(urllib.quote(component)
+                                   for component in parts)
+
+class CommandError(Exception):
+    """A command was rejected by compd, or not acknowledged in time."""
+    pass
+
+# How long to wait for a controller to acknowledge a command, in seconds.
+COMMAND_TIMEOUT = 5.0
+
+# Outstanding commands by request ID, as (command, time sent) pairs.
+PENDING_COMMANDS = {}
+# End-to-end latencies, in seconds, of the commands acknowledged so far.
+COMMAND_LATENCIES = []
+
+# Commands with these prefixes are handled by the music controller, which
+# compd does not run (see CONTROLLERS in compd.py), so nothing acknowledges
+# them; they are sent without waiting.
+UNACKNOWLEDGED_PREFIXES = ('music-', 'sound-')
+
+_REQUEST_IDS = itertools.count(1)
+_ACKNOWLEDGEMENTS = []
+_PIPELINING = [False]
+
+def pipeline_commands(enabled = True):
+    """Set whether send_redis_command waits for each command to be
+    acknowledged before returning.
+
+    When pipelining, the caller is responsible for calling
+    wait_for_acknowledgements once it has sent its commands.
+    """
+    _PIPELINING[0] = enabled
+
+def _acknowledgement_subscription():
+    """Get the subscription to command acknowledgements, subscribing on first
+    use."""
+    if not _ACKNOWLEDGEMENTS:
+        pubsub = connection().pubsub()
+        pubsub.subscribe('comp.command.ack')
+        # make sure the subscription is live before any commands are sent, so
+        # that no acknowledgements can be missed
+        while True:
+            message = pubsub.get_message(timeout = COMMAND_TIMEOUT)
+            if message is None or message['type'] == 'subscribe':
+                break
+        _ACKNOWLEDGEMENTS.append(pubsub)
+    return _ACKNOWLEDGEMENTS[0]
+
+def send_redis_command(command, **kwargs):
+    """Transmit a command to redis.
+
+    Keyword arguments are sent in the command dictionary, along with a request
+    ID which the controller handling the command uses to acknowledge it.
+    Unless pipelining, this then waits for the acknowledgement, raising a
+    CommandError if the command fails or is not acknowledged in time.
+
+    Returns the request ID, or None for a command which is not acknowledged.
+    """
+    if command.startswith(UNACKNOWLEDGED_PREFIXES):
+        connection().publish('comp.command',
+                             json.dumps(dict(kwargs, command = command)))
+        return None
+    _acknowledgement_subscription()
+    request_id = '{0}-{1}-{2}'.format(socket.gethostname(), os.getpid(),
+                                      next(_REQUEST_IDS))
+    command_dictionary = copy(kwargs)
+    command_dictionary['command'] = command
+    command_dictionary['request-id'] = request_id
+    encoded_command_dictionary = json.dumps(command_dictionary)
+    PENDING_COMMANDS[request_id] = (command, time.time())
+    connection().publish('comp.command', encoded_command_dictionary)
+    if not _PIPELINING[0]:
+        failures = wait_for_acknowledgements()
+        if failures:
+            raise CommandError('{0}: {1}'.format(*failures[0]))
+    return request_id
+
+def wait_for_acknowledgements(timeout = COMMAND_TIMEOUT):
+    """Wait for every outstanding command to be acknowledged.
+
+    The timeout applies to the wait as a whole. Returns a list of (command,
+    problem) pairs for the commands which failed or were not acknowledged in
+    time.
+    """
+    pubsub = _acknowledgement_subscription()
+    failures = []
+    deadline = time.time() + timeout
+    while PENDING_COMMANDS:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        message = pubsub.get_message(timeout = remaining)
+        if message is None or message['type'] != 'message':
+            continue
+        acknowledgement = json.loads(message['data'])
+        pending = PENDING_COMMANDS.pop(acknowledgement['request-id'], None)
+        if pending is None:
+            continue # another compdctl's command
+        command, sent = pending
+        COMMAND_LATENCIES.append(time.time() - sent)
+        if acknowledgement['status'] != 'ok':
+            failures.append((command, acknowledgement['error']))
+    for command, _ in PENDING_COMMANDS.itervalues():
+        failures.append((command, 'not acknowledged within {0}s'.format(timeout)))
+    PENDING_COMMANDS.clear()
+    return failures
+
+def time_out(length, callback):
+    """Run a callback, timing out if it takes too long.
+
+    >>> time_out(3.0, lambda: True)
+    False
+    >>> time_out(3.0, lambda: time.sleep(12))
+    True
+    >>> time_out(3.0, lambda: time.sleep(1))
+    False
+
+    """
+    import threading
+    checked_thread = threading.Thread(target = callback)
+    checked_thread.name = "checked_thread thread"
+    checked_thread.daemon = True
+    checked_thread.start()
+    checked_thread.join(length)
+    return checked_thread.is_alive()
+
+def named_subcommand(name):
+    """Return a wrapper which installs a subcommand with a given name.
+
+    This is indented to be used as a decorator."""
+    def wrapper(handler):
+        """Install the command with the name grabbed from the enclosing scope,
+        hopefully set in a decorator."""
+        SUBCOMMANDS[name] = handler
+        return handler
+    return wrapper
+
+def subcommand(handler):
+    """Install a subcommand.
+
+    Its identifier is taken from the function's __name__, replacing _ with -.
+    """
+    SUBCOMMANDS[handler.__name__.replace('_', '-')] = handler
+    return handler
+
+def yn_prompt(message):
+    """Print out a prompt and ask for a 'yes' or 'no' response.
+
+    This returns a boolean.
+
+    If no value could be interpreted, a ValueError is raised.
+    """
+    user_line = raw_input(message + ' ')
+    if user_line and user_line[0].lower() == 'y':
+        return True
+    elif user_line and user_line[0].lower() == 'n':
+        return False
+    else:
+        raise ValueError("no idea what you're talking about")
+
+_CALENDAR = []
+
+def calendar():
+    """Get the parsedatetime Calendar used for parsing times, creating it on
+    first use."""
+    if not _CALENDAR:
+        from parsedatetime.parsedatetime import Calendar
+        _CALENDAR.append(Calendar())
+    return _CALENDAR[0]
+
+def parse_time(time_string):
+    """Parse a relative time."""
+    time_struct, handled = calendar().parse(time_string)
+    if not handled & 2:
+        raise ValueError('could not parse time')
+    return int(time.mktime(time_struct))
+
+def parse_times(time_strings):
+    """Parse many relative times at once, all relative to the same moment.
+
+    Unlike parse_time, times which could not be parsed are returned as None
+    rather than raising an error.
+    """
+    from parsedatetime.parsedatetime import parse_many
+    return parse_many(time_strings, calendar = calendar())
+
+def parse_time_bound(time_string, unbounded):
+    """Parse an optional bound for a time range.
+
+    The special value '-' leaves the range open on that side, in which case
+    the given value for unbounded is returned.
+
+    >>> parse_time_bound('-', '-inf')
+    '-inf'
+    >>> parse_time_bound(None, '+inf')
+    '+inf'
+    """
+    if time_string is None or time_string == '-':
+        return unbounded
+    return parse_time(time_string)
+
+VIEW_TEXT_PAGER_THRESHOLD = 20
+
+def view_text(lines):
+    """View a block of text in the console.
+
+    If it is fewer than or equal two twenty lines long, this simply displays it
+    as-is, otherwise it invokes a pager.
+    """
+    if len(lines) <= VIEW_TEXT_PAGER_THRESHOLD:
+        for line in lines:
+            print line
+    else:
+        import tempfile, os
+        file_handle, filename = tempfile.mkstemp()
+        os.write(file_handle, '\n'.join(lines))
+        os.fsync(file_handle)
+        os.system('less -rf "{0}"'.format(filename))
+        os.close(file_handle)
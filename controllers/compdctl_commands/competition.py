@@ -0,0 +1,244 @@
+"""Subcommands for the overall state of the competition, and for checking up
+on compd itself."""
+from compdctl_commands import subcommand, send_redis_command, connection
+from compdctl_commands import yn_prompt, time_out
+import sys, time, json
+
+@subcommand
+def panic():
+    """Sound the alarms and show no-entry signs on all screens."""
+    send_redis_command('panic')
+
+def expect_yes(value):
+    """Given a boolean value, indicate whether it was true.
+
+    Whilst this sounds like something out of the daily WTF, its purpose is
+    actually slightly saner - it's for the PANIC_OVER_QUESTIONS callbacks.
+    """
+    return value
+
+def expect_no(value):
+    """Given a boolean value, indicate whether it was false.
+
+    Whilst this sounds like something out of the daily WTF, its purpose is
+    actually slightly saner - it's for the PANIC_OVER_QUESTIONS callbacks.
+    """
+    return not value
+
+def killer_sam(value):
+    """If value is True indicating a loosed killer, determine key details on
+    their identity."""
+    if value:
+        killer_is_sam = yn_prompt('Is it Sam?')
+        if killer_is_sam:
+            print "Sam isn't a killer, that's just how he is."
+            return True
+        else:
+            return False
+    return True
+
+def removed_body(value):
+    """If value is True indicating a death, determine whether the body is still
+    festering in the middle of the arena."""
+    if value:
+        return yn_prompt("OK, did they take away the body?")
+    else:
+        return True
+
+PANIC_OVER_QUESTIONS = [('Is the arena on fire?', expect_no),
+                        ('Are you sure?', expect_yes),
+                        ('The arena is on fire, isn\'t it?', expect_no),
+                        ('Is anyone dead?', removed_body),
+                        ('Is there a killer on the loose?', killer_sam),
+                        ('Is everyone still breathing?', expect_yes),
+                        ('Has sanity resumed?', expect_yes)]
+
+@subcommand
+def panic_over():
+    """Cease alarms and panic, after some key sanity checking questions."""
+    for question, callback in PANIC_OVER_QUESTIONS:
+        selection = yn_prompt(question)
+        if not callback(selection):
+            print "Then the panic ain't over."
+            sys.exit(0)
+    panic_over_stall_for_time()
+    send_redis_command('panic-over')
+    print "OK"
+
+def panic_over_stall_for_time():
+    """Configure important configuration. This is not at all to give people an
+    opportunity to control-C after panic-over."""
+    print "Recalibrating flanges..."
+    time.sleep(3)
+    print "Configuring splines..."
+    time.sleep(2)
+    print "Computing bee coefficient..."
+    time.sleep(3)
+    print "Patching quilt..."
+    time.sleep(2)
+    print "Initialising flux capacitor..."
+    time.sleep(3)
+
+@subcommand
+def pause():
+    """Pause competition time."""
+    send_redis_command('pause')
+
+@subcommand
+def unpause():
+    """Resume competition time after a previous pause."""
+    send_redis_command('unpause')
+
+@subcommand
+def start_competition():
+    """Trigger the start of festivities."""
+    send_redis_command('start-competition')
+
+@subcommand
+def tinker():
+    """Switch to tinker time.
+
+    During downtime, this means entry to the arena is permitted so competitors
+    can fiddle with their robots.
+    """
+    send_redis_command('tinker')
+
+@subcommand
+def briefing():
+    """Switch to briefing time.
+
+    During downtime, this means entry to the arena is forbidden.
+    """
+    send_redis_command('briefing')
+
+@subcommand
+def shutdown():
+    """Shut down compd."""
+    # We just shut down the redis server, everything else follows naturally
+    # from that.
+    connection().shutdown()
+
+@subcommand
+def state():
+    """Print out the current overall state of the competition."""
+    redis = connection()
+    gstate = redis.get('comp.state.global')
+    mstate = redis.get('comp.state.match')
+    tstate = redis.get('comp.state.tinker') == 'true'
+    astate = redis.get('comp.state.arena')
+    print 'Global state: {0}'.format(gstate)
+    if gstate == 'MATCH':
+        print ' Match state: {0}'.format(mstate)
+    if gstate == 'DOWNTIME':
+        print 'Tinker state: {0}'.format('TINKER' if tstate else 'BRIEFING')
+    print ' Arena state: {0}'.format(astate)
+
+@subcommand
+def snoop():
+    """Block and print out compd commands as other instances send them.
+
+    Acknowledgements from the controllers handling each command are shown
+    too, with the time the controller took to act on it.
+    """
+    pubsub = connection().pubsub()
+    pubsub.subscribe('comp.command', 'comp.command.ack')
+    for command in pubsub.listen():
+        if command["type"] != "message":
+            continue
+        decoded = json.loads(command["data"])
+        if command["channel"] == 'comp.command.ack':
+            print "\t-> {0} from {1} in {2:.1f}ms".format(
+                    decoded["status"], decoded["controller"],
+                    1000 * decoded["duration"])
+            if decoded["error"]:
+                print "\t   {0}".format(decoded["error"])
+            continue
+        print decoded["command"]
+        del decoded["command"]
+        for argument_key, argument_value in decoded.iteritems():
+            print "\t{0} = {1}".format(argument_key, argument_value)
+
+@subcommand
+def controller_status():
+    """Check the status of the various different compd controllers.
+
+    This in fact listens for the heartbeats and prints out the status
+    information attached.
+    """
+    pubsub = connection().pubsub()
+    pubsub.psubscribe('controller.*.heartbeat')
+    detected_controllers = set()
+    def background():
+        """Block on the heartbeat channels, printing out statuses as they
+        arrive.
+
+        We return when we get a duplicate.
+        """
+        for message in pubsub.listen():
+            controller = message["channel"].split('.')[1]
+            if controller in detected_controllers:
+                break
+            detected_controllers.add(controller)
+            print "{0}: {1}".format(controller, message["data"])
+    if time_out(6, background) and not detected_controllers:
+        print "No controllers online"
+
+def describe_stats(stats, sites = 5):
+    """Lay out the redis statistics a controller reports with its heartbeat.
+
+    >>> print describe_stats({'controller': 'arena', 'uptime': 100.0,
+    ...                       'commands': 30, 'round_trips': 12,
+    ...                       'by_command': {'GET': 20, 'PUBLISH': 10},
+    ...                       'by_site': {'arena.py:80 status_message': 20},
+    ...                       'latency': {'GET': {'count': 20, 'p50': 0.0002,
+    ...                                           'p99': 0.0005, 'max': 0.0009}}})
+    arena: 30 command(s) in 12 round trip(s) over 100s, 0.3/s
+      GET           20
+      PUBLISH       10
+      latency      count     p50ms     p99ms     maxms
+      GET             20      0.20      0.50      0.90
+      arena.py:80 status_message: 20
+    """
+    lines = ['{0}: {1} command(s) in {2} round trip(s) over {3:.0f}s, {4:.1f}/s'.format(
+                 stats['controller'], stats['commands'], stats['round_trips'],
+                 stats['uptime'], stats['commands'] / max(stats['uptime'], 1e-6))]
+    for name, count in sorted(stats['by_command'].items(),
+                              key = lambda item: (-item[1], item[0])):
+        lines.append('  {0:<12} {1:>3}'.format(name, count))
+    lines.append('  {0:<10} {1:>7} {2:>9} {3:>9} {4:>9}'.format(
+                     'latency', 'count', 'p50ms', 'p99ms', 'maxms'))
+    for kind, latency in sorted(stats['latency'].items()):
+        lines.append('  {0:<10} {1:>7} {2:>9.2f} {3:>9.2f} {4:>9.2f}'.format(
+                         kind, latency['count'], latency['p50'] * 1000,
+                         latency['p99'] * 1000, latency['max'] * 1000))
+    for site, count in sorted(stats['by_site'].items(),
+                              key = lambda item: (-item[1], item[0]))[:sites]:
+        lines.append('  {0}: {1}'.format(site, count))
+    return '\n'.join(lines)
+
+@subcommand
+def controller_stats(sites = 5):
+    """Show the redis commands each compd controller has sent, and their
+    latency.
+
+    Like controller-status, this listens for the statistics the controllers
+    send with their heartbeats. The sites most commands came from are shown
+    too.
+    """
+    pubsub = connection().pubsub()
+    pubsub.psubscribe('controller.*.stats')
+    reported = {}
+    def background():
+        """Collect statistics until a controller reports twice."""
+        for message in pubsub.listen():
+            if message["type"] != "pmessage":
+                continue
+            controller = message["channel"].split('.')[1]
+            if controller in reported:
+                break
+            reported[controller] = json.loads(message["data"])
+    time_out(6, background)
+    if not reported:
+        print "No controllers online"
+    for controller in sorted(reported):
+        print describe_stats(reported[controller], int(sites))
@@ -0,0 +1,65 @@
+"""Subcommands for the competition log, which records every command applied
+and every change to the competition."""
+from compdctl_commands import subcommand, connection, yn_prompt
+import time, json
+
+def describe_record(record):
+    """Summarise a log record on one line.
+
+    >>> describe_record({'kind': 'command', 'source': 'state', 'time': 0,
+    ...                  'command': {'command': 'pause', 'request-id': 'x'}})
+    'state: command pause'
+    >>> describe_record({'kind': 'sync', 'source': 'state', 'time': 0,
+    ...                  'real': 100, 'competition': 0})
+    'state: sync competition=0 real=100'
+    """
+    kind = record['kind']
+    if kind == 'command':
+        fields = dict((key, value) for key, value in record['command'].items()
+                          if key not in ('command', 'request-id'))
+        detail = record['command']['command']
+    elif kind == 'snapshot':
+        state = record['state']
+        fields = {}
+        detail = '{0} match(es), {1} team(s)'.format(len(state['matches']),
+                                                     len(state['teams']))
+    else:
+        fields = dict((key, value) for key, value in record.items()
+                          if key not in ('kind', 'source', 'time'))
+        detail = ''
+    parts = [kind, detail] + ['{0}={1}'.format(key, json.dumps(value))
+                                  for key, value in sorted(fields.items())]
+    return '{0}: {1}'.format(record['source'], ' '.join(part for part in parts if part))
+
+@subcommand
+def log_show(count = 20):
+    """Show the latest records in the competition log."""
+    from eventlog import read_records
+    for record in read_records()[-int(count):]:
+        print time.strftime('%H:%M:%S', time.localtime(record['time'])),
+        print describe_record(record)
+
+@subcommand
+def log_replay():
+    """Rebuild the schedule, teams, clock sync table and competition state
+    in redis from the competition log.
+
+    Whatever redis holds for them now is replaced. This is best done by
+    starting compd with --replay, before the controllers are running.
+    """
+    from eventlog import read_records, fold, replay
+    if not yn_prompt('Replace the competition in redis with the log?'):
+        return
+    records = read_records()
+    matches, teams = replay(connection(), fold(records))
+    print "Replayed {0} record(s): {1} match(es), {2} team(s)".format(
+              len(records), matches, teams)
+
+@subcommand
+def log_compact():
+    """Fold the competition log into a snapshot.
+
+    The old log is kept alongside, as competition.log.[time].
+    """
+    from eventlog import EventLog
+    print "Folded {0} record(s)".format(EventLog('compdctl').compact())
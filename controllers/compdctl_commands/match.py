@@ -0,0 +1,293 @@
+"""Subcommands for scheduling matches."""
+from compdctl_commands import subcommand, send_redis_command, parse_time
+from compdctl_commands import connection, parse_times
+import sys, csv, json
+
+@subcommand
+def match_schedule_league(name, start_time, *teams):
+    """Schedule a league match."""
+    send_redis_command('schedule-match', name=name, type='LEAGUE',
+                       start=parse_time(start_time),
+                       teams = [tla.upper() for tla in teams])
+
+@subcommand
+def match_schedule_showmatch(name, start_time, *teams):
+    """Schedule a showmatch."""
+    send_redis_command('schedule-match', name=name, type='SHOWMATCH',
+                       start=parse_time(start_time),
+                       teams = [tla.upper() for tla in teams])
+
+@subcommand
+def match_schedule_knockout(name, start_time, stage):
+    """Schedule a knockout match."""
+    send_redis_command('schedule-match', name=name, type='KNOCKOUT',
+                       start=parse_time(start_time),
+                       stage = int(stage))
+
+@subcommand
+def knockout_generate(start_time, stages = None, prefix = 'K'):
+    """Schedule a knockout, seeded from the league standings.
+
+    The knockout has as many stages as the teams can fill, or stages if
+    fewer. Its matches are named [prefix][stage]-[n], stage 0 being the
+    final, and are scheduled back to back from the start time. The teams of
+    later stages are filled in as the matches feeding them finish.
+    """
+    if stages is not None:
+        send_redis_command('generate-knockout', start=parse_time(start_time),
+                           stages=int(stages), prefix=prefix)
+    else:
+        send_redis_command('generate-knockout', start=parse_time(start_time),
+                           prefix=prefix)
+
+@subcommand
+def knockout_show():
+    """Show the knockout bracket, and who is through so far."""
+    r = connection()
+    feeds = dict((match, json.loads(data))
+                     for match, data in r.hgetall('knockout.feeds').items())
+    matches = set(feeds)
+    for upstream in feeds.values():
+        matches.update(upstream)
+    if not matches:
+        print "No knockout has been scheduled"
+        return
+    matches = sorted(matches)
+    pipe = r.pipeline()
+    for match in matches:
+        pipe.get('match.schedule.{0}.stage'.format(match))
+        pipe.lrange('match.schedule.{0}.teams'.format(match), 0, -1)
+    results = pipe.execute()
+    rows = sorted((-int(stage or 0), match, teams)
+                      for match, stage, teams in zip(matches, results[::2],
+                                                     results[1::2]))
+    for stage, match, teams in rows:
+        line = "stage {0}: {1} {2}".format(-stage, match, ' '.join(teams))
+        if match in feeds:
+            line += " (from {0})".format(', '.join(feeds[match]))
+        print line
+
+@subcommand
+def match_delay(start_time, amount):
+    """Delay the match(es) starting at a given time by some seconds."""
+    send_redis_command('delay-matches', start=parse_time(start_time),
+                       amount=int(amount))
+
+@subcommand
+def match_cancel(name):
+    """Cancel a given match (in the future)."""
+    send_redis_command('cancel-match', name=name)
+
+MATCH_TYPES = ('LEAGUE', 'SHOWMATCH', 'KNOCKOUT')
+
+NUMBER = (int, long, float)
+JSON_TEAM_FIELDS = (('tla', basestring, 'a string'),
+                    ('name', basestring, 'a string'),
+                    ('college', basestring, 'a string'),
+                    ('info', basestring, 'a string'))
+JSON_MATCH_FIELDS = (('name', basestring, 'a string'),
+                     ('type', basestring, 'a string'),
+                     ('start', (basestring,) + NUMBER, 'a string or a number'),
+                     ('stage', (basestring, int, long), 'a string or a number'),
+                     ('teams', list, 'a list of TLAs'))
+
+def json_type_problem(record, fields):
+    """Describe the first of fields that record holds with the wrong type,
+    or return None if they are all absent, null or of the right type.
+
+    >>> json_type_problem({'name': 'L1', 'start': ['10:30']}, JSON_MATCH_FIELDS)
+    'start should be a string or a number'
+    >>> json_type_problem({'name': 'L1', 'teams': ['ABC', 7]}, JSON_MATCH_FIELDS)
+    'teams should be a list of TLAs'
+    >>> json_type_problem('ABC', JSON_TEAM_FIELDS)
+    'expected an object'
+    """
+    if not isinstance(record, dict):
+        return 'expected an object'
+    for field, types, description in fields:
+        value = record.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, types):
+            return '{0} should be {1}'.format(field, description)
+        if isinstance(value, list) and not all(isinstance(item, basestring)
+                                                   for item in value):
+            return '{0} should be {1}'.format(field, description)
+    return None
+
+def read_schedule_json(handle):
+    """Read teams and matches from a JSON schedule file.
+
+    The file holds an object with a list of teams under 'teams' and a list of
+    matches under 'matches'; both are optional. Each record is tagged with
+    where it came from, for error messages. As for read_schedule_csv, records
+    which cannot be read are returned among the teams, marked as malformed
+    and with the reason why.
+
+    >>> from StringIO import StringIO
+    >>> teams, matches = read_schedule_json(StringIO('{"teams": [{"tla": "abc", "name": "Alpha"}]}'))
+    >>> teams[0]['tla'], teams[0]['where'], matches
+    (u'ABC', 'team 1', [])
+    >>> teams, matches = read_schedule_json(StringIO('{"matches": [{"name": "L1", "teams": "ABC"}]}'))
+    >>> teams[0]['where'], teams[0]['reason'], matches
+    ('match 1', 'teams should be a list of TLAs', [])
+    """
+    data = json.load(handle)
+    if not isinstance(data, dict):
+        return [{'where': 'file', 'malformed': data,
+                 'reason': 'expected an object'}], []
+    teams, matches = [], []
+    for section in ('teams', 'matches'):
+        if not isinstance(data.get(section, []), list):
+            teams.append({'where': 'file', 'malformed': data[section],
+                          'reason': '{0} should be a list'.format(section)})
+            data[section] = []
+    for number, team in enumerate(data.get('teams', []), 1):
+        where = 'team {0}'.format(number)
+        reason = json_type_problem(team, JSON_TEAM_FIELDS)
+        if reason is not None:
+            teams.append({'where': where, 'malformed': team, 'reason': reason})
+            continue
+        team = dict(team)
+        team['tla'] = (team.get('tla') or '').upper()
+        team['where'] = where
+        teams.append(team)
+    for number, match in enumerate(data.get('matches', []), 1):
+        where = 'match {0}'.format(number)
+        reason = json_type_problem(match, JSON_MATCH_FIELDS)
+        if reason is not None:
+            teams.append({'where': where, 'malformed': match, 'reason': reason})
+            continue
+        match = dict(match)
+        match['type'] = (match.get('type') or 'LEAGUE').upper()
+        match['teams'] = [tla.upper() for tla in match.get('teams') or []]
+        match['where'] = where
+        matches.append(match)
+    return teams, matches
+
+def read_schedule_csv(handle):
+    """Read teams and matches from a CSV schedule file.
+
+    Each row is either a team or a match, according to its first column:
+
+        team,TLA,name[,college]
+        match,name,type,start[,TLA...]
+        match,name,KNOCKOUT,start,stage
+
+    Blank rows and rows whose first column starts with # are ignored.
+
+    >>> teams, matches = read_schedule_csv(['team,abc,Alpha', '', 'match,L1,league,10:30,abc,def'])
+    >>> teams[0]['tla'], teams[0]['college'], teams[0]['where']
+    ('ABC', None, 'line 1')
+    >>> matches[0]['type'], matches[0]['start'], matches[0]['teams']
+    ('LEAGUE', '10:30', ['ABC', 'DEF'])
+    """
+    teams, matches = [], []
+    for number, row in enumerate(csv.reader(handle), 1):
+        if not row or not row[0].strip() or row[0].startswith('#'):
+            continue
+        where = 'line {0}'.format(number)
+        kind = row[0].strip().lower()
+        fields = [field.strip() for field in row[1:]]
+        if kind == 'team' and len(fields) in (2, 3):
+            teams.append({'tla': fields[0].upper(), 'name': fields[1],
+                          'college': fields[2] if len(fields) > 2 else None,
+                          'where': where})
+        elif kind == 'match' and len(fields) >= 3:
+            match = {'name': fields[0], 'type': fields[1].upper(),
+                     'start': fields[2], 'where': where}
+            if match['type'] == 'KNOCKOUT':
+                match['stage'] = fields[3] if len(fields) > 3 else None
+            else:
+                match['teams'] = [tla.upper() for tla in fields[3:]]
+            matches.append(match)
+        else:
+            teams.append({'where': where, 'malformed': row})
+    return teams, matches
+
+def validate_schedule(teams, matches, known_teams):
+    """Check a set of teams and matches for import, returning a list of
+    problems found.
+
+    Matches may only refer to teams in the import or in known_teams. Match
+    start times are expected to have already been parsed. Malformed records
+    are reported with their reason, if the reader gave one.
+
+    >>> validate_schedule([{'tla': 'ABC', 'name': 'Alpha', 'where': 'line 1'}],
+    ...                   [{'name': 'L1', 'type': 'LEAGUE', 'start': 0,
+    ...                     'teams': ['ABC', 'XYZ'], 'where': 'line 2'},
+    ...                    {'name': 'L1', 'type': 'FRIENDLY', 'start': 0,
+    ...                     'where': 'line 3'}], set())
+    ['line 2: unknown team XYZ', 'line 3: duplicate match L1', 'line 3: unknown match type FRIENDLY']
+    """
+    problems = []
+    tlas = set(known_teams)
+    for team in teams:
+        if 'malformed' in team:
+            problems.append('{0}: {1}'.format(team['where'],
+                                              team.get('reason', 'unrecognised row')))
+        elif len(team['tla']) != 3 or not team.get('name'):
+            problems.append('{0}: teams need a three-letter TLA and a name'.format(team['where']))
+        elif team['tla'] in tlas:
+            problems.append('{0}: duplicate team {1}'.format(team['where'], team['tla']))
+        else:
+            tlas.add(team['tla'])
+    names = set()
+    for match in matches:
+        if not match.get('name'):
+            problems.append('{0}: matches need a name'.format(match['where']))
+        elif match['name'] in names:
+            problems.append('{0}: duplicate match {1}'.format(match['where'], match['name']))
+        names.add(match.get('name'))
+        if match['type'] not in MATCH_TYPES:
+            problems.append('{0}: unknown match type {1}'.format(match['where'], match['type']))
+        elif match['type'] == 'KNOCKOUT' and match.get('stage') is None:
+            problems.append('{0}: knockout matches need a stage'.format(match['where']))
+        if match.get('start') is None:
+            problems.append('{0}: could not parse start time'.format(match['where']))
+        for tla in match.get('teams', []):
+            if tla not in tlas:
+                problems.append('{0}: unknown team {1}'.format(match['where'], tla))
+    return problems
+
+@subcommand
+def import_schedule(filename):
+    """Import teams and matches in bulk from a file.
+
+    Files ending in .json are read as JSON, anything else as CSV; see
+    read_schedule_json and read_schedule_csv for the formats. Start times are
+    parsed as for the other scheduling commands, all relative to the time the
+    import is run.
+
+    The whole file is checked before anything is sent, and is then sent to
+    compd as a single command, which writes it to the schedule in one go.
+
+    Unlike match-schedule-*, which delay the matches already scheduled to
+    make room for the new one, importing never moves an existing match: an
+    imported match which would overlap one already scheduled, or one earlier
+    in the file, is pushed back until it fits.
+    """
+    with open(filename) as handle:
+        if filename.lower().endswith('.json'):
+            teams, matches = read_schedule_json(handle)
+        else:
+            teams, matches = read_schedule_csv(handle)
+    starts = parse_times([unicode(match.get('start', '')) for match in matches])
+    for match, start in zip(matches, starts):
+        match['start'] = start
+        if match.get('stage') is not None:
+            try:
+                match['stage'] = int(match['stage'])
+            except ValueError:
+                match['stage'] = None
+    known_teams = set(key.split('.')[1]
+                          for key in connection().keys('teams.*.name'))
+    problems = validate_schedule(teams, matches, known_teams)
+    if problems:
+        for problem in problems:
+            print problem
+        sys.exit(1)
+    for record in teams + matches:
+        del record['where']
+    send_redis_command('import-schedule', teams=teams, matches=matches)
+    print 'sent {0} team(s) and {1} match(es)'.format(len(teams), len(matches))
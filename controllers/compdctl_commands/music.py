@@ -0,0 +1,108 @@
+"""Subcommands for music playback and sound effects."""
+from compdctl_commands import subcommand, send_redis_command, connection
+from compdctl_commands import parse_location, parse_time_bound
+import time
+
+@subcommand
+def music_play(uri):
+    """Play music directly by URI.
+
+    This will stop the currently playing track, if any, rather than playing
+    over the top.
+
+    """
+    send_redis_command('music-play', uri=parse_location(uri))
+
+@subcommand
+def music_stop():
+    """Stop the currently playing music.
+
+    If there is no music playing, this command has no effect.
+
+    """
+    send_redis_command('music-stop')
+
+@subcommand
+def music_next():
+    """Advance to the next track in the current playlist."""
+    send_redis_command('music-next')
+
+@subcommand
+def music_add(uri, *playlists):
+    """Add a track to one or more playlists.
+
+    If no playlists are specified, the playlists 'match' and 'downtime' are
+    assumed.
+
+    """
+    if not playlists:
+        playlists = ['default']
+    for playlist in playlists:
+        send_redis_command('music-add', playlist=playlist,
+                           uri=parse_location(uri))
+
+@subcommand
+def music_del(uri, *playlists):
+    """Remove a track from one or more playlists.
+
+    If no playlists are specified, the playlists 'match' and 'downtime' are
+    assumed.
+
+    """
+    if not playlists:
+        playlists = ['default']
+    for playlist in playlists:
+        send_redis_command('music-del', playlist=playlist,
+                           uri=parse_location(uri))
+
+@subcommand
+def music_playlist(playlist):
+    """Select a playlist for music playback.
+
+    The special playlist 'auto' will resolve to either 'match' or 'downtime'
+    depending on the state at time of play.
+
+    """
+    send_redis_command('music-playlist', playlist=playlist)
+
+MUSIC_HISTORY_PAGE_SIZE = 25
+
+@subcommand
+def music_history(since = None, until = None, page = 1):
+    """Get the music history.
+
+    Only tracks started between since and until are listed; either may be
+    given as '-' to leave that end of the range open. Tracks are shown oldest
+    first, a page at a time.
+
+    """
+    redis = connection()
+    minimum = parse_time_bound(since, '-inf')
+    maximum = parse_time_bound(until, '+inf')
+    page = int(page)
+    tracks = redis.zrangebyscore('music.history', minimum, maximum,
+                                 start = (page - 1) * MUSIC_HISTORY_PAGE_SIZE,
+                                 num = MUSIC_HISTORY_PAGE_SIZE)
+    if not tracks:
+        return
+    entries = [track.split(' ', 1) for track in tracks]
+    descriptions = redis.hmget('music.descriptions',
+                               [uri for _, uri in entries])
+    for (start_time, uri), desc in zip(entries, descriptions):
+        time_string = time.strftime('%A %H:%M',
+                                    time.localtime(float(start_time)))
+        if not desc:
+            desc = uri
+        print time_string, desc
+    if len(tracks) == MUSIC_HISTORY_PAGE_SIZE:
+        print '(more on page {0})'.format(page + 1)
+
+@subcommand
+def music_history_retention(seconds):
+    """Set how long, in seconds, tracks are kept in the music history."""
+    send_redis_command('music-history-retention', seconds=int(seconds))
+
+@subcommand
+def sound_effect(effect):
+    """Play a sound effect."""
+    send_redis_command('sound-effect', effect=effect)
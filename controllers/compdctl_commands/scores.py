@@ -0,0 +1,55 @@
+"""Subcommands for scoring matches, and for the league table."""
+from compdctl_commands import subcommand, send_redis_command, connection
+
+@subcommand
+def score_add(zone, points, match = None):
+    """Add points to the score of the team in a zone.
+
+    The points may be negative, to correct a mistake. By default they are
+    added in the current match.
+    """
+    if match is not None:
+        send_redis_command('score-add', zone=int(zone), points=int(points),
+                           match=match)
+    else:
+        send_redis_command('score-add', zone=int(zone), points=int(points))
+
+@subcommand
+def score_show(match = None):
+    """Show the scores of a match, by default the current one."""
+    r = connection()
+    if match is None:
+        match = r.get('match.current')
+        if match is None:
+            print "No match is in progress"
+            return
+    pipe = r.pipeline()
+    pipe.hgetall('match.schedule.{0}.scores'.format(match))
+    pipe.lrange('match.schedule.{0}.teams'.format(match), 0, -1)
+    fields, teams = pipe.execute()
+    if not fields:
+        print "Match {0} has not been scored".format(match)
+        return
+    for zone, team in enumerate(teams):
+        print "zone {0}: {1} {2}".format(zone, team, fields.get(str(zone), 0))
+
+@subcommand
+def league():
+    """Show the league standings."""
+    from league import read_standings
+    standings = read_standings(connection())
+    if not standings:
+        print "No league matches have been scored"
+        return
+    for position, (tla, league_points, game_points) in enumerate(standings):
+        print "{0:>3}. {1} {2:>4} {3:>6}".format(position + 1, tla,
+                                                league_points, game_points)
+
+@subcommand
+def league_rebuild():
+    """Recompute the league standings from the scores of every match.
+
+    The standings are kept up to date as matches finish, so this is only
+    needed if scores have been changed by hand.
+    """
+    send_redis_command('league-rebuild')
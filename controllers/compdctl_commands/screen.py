@@ -0,0 +1,51 @@
+"""Subcommands for controlling the screens."""
+from compdctl_commands import subcommand, send_redis_command
+import time
+
+@subcommand
+def screen_redraw():
+    """Command all screens to immediately redraw."""
+    send_redis_command('screen-redraw')
+
+@subcommand
+def screen_flash(screen_id):
+    """Flash a given screen."""
+    send_redis_command('screen-override', id=int(screen_id), message='<h1 style="color: #990000;">{0}</h1>'.format(screen_id))
+    time.sleep(2.5)
+    send_redis_command('screen-restore', id=int(screen_id))
+
+@subcommand
+def screen_add(screen_id, flavour, zone = None):
+    """Add a screen of a given flavour.
+
+    Supported flavours are blank, judge, match-info, layout, zone and clock.
+
+    The 'zone' flavour requires an additional parameter indicating the zone
+    of the arena to which the screen is attached.
+    """
+    flavour = flavour.upper()
+    if zone is not None:
+        send_redis_command('screen-add', id=int(screen_id), flavour=flavour,
+                           zone=zone)
+    else:
+        send_redis_command('screen-add', id=int(screen_id), flavour=flavour)
+
+@subcommand
+def screen_del(screen_id):
+    """Remove a screen."""
+    send_redis_command('screen-del', id=int(screen_id))
+
+@subcommand
+def screen_override(screen_id):
+    """Override a screen's display.
+
+    This takes a block of HTML on the standard input with which to override the
+    screen's output.
+    """
+    message = sys.stdin.read()
+    send_redis_command('screen-override', id=int(screen_id), message=message)
+
+@subcommand
+def screen_restore(screen_id):
+    """Restore a screen's content after an override."""
+    send_redis_command('screen-restore', id=int(screen_id))
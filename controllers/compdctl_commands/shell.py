@@ -0,0 +1,124 @@
+"""Subcommands for running many other subcommands from a single compdctl
+process, so that the interpreter start-up, imports and redis connection are
+only paid for once."""
+from compdctl_commands import SUBCOMMANDS, subcommand, load_command
+from compdctl_commands import load_all_commands, is_connection_error
+from compdctl_commands import pipeline_commands, wait_for_acknowledgements
+from compdctl_commands import COMMAND_LATENCIES
+import sys, os, shlex
+
+SHELL_HISTORY_FILE = os.path.expanduser('~/.compdctl_history')
+SHELL_HISTORY_LENGTH = 1000
+
+def run_line(line):
+    """Run a single line of input as a subcommand and its arguments.
+
+    Blank lines and lines starting with # are ignored. Returns whether the
+    line was run successfully; errors are printed rather than raised.
+
+    >>> run_line('   # a comment')
+    True
+    >>> run_line('no-such-command')
+    no such command: no-such-command
+    False
+    """
+    try:
+        words = shlex.split(line, comments = True)
+    except ValueError as exception:
+        print "could not parse line: {0}".format(exception)
+        return False
+    if not words:
+        return True
+    command, args = words[0], words[1:]
+    try:
+        handler = load_command(command)
+    except KeyError:
+        print "no such command: {0}".format(command)
+        return False
+    try:
+        handler(*args) # pylint: disable=W0142
+    except SystemExit as exit_request:
+        return not exit_request.code
+    except Exception as exception:
+        if is_connection_error(exception):
+            print "compd is down"
+        else:
+            print "error in {0}: {1}".format(command, exception)
+        return False
+    return True
+
+def complete_command(text, state):
+    """readline completion function over the subcommand names."""
+    matches = sorted(command for command in SUBCOMMANDS
+                         if command.startswith(text))
+    return matches[state] if state < len(matches) else None
+
+@subcommand
+def shell():
+    """Run an interactive compdctl shell.
+
+    Each line is a subcommand followed by its arguments, quoted as in the
+    system shell. Subcommand names are tab-completed and history is kept
+    between sessions.
+    """
+    load_all_commands()
+    try:
+        import readline
+    except ImportError:
+        readline = None
+    if readline is not None:
+        readline.set_completer(complete_command)
+        readline.set_completer_delims(' ')
+        readline.parse_and_bind('tab: complete')
+        readline.set_history_length(SHELL_HISTORY_LENGTH)
+        if os.path.exists(SHELL_HISTORY_FILE):
+            readline.read_history_file(SHELL_HISTORY_FILE)
+    try:
+        while True:
+            try:
+                line = raw_input('compd> ')
+            except EOFError:
+                print
+                break
+            except KeyboardInterrupt:
+                print
+                continue
+            if line.strip() in ('exit', 'quit'):
+                break
+            try:
+                run_line(line)
+            except KeyboardInterrupt:
+                print
+    finally:
+        if readline is not None:
+            readline.write_history_file(SHELL_HISTORY_FILE)
+
+@subcommand
+def batch():
+    """Run subcommands read, one per line, from the standard input.
+
+    Lines are as for the shell; blank lines and comments are ignored. Every
+    line is run even if earlier ones fail, but the exit status reflects any
+    failures. Subcommands which themselves read the standard input cannot be
+    used in a batch.
+
+    Commands are sent without waiting for each to be acknowledged; once they
+    have all been sent, the acknowledgements are collected and the end-to-end
+    command latency is reported.
+    """
+    failures = 0
+    pipeline_commands()
+    for number, line in enumerate(sys.stdin, 1):
+        if not run_line(line):
+            print "(line {0} failed)".format(number)
+            failures += 1
+    for command, problem in wait_for_acknowledgements():
+        print "{0}: {1}".format(command, problem)
+        failures += 1
+    if COMMAND_LATENCIES:
+        print "{0} command(s) acknowledged, latency mean {1:.1f}ms, max {2:.1f}ms".format(
+                len(COMMAND_LATENCIES),
+                1000 * sum(COMMAND_LATENCIES) / len(COMMAND_LATENCIES),
+                1000 * max(COMMAND_LATENCIES))
+    if failures:
+        sys.exit(1)
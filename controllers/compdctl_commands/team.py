@@ -0,0 +1,105 @@
+"""Subcommands for managing the team roster."""
+from compdctl_commands import subcommand, send_redis_command, connection
+import sys
+
+@subcommand
+def team_add(tla, name, college = None):
+    """Add a team to the roster.
+
+    If the college is not specified, we assume that the college and name are
+    one and the same.
+    """
+    tla = tla.upper()
+    if college:
+        send_redis_command('add-team', tla=tla, name=name, college=college)
+    else:
+        send_redis_command('add-team', tla=tla, name=name)
+
+@subcommand
+def team_del(tla):
+    """Remove a team from the roster."""
+    tla = tla.upper()
+    send_redis_command('remove_team', tla=tla)
+
+@subcommand
+def team_set_name(tla, name):
+    """Set a team's name.
+
+    This is the name which the team themselves select rather than the name of
+    the college to which they are attached.
+    """
+    tla = tla.upper()
+    send_redis_command('update-team', tla=tla, name=name)
+
+@subcommand
+def team_set_college(tla, college):
+    """Set a team's college."""
+    tla = tla.upper()
+    send_redis_command('update-team', tla=tla, college=college)
+
+@subcommand
+def team_set_info(tla):
+    """Set a team's 'info' block.
+
+    This block of information contains a team's own written biography and
+    information.
+    """
+    tla = tla.upper()
+    send_redis_command('update-team', tla=tla, info=sys.stdin.read())
+
+@subcommand
+def team_set_notes(tla):
+    """Set a team's 'notes' block.
+
+    This block is for Blueshirt use to store interesting facts and/or relevant
+    history about a team.
+    """
+    tla = tla.upper()
+    send_redis_command('update-team', tla=tla, notes=sys.stdin.read())
+
+@subcommand
+def team_disqualify(tla):
+    """Mark a team as disqualified.
+
+    This does not necessary mean due to any kind of misbehaviour, just that
+    they should not be included in the league table and should not be scheduled
+    for knockout or league matches.
+    """
+    tla = tla.upper()
+    send_redis_command('update-team', tla=tla, disqualified=True)
+
+@subcommand
+def team_undisqualify(tla):
+    """Remove the disqualification status on a team."""
+    tla = tla.upper()
+    send_redis_command('update-team', tla=tla, disqualified=False)
+
+@subcommand
+def team_get(tla):
+    """Print out all the relevant information on a team."""
+    redis = connection()
+    tla = tla.upper()
+    name = redis.get('teams.{0}.name'.format(tla))
+    info = redis.get('teams.{0}.info'.format(tla))
+    notes = redis.get('teams.{0}.notes'.format(tla))
+    disqualified = redis.get('teams.{0}.disqualified'.format(tla)) == 'true'
+    college = redis.get('teams.{0}.college'.format(tla))
+    print '{0}: {1}'.format(tla, name)
+    if college:
+        print college
+    if disqualified:
+        print '** DISQUALIFIED **'
+    if info.strip():
+        print ' --- INFO ---'
+        print info.strip()
+    if notes.strip():
+        print ' --- NOTES ---'
+        print notes.strip()
+
+@subcommand
+def team_list():
+    """Give a list of teams, by TLA and name."""
+    redis = connection()
+    keys = redis.keys('teams.*.name')
+    for key in keys:
+        print '{0}: {1}'.format(key.split('.')[1], redis.get(key))
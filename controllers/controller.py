@@ -1,5 +1,7 @@
-import redis, json, threading, time
-from twisted.internet import reactor, task
+import redis, json, threading, time, fnmatch, os, sys
+from collections import defaultdict
+from twisted.internet import reactor, task, defer
+from eventlog import EventLog
 
 ENTER_TIME = 90
 BOOT_TIME = 60
@@ -10,33 +12,297 @@ FULL_MATCH_INTERVAL = ENTER_TIME + BOOT_TIME + LIVE_TIME + SETTLE_TIME
 PRE_START_INTERVAL = ENTER_TIME + BOOT_TIME
 POST_START_INTERVAL = LIVE_TIME + SETTLE_TIME
 
-class Controller(object):
+REDIS_PROBE_INTERVAL = 0.05
+REDIS_PROBE_TIMEOUT = 30
+
+# the working set a controller needs to recover its state on start; keys
+# matching SNAPSHOT_LISTS hold lists, the rest hold strings
+SNAPSHOT_PATTERNS = ('match.schedule.*', 'match.current', 'comp.state.*',
+                     'comp.pause', 'comp.sync', 'teams.*', 'screens.*')
+SNAPSHOT_LISTS = ('match.schedule.*.teams', 'comp.sync')
+
+# a sorted set of every scheduled match, scored by its start time
+MATCH_INDEX = 'match.index'
+
+# the upper bounds, in seconds, of the buckets of the redis latency
+# histograms; slower round trips go in one last bucket
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# the number of call sites reported with the redis statistics
+REPORTED_SITES = 20
+
+REDIS_PATH = os.path.dirname(os.path.abspath(redis.__file__))
+
+def scores_key(match):
+    return 'match.schedule.{0}.scores'.format(match)
+
+def decode_scores(fields, team_count):
+    """Turn the fields of a match's score hash into (seq, [score per zone])."""
+    seq = int(fields.get('seq', 0))
+    return seq, [int(fields.get(str(zone), 0)) for zone in xrange(team_count)]
+
+class RedisNotReady(Exception):
+    pass
+
+def redis_ready(r):
+    """Whether the redis server is up and accepting commands; it refuses
+    them while it is still loading its dump."""
+    try:
+        return r.ping()
+    except redis.RedisError:
+        return False
+
+def when_redis_ready(r = None, interval = REDIS_PROBE_INTERVAL,
+                     timeout = REDIS_PROBE_TIMEOUT):
+    """Probe redis every interval seconds until it answers a PING. Returns a
+    Deferred which fires once it does, or fails with RedisNotReady if it has
+    not after timeout seconds."""
+    if r is None:
+        r = redis.StrictRedis()
+    deadline = time.time() + timeout
+    ready = defer.Deferred()
+    def probe():
+        if redis_ready(r):
+            ready.callback(r)
+        elif time.time() > deadline:
+            ready.errback(RedisNotReady('redis not ready after {0}s'.format(timeout)))
+        else:
+            reactor.callLater(interval, probe)
+    probe()
+    return ready
+
+class LatencyHistogram(object):
+    """Round trip times, counted into the buckets of LATENCY_BUCKETS."""
     def __init__(self):
-        self.r = redis.StrictRedis()
-        def ps_thread():
-            ps = self.r.pubsub()
-            self._register_subscriptions(ps)
-            ps.subscribe('comp.command')
-            for message in ps.listen():
-                channel, data = message['channel'], message['data']
-                reactor.callFromThread(self._handle_channel_message, channel, data)
-            ps.reset()
-        thread_ps = threading.Thread(target = ps_thread)
-        thread_ps.name = "{0} pub/sub thread".format(self.__class__.__name__)
-        thread_ps.daemon = True
-        thread_ps.start()
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """The upper bound of the bucket holding the given fraction of round
+        trips, or the slowest round trip if that is sooner."""
+        wanted = fraction * self.total
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.total,
+                'p50': self.percentile(0.5),
+                'p99': self.percentile(0.99),
+                'max': self.max,
+                'histogram': self.counts}
+
+class RedisStats(object):
+    """The commands a connection has sent to redis, by name and by the line
+    of the controllers which sent them, and the latency of its round trips:
+    a command sent alone, or a whole pipeline."""
+    def __init__(self):
+        self.started = time.time()
+        self.commands = defaultdict(int)
+        self.sites = defaultdict(int)
+        self.latency = defaultdict(LatencyHistogram)
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def call_site():
+        """Where the controllers sent the command from, skipping the frames
+        of redis-py and of the instrumentation."""
+        frame = sys._getframe(2)
+        while frame.f_back is not None and frame.f_code.co_filename.startswith(REDIS_PATH):
+            frame = frame.f_back
+        return '{0}:{1} {2}'.format(os.path.basename(frame.f_code.co_filename),
+                                    frame.f_lineno, frame.f_code.co_name)
+
+    def record(self, names, kind, site, seconds):
+        with self._lock:
+            for name in names:
+                self.commands[name] += 1
+            self.sites[site] += len(names)
+            self.latency[kind].add(seconds)
+            self.round_trips += 1
+
+    def summary(self):
+        """A line on the commands sent and their latency, for the heartbeat."""
+        with self._lock:
+            total = sum(self.commands.values())
+            elapsed = max(time.time() - self.started, 1e-6)
+            slowest = max([histogram.percentile(0.99)
+                               for histogram in self.latency.values()] or [0.0])
+        return 'redis {0} command(s) in {1} round trip(s), {2:.1f}/s, p99 {3:.1f}ms'.format(
+                   total, self.round_trips, total / elapsed, slowest * 1000)
+
+    def as_dict(self):
+        with self._lock:
+            sites = sorted(self.sites.items(), key = lambda item: -item[1])
+            return {'uptime': time.time() - self.started,
+                    'commands': sum(self.commands.values()),
+                    'round_trips': self.round_trips,
+                    'by_command': dict(self.commands),
+                    'by_site': dict(sites[:REPORTED_SITES]),
+                    'latency': dict((kind, histogram.as_dict())
+                                        for kind, histogram in self.latency.items()),
+                    'buckets': LATENCY_BUCKETS}
+
+class InstrumentedPipeline(redis.client.StrictPipeline):
+    """A pipeline which records its commands in the stats of the connection
+    it came from, as one round trip."""
+    stats = None
+
+    def execute(self, raise_on_error = True):
+        names = [args[0] for args, _ in self.command_stack]
+        if not names:
+            return redis.client.StrictPipeline.execute(self, raise_on_error)
+        kind = 'MULTI' if self.transaction else 'PIPELINE'
+        site = self.stats.call_site()
+        start = time.time()
+        try:
+            return redis.client.StrictPipeline.execute(self, raise_on_error)
+        finally:
+            self.stats.record(names, kind, site, time.time() - start)
+
+class InstrumentedRedis(redis.StrictRedis):
+    """A connection which keeps RedisStats on the commands it sends."""
+    def __init__(self, *args, **kwargs):
+        redis.StrictRedis.__init__(self, *args, **kwargs)
+        self.stats = RedisStats()
+
+    def execute_command(self, *args, **options):
+        site = self.stats.call_site()
+        start = time.time()
+        try:
+            return redis.StrictRedis.execute_command(self, *args, **options)
+        finally:
+            self.stats.record([args[0]], args[0], site, time.time() - start)
+
+    def pipeline(self, transaction = True, shard_hint = None):
+        pipe = InstrumentedPipeline(self.connection_pool, self.response_callbacks,
+                                    transaction, shard_hint)
+        pipe.stats = self.stats
+        return pipe
+
+class Snapshot(object):
+    """A copy of the working set, read from redis in two pipelined round
+    trips: one to list the keys, and one transaction to read them all.
+
+    It answers the read-only subset of the redis API which the controllers
+    use, so it can stand in for the connection while they recover."""
+    def __init__(self, r):
+        pipe = r.pipeline(transaction = False)
+        for pattern in SNAPSHOT_PATTERNS:
+            pipe.keys(pattern)
+        keys = set()
+        for matched in pipe.execute():
+            keys.update(matched)
+        lists = sorted(key for key in keys if self._is_list(key))
+        strings = sorted(keys.difference(lists))
+        pipe = r.pipeline()
+        for key in lists:
+            pipe.lrange(key, 0, -1)
+        if strings:
+            pipe.mget(strings)
+        results = pipe.execute()
+        self._lists = dict((key, items)
+                               for key, items in zip(lists, results)
+                               if items)
+        values = results[len(lists)] if strings else []
+        self._strings = dict((key, value)
+                                 for key, value in zip(strings, values)
+                                 if value is not None)
+
+    @staticmethod
+    def _is_list(key):
+        return any(fnmatch.fnmatchcase(key, pattern)
+                       for pattern in SNAPSHOT_LISTS)
+
+    def keys(self, pattern = '*'):
+        return [key for key in self._strings.keys() + self._lists.keys()
+                    if fnmatch.fnmatchcase(key, pattern)]
+
+    def get(self, key):
+        return self._strings.get(key)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def lrange(self, key, start, end):
+        items = self._lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def lindex(self, key, index):
+        try:
+            return self._lists.get(key, [])[index]
+        except IndexError:
+            return None
+
+    def llen(self, key):
+        return len(self._lists.get(key, []))
+
+class Controller(object):
+    # whether this controller records the commands it applies in the log;
+    # where several handle the same commands, only one of them does
+    logs_commands = True
+
+    def __init__(self, clock = None, r = None, log = None, subscribe = True):
+        # the clock, connection and log can be replaced, to simulate a
+        # competition; the simulation then delivers the messages itself
+        self.clock = reactor if clock is None else clock
+        self.r = InstrumentedRedis() if r is None else r
+        self.log = EventLog(self.name, background = True) if log is None else log
+        if subscribe:
+            def ps_thread():
+                ps = self.r.pubsub()
+                self.subscribe(ps)
+                for message in ps.listen():
+                    channel, data = message['channel'], message['data']
+                    reactor.callFromThread(self._handle_channel_message, channel, data)
+                ps.reset()
+            thread_ps = threading.Thread(target = ps_thread)
+            thread_ps.name = "{0} pub/sub thread".format(self.__class__.__name__)
+            thread_ps.daemon = True
+            thread_ps.start()
         self.configure()
-        heartbeat_task = task.LoopingCall(self._transmit_heartbeat)
-        heartbeat_task.start(4.0)
+        self.looping_call(4.0, self._transmit_heartbeat)
+
+    def subscribe(self, ps):
+        """Subscribe a pub/sub connection to every channel this controller
+        handles."""
+        self._register_subscriptions(ps)
+        ps.subscribe('comp.command')
+
+    def looping_call(self, interval, function, now = True):
+        call = task.LoopingCall(function)
+        call.clock = self.clock
+        call.start(interval, now = now)
+        return call
 
     def _register_subscriptions(self, pubsub):
         pass
 
-    def match_at_competition_time(self, ct):
-        keys = self.r.keys('match.schedule.*.start')
+    def load_snapshot(self):
+        return Snapshot(self.r)
+
+    def match_at_competition_time(self, ct, source = None):
+        if source is None:
+            source = self.r
+        # in order, as KEYS returns them in an order which differs between
+        # redis servers
+        keys = sorted(source.keys('match.schedule.*.start'))
         for key in keys:
             match_id = key.split('.')[2]
-            start = int(self.r.get(key))
+            start = int(source.get(key))
             offset = ct - start
             if offset >= -PRE_START_INTERVAL and offset < POST_START_INTERVAL:
                 # this is the match
@@ -70,10 +336,17 @@ class Controller(object):
     def _handle_channel_message(self, channel, data):
         if channel == 'comp.command':
             command_data = json.loads(data)
+            received = time.time()
             try:
-                self.command(command_data["command"], command_data)
+                handled = self.command(command_data["command"], command_data)
+                error = None
             except Exception as e:
                 print "error handling command {0}:".format(command_data["command"]), e
+                handled, error = True, str(e)
+            if handled:
+                if error is None and self.logs_commands:
+                    self.log.append('command', command = command_data)
+                self._acknowledge_command(command_data, received, error)
         elif channel == 'comp.heartbeat':
             try:
                 self.receive_heartbeat(*map(int, data.split(' ')))
@@ -92,35 +365,68 @@ class Controller(object):
         pass
 
     def _transmit_heartbeat(self):
-        self.r.publish('controller.{0}.heartbeat'.format(self.name),
-                       self.status_message())
+        # the full redis statistics go out alongside the heartbeat, on
+        # controller.[name].stats
+        status = self.status_message()
+        pipe = self.r.pipeline(transaction = False)
+        pipe.publish('controller.{0}.heartbeat'.format(self.name),
+                     '{0}; {1}'.format(status, self.r.stats.summary()))
+        pipe.publish('controller.{0}.stats'.format(self.name),
+                     json.dumps(dict(self.r.stats.as_dict(), controller = self.name)))
+        pipe.execute()
 
     def status_message(self):
         return 'running'
 
     def command(self, command, data):
         method_name = "command_{0}".format(command.replace('-', '_'))
-        try:
-            method = getattr(self, method_name)
-            import inspect
-            args = inspect.getargspec(method).args
-            kwdict = {}
-            for arg in args[1:]:
-                if arg.replace("_", "-") in data:
-                    kwdict[arg] = data[arg.replace("_", "-")]
-            method(**kwdict)
-        except AttributeError:
-            pass
-
-    def real_time_to_competition_time(self, rt):
-        real, comp = map(int, self.r.lindex('comp.sync', -1).split(' '))
+        method = getattr(self, method_name, None)
+        if method is None:
+            return False
+        import inspect
+        args = inspect.getargspec(method).args
+        kwdict = {}
+        for arg in args[1:]:
+            if arg.replace("_", "-") in data:
+                kwdict[arg] = data[arg.replace("_", "-")]
+        method(**kwdict)
+        return True
+
+    def _acknowledge_command(self, command_data, received, error = None):
+        # commands sent by compdctl carry a request ID, and it waits for the
+        # controller which handled the command to acknowledge it
+        if 'request-id' not in command_data:
+            return
+        self.r.publish('comp.command.ack',
+                       json.dumps({'request-id': command_data['request-id'],
+                                   'command': command_data['command'],
+                                   'controller': self.name,
+                                   'status': 'ok' if error is None else 'error',
+                                   'error': error,
+                                   'received': received,
+                                   'duration': time.time() - received}))
+
+    def real_time_to_competition_time(self, rt, source = None):
+        if source is None:
+            source = self.r
+        real, comp = map(int, source.lindex('comp.sync', -1).split(' '))
         offset = rt - real
         return comp + offset
 
-    def competition_time_to_real_time(self, ct):
-        length = self.r.llen('comp.sync')
+    def competition_time_at(self, rt, source = None):
+        if source is None:
+            source = self.r
+        pause_time = source.get('comp.pause')
+        if pause_time is not None:
+            return int(pause_time)
+        return self.real_time_to_competition_time(rt, source)
+
+    def competition_time_to_real_time(self, ct, source = None):
+        if source is None:
+            source = self.r
+        length = source.llen('comp.sync')
         for i in xrange(1, length + 1):
-            real, comp = map(int, self.r.lindex('comp.sync', -i).split(' '))
+            real, comp = map(int, source.lindex('comp.sync', -i).split(' '))
             if comp < ct:
                 offset = ct - comp
                 return real + offset
@@ -0,0 +1,272 @@
+"""The competition log.
+
+Every command a controller applies is appended to the log, along with every
+change the controllers make to the schedule, the teams, the clock sync table
+and the competition state. Each record is a line of JSON, flushed to disk as
+it is written: redis only saves its dump every few minutes, so after a crash
+the log is what the competition is rebuilt from.
+
+Replaying the log folds its records, in order, into the state they describe,
+and writes that to redis in one transaction. Compacting the log folds it
+into a single snapshot record, which replaces it; the old log is kept
+alongside, as the audit trail.
+
+All the controllers append to the same log, taking LOCK_PATH while they do.
+A controller's log is written by a thread of its own, so that the reactor
+never waits on the disk: the records appended while a write is under way
+are written, and flushed, together after it.
+"""
+import os, json, time, fcntl, copy, threading, atexit, Queue
+from contextlib import contextmanager
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'competition.log')
+COMPACT_INTERVAL = 600
+
+MATCH_FIELDS = ('type', 'start', 'state', 'stage')
+TEAM_FIELDS = ('name', 'college', 'info', 'notes', 'disqualified')
+
+def empty_state():
+    return {'matches': {}, 'teams': {}, 'sync': [], 'pause': None,
+            'current': None, 'global': None, 'match': None, 'tinker': None,
+            'knockout': None}
+
+def apply_record(state, record):
+    """Apply a record to the state it follows.
+
+    >>> state = empty_state()
+    >>> apply_record(state, {'kind': 'team', 'tla': 'ABC', 'name': 'Alpha'})
+    >>> apply_record(state, {'kind': 'team', 'tla': 'ABC', 'disqualified': True})
+    >>> sorted(state['teams']['ABC'].items())
+    [('disqualified', True), ('name', 'Alpha')]
+    >>> apply_record(state, {'kind': 'sync', 'real': 100, 'competition': 0})
+    >>> apply_record(state, {'kind': 'command', 'command': 'pause'})
+    >>> state['sync']
+    [[100, 0]]
+    """
+    kind = record['kind']
+    matches = state['matches']
+    if kind == 'snapshot':
+        state.clear()
+        state.update(copy.deepcopy(record['state']))
+    elif kind == 'match':
+        matches[record['name']] = {'type': record['type'],
+                                   'start': record['start'],
+                                   'state': 'UPCOMING',
+                                   'stage': record.get('stage'),
+                                   'teams': record.get('teams') or [],
+                                   'scores': None}
+    elif kind == 'match-cancel':
+        matches.pop(record['name'], None)
+    elif kind in ('match-start', 'match-state', 'match-teams'):
+        field = kind.split('-')[1]
+        if record['name'] in matches:
+            matches[record['name']][field] = record[field]
+    elif kind == 'scores':
+        if record['match'] in matches:
+            matches[record['match']]['scores'] = dict(record['scores'])
+    elif kind == 'score':
+        if record['match'] in matches:
+            scores = matches[record['match']]['scores'] or {}
+            scores[str(record['zone'])] = record['score']
+            scores['seq'] = record['seq']
+            matches[record['match']]['scores'] = scores
+    elif kind == 'team':
+        team = state['teams'].setdefault(record['tla'], {})
+        team.update((field, record[field]) for field in TEAM_FIELDS
+                        if field in record)
+    elif kind == 'team-remove':
+        state['teams'].pop(record['tla'], None)
+    elif kind == 'sync':
+        state['sync'].append([record['real'], record['competition']])
+    elif kind == 'sync-reset':
+        state['sync'] = []
+    elif kind == 'pause':
+        state['pause'] = record['competition']
+    elif kind == 'unpause':
+        state['pause'] = None
+    elif kind == 'current':
+        state['current'] = record['match']
+    elif kind == 'state':
+        state['global'] = record['global']
+        state['match'] = record['match']
+    elif kind == 'tinker':
+        state['tinker'] = record['tinker']
+    elif kind == 'knockout':
+        state['knockout'] = {'feeds': record['feeds'], 'seeds': record['seeds']}
+    # anything else, such as a command, is only there to be audited
+
+def fold(records, state = None):
+    """Fold records into the state they describe."""
+    if state is None:
+        state = empty_state()
+    for record in records:
+        apply_record(state, record)
+    return state
+
+def read_records(path = LOG_PATH):
+    """Read the records in a log, oldest first. A record left half written
+    by a crash, at the end of the log, is ignored."""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        lines = f.read().split('\n')
+    records = []
+    for number, line in enumerate(lines):
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            if number < len(lines) - 1 and any(lines[number + 1:]):
+                raise ValueError('{0}: record {1} is corrupt'.format(path, number + 1))
+    return records
+
+class EventLog(object):
+    """Appends the records of one controller to the log.
+
+    In the background, records are queued for a writer thread, and reach
+    the disk shortly after they are appended; flush waits until they have.
+    Otherwise, they are written before append returns."""
+    def __init__(self, source, path = LOG_PATH, background = False):
+        self.source = source
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._queue = None
+        if background:
+            self._queue = Queue.Queue()
+            writer = threading.Thread(target = self._write_queued)
+            writer.name = "{0} log writer thread".format(source)
+            writer.daemon = True
+            writer.start()
+            atexit.register(self.flush)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, data):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _commit(self, data):
+        try:
+            with self._locked():
+                self._write(data)
+        except (IOError, OSError) as e:
+            # the controllers carry on regardless
+            print "error writing to the competition log:", e
+
+    def _write_queued(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+            self._commit(''.join(batch))
+            for _ in batch:
+                self._queue.task_done()
+
+    def append(self, kind, **fields):
+        self.extend([dict(fields, kind = kind)])
+
+    def extend(self, records):
+        """Append several records, with one write to the disk."""
+        if not records:
+            return
+        now = time.time()
+        data = ''.join(json.dumps(dict(record, time = now, source = self.source),
+                                  sort_keys = True) + '\n'
+                           for record in records)
+        if self._queue is None:
+            self._commit(data)
+        else:
+            self._queue.put(data)
+
+    def flush(self):
+        """Wait until every record appended has been written."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def compact(self):
+        """Replace the log with a snapshot of the state it describes, keeping
+        the old log as competition.log.[time]. Returns the number of records
+        folded into the snapshot."""
+        self.flush()
+        with self._locked():
+            records = read_records(self.path)
+            if len(records) <= 1:
+                return 0
+            snapshot = {'kind': 'snapshot', 'state': fold(records),
+                        'time': time.time(), 'source': self.source}
+            temporary = self.path + '.new'
+            with open(temporary, 'wb') as f:
+                f.write(json.dumps(snapshot, sort_keys = True) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(self.path, '{0}.{1}'.format(self.path, int(time.time())))
+            os.rename(temporary, self.path)
+        return len(records)
+
+def replay(r, state):
+    """Write the state folded from a log to redis, replacing the schedule,
+    the teams, the clock sync table and the competition state. Returns the
+    number of matches and teams written."""
+    pipe = r.pipeline(transaction = False)
+    pipe.keys('match.schedule.*')
+    pipe.keys('teams.*')
+    stale = [key for keys in pipe.execute() for key in keys]
+    pipe = r.pipeline()
+    for key in stale + ['match.index', 'match.current', 'comp.state.global',
+                        'comp.state.match', 'comp.state.tinker', 'comp.pause',
+                        'comp.sync', 'knockout.feeds', 'knockout.seeds']:
+        pipe.delete(key)
+    for name, match in state['matches'].items():
+        for field in MATCH_FIELDS:
+            if match.get(field) is not None:
+                pipe.set('match.schedule.{0}.{1}'.format(name, field), match[field])
+        if match['teams']:
+            pipe.rpush('match.schedule.{0}.teams'.format(name), *match['teams'])
+        if match['scores']:
+            pipe.hmset('match.schedule.{0}.scores'.format(name), match['scores'])
+        pipe.zadd('match.index', match['start'], name)
+    for tla, team in state['teams'].items():
+        for field in TEAM_FIELDS:
+            value = team.get(field)
+            if field == 'disqualified':
+                value = 'true' if value else 'false'
+            if value is not None:
+                pipe.set('teams.{0}.{1}'.format(tla, field), value)
+    if state['current'] is not None:
+        pipe.set('match.current', state['current'])
+    for key, value in (('comp.state.global', state['global']),
+                       ('comp.state.match', state['match']),
+                       ('comp.pause', state['pause'])):
+        if value is not None:
+            pipe.set(key, value)
+    if state['tinker'] is not None:
+        pipe.set('comp.state.tinker', 'true' if state['tinker'] else 'false')
+    if state['sync']:
+        pipe.rpush('comp.sync', *['{0} {1}'.format(real, competition)
+                                      for real, competition in state['sync']])
+    knockout = state['knockout']
+    if knockout is not None:
+        if knockout['feeds']:
+            pipe.hmset('knockout.feeds', dict((match, json.dumps(feeds))
+                                                  for match, feeds in knockout['feeds'].items()))
+        if knockout['seeds']:
+            pipe.hmset('knockout.seeds', knockout['seeds'])
+    pipe.execute()
+    return len(state['matches']), len(state['teams'])
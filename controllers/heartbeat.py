@@ -0,0 +1,126 @@
+import time, math, ctypes, ctypes.util, os
+from collections import deque
+
+# ticks this far behind are delivered late, one per missed second; beyond
+# this, the missed seconds are skipped
+MAX_CATCH_UP = 30
+JITTER_WINDOW = 300
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _monotonic_clock():
+    """Get a function reading CLOCK_MONOTONIC, or time.time if the platform
+    does not have clock_gettime."""
+    CLOCK_MONOTONIC = 1
+    for name in ('rt', 'c'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        library = ctypes.CDLL(path, use_errno = True)
+        if not hasattr(library, 'clock_gettime'):
+            continue
+        clock_gettime = library.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        def monotonic():
+            spec = _timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return spec.tv_sec + spec.tv_nsec * 1e-9
+        return monotonic
+    return time.time
+
+monotonic = _monotonic_clock()
+
+class HeartbeatScheduler(object):
+    """Calls a function once for every second of real time, as close as
+    possible after the wall clock second boundary.
+
+    Each tick is passed the wall clock second it is for. Seconds are never
+    repeated or skipped: if the reactor stalls, the missed ticks are
+    delivered late, in order, up to MAX_CATCH_UP of them. Only a longer
+    stall, or the wall clock being stepped, resynchronises the ticks to the
+    current second.
+
+    How late each tick fires is measured on the monotonic clock.
+    """
+    def __init__(self, callback, reactor = None, wall_clock = time.time,
+                       clock = monotonic):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.callback = callback
+        self.reactor = reactor
+        self.wall_clock = wall_clock
+        self.clock = clock
+        self.next_second = None
+        self.ticks = 0
+        self.missed = 0
+        self.skipped = 0
+        self.jitter = deque(maxlen = JITTER_WINDOW)
+        self._due = None
+        self._call = None
+
+    def start(self, first_second = None):
+        """Start ticking, from first_second if given, or otherwise from the
+        next second."""
+        if first_second is None:
+            first_second = int(math.floor(self.wall_clock())) + 1
+        self.next_second = first_second
+        self._schedule()
+
+    def stop(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def _schedule(self):
+        delay = max(self.next_second - self.wall_clock(), 0)
+        self._due = self.clock() + delay
+        self._call = self.reactor.callLater(delay, self._tick)
+
+    def _tick(self):
+        self._call = None
+        lateness = self.clock() - self._due
+        current = int(math.floor(self.wall_clock()))
+        if current < self.next_second - 1:
+            # the wall clock was stepped backwards
+            print "heartbeat: wall clock went back {0}s, resynchronising".format(
+                      self.next_second - current)
+            self.next_second = current
+        elif current < self.next_second:
+            # woken early, as the wall clock is being slewed
+            self._schedule()
+            return
+        self.jitter.append(lateness)
+        behind = current - self.next_second
+        if behind > MAX_CATCH_UP:
+            print "heartbeat: skipping {0} missed tick(s)".format(behind)
+            self.skipped += behind
+            self.next_second = current
+        elif behind > 0:
+            print "heartbeat: catching up {0} missed tick(s)".format(behind)
+            self.missed += behind
+        try:
+            while self.next_second <= current:
+                second = self.next_second
+                self.next_second += 1
+                self.ticks += 1
+                self.callback(second)
+        finally:
+            self._schedule()
+
+    def stats(self):
+        """Summarise the ticks so far: how many were delivered, missed and
+        delivered late, or skipped, and the mean, 99th percentile and worst
+        lateness over recent ticks, in seconds."""
+        recent = sorted(self.jitter)
+        summary = {'ticks': self.ticks,
+                   'missed': self.missed,
+                   'skipped': self.skipped,
+                   'mean': None, 'p99': None, 'max': None}
+        if recent:
+            summary['mean'] = sum(recent) / len(recent)
+            summary['p99'] = recent[min(int(len(recent) * 0.99), len(recent) - 1)]
+            summary['max'] = recent[-1]
+        return summary
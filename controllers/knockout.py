@@ -0,0 +1,112 @@
+"""Knockout brackets.
+
+A knockout is seeded from the league standings. Each match has
+TEAMS_PER_MATCH teams, and the top ADVANCING of them go through to the next
+stage, so each match is fed by two matches of the stage before. Stages are
+numbered back from the final: stage 0 is the final, stage 1 the
+semi-finals, and so on.
+
+Seeds are spread over the first stage so that each match is evenly matched,
+and so that the top seeds can only meet in the final. The teams of later
+matches are UNDECIDED until the matches feeding them finish.
+
+The bracket is kept in redis as knockout.feeds, a hash of each match to the
+matches feeding it in slot order, and knockout.seeds, a hash of each team to
+its seed, which breaks ties.
+"""
+
+TEAMS_PER_MATCH = 4
+ADVANCING = 2
+UNDECIDED = '-'
+
+FEEDS_KEY = 'knockout.feeds'
+SEEDS_KEY = 'knockout.seeds'
+
+def bracket_order(count):
+    """Order count first stage matches, given by the rank of their top seed,
+    so that the top two seeds are in opposite halves of the bracket, the top
+    four in opposite quarters, and so on.
+
+    >>> bracket_order(4)
+    [0, 3, 1, 2]
+    >>> bracket_order(8)
+    [0, 7, 3, 4, 1, 6, 2, 5]
+    """
+    order = [0]
+    while len(order) < count:
+        size = len(order) * 2
+        order = [rank for top in order for rank in (top, size - 1 - top)]
+    return order
+
+def stage_count(team_count, stages = None):
+    """The number of stages of the largest bracket which team_count teams
+    can fill, but no more than stages.
+
+    >>> stage_count(23)
+    3
+    >>> stage_count(23, stages = 2)
+    2
+    """
+    count = 0
+    while TEAMS_PER_MATCH * 2 ** count <= team_count:
+        count += 1
+    if count == 0:
+        raise ValueError('a knockout needs at least {0} teams'.format(TEAMS_PER_MATCH))
+    return count if stages is None else min(count, stages)
+
+def match_name(prefix, stage, index):
+    return '{0}{1}-{2}'.format(prefix, stage, index)
+
+def generate_bracket(seeds, stages = None, prefix = 'K'):
+    """Build a bracket from teams in seed order. Returns the matches in the
+    order they are played, first stage first, each as a dictionary of name,
+    stage, teams and the matches feeding it.
+
+    >>> bracket = generate_bracket(['T{0:02d}'.format(n) for n in xrange(8)])
+    >>> [(match['name'], match['teams']) for match in bracket]
+    [('K1-0', ['T00', 'T03', 'T04', 'T07']), ('K1-1', ['T01', 'T02', 'T05', 'T06']), ('K0-0', ['-', '-', '-', '-'])]
+    >>> bracket[-1]['feeds']
+    ['K1-0', 'K1-1']
+    """
+    stages = stage_count(len(seeds), stages)
+    count = 2 ** (stages - 1)
+    matches = []
+    for index, top in enumerate(bracket_order(count)):
+        # snake the seeds, so each match has one from each band of count
+        teams = []
+        for band in xrange(TEAMS_PER_MATCH):
+            rank = top if band % 2 == 0 else count - 1 - top
+            teams.append(seeds[band * count + rank])
+        matches.append({'name': match_name(prefix, stages - 1, index),
+                        'stage': stages - 1, 'teams': teams, 'feeds': []})
+    for stage in xrange(stages - 2, -1, -1):
+        for index in xrange(2 ** stage):
+            matches.append({'name': match_name(prefix, stage, index),
+                            'stage': stage,
+                            'teams': [UNDECIDED] * TEAMS_PER_MATCH,
+                            'feeds': [match_name(prefix, stage + 1, index * 2),
+                                      match_name(prefix, stage + 1, index * 2 + 1)]})
+    return matches
+
+def advancing(teams, scores, seeds):
+    """The teams going through from a match, best first: the top ADVANCING
+    by score, ties going to the better seed.
+
+    >>> advancing(['ABC', 'DEF', 'GHI', 'JKL'], [5, 9, 5, 1], {'ABC': 3, 'GHI': 2})
+    ['DEF', 'GHI']
+    """
+    ranked = sorted(zip(teams, scores),
+                    key = lambda item: (-item[1], seeds.get(item[0], len(seeds)),
+                                        item[0]))
+    return [tla for tla, _ in ranked[:ADVANCING]]
+
+def fill_slot(teams, slot, through):
+    """Put the teams coming through from the match feeding a slot into a
+    match's teams.
+
+    >>> fill_slot(['-', '-', '-', '-'], 1, ['ABC', 'DEF'])
+    ['-', '-', 'ABC', 'DEF']
+    """
+    teams = list(teams) or [UNDECIDED] * TEAMS_PER_MATCH
+    teams[slot * ADVANCING:(slot + 1) * ADVANCING] = through
+    return teams
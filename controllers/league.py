@@ -0,0 +1,104 @@
+"""League standings.
+
+Each league match awards league points to its teams by where they finished,
+POSITION_POINTS[0] to the winner and so on down; tied teams all take the
+points of the higher position. Disqualified teams are awarded nothing, and
+do not take a position. The standings rank teams by league points, then by
+their total game points.
+
+The arena controller keeps the standings in the league.ranking sorted set,
+scored so that one ZREVRANGE reads them in order. They are updated
+incrementally as each match is finalised. What each match awarded is kept in
+league.matches, so a match rescored after it was finalised only applies the
+difference. Rebuilding the standings from scratch takes one pass over the
+match.index sorted set, which indexes the schedule by start time.
+"""
+import json
+
+POSITION_POINTS = (4, 3, 2, 1)
+
+# ranking scores are league points * GAME_POINTS_LIMIT + game points, so
+# game points only break ties between teams on the same league points
+GAME_POINTS_LIMIT = 100000
+
+RANKING_KEY = 'league.ranking'
+AWARDS_KEY = 'league.matches'
+
+def match_points(teams, scores, disqualified = ()):
+    """Award league points for a match, given its teams and their game
+    scores, both in zone order. Returns {tla: (league points, game points)}.
+
+    >>> sorted(match_points(['ABC', 'DEF', 'GHI', 'JKL'], [3, 7, 7, 0]).items())
+    [('ABC', (2, 3)), ('DEF', (4, 7)), ('GHI', (4, 7)), ('JKL', (1, 0))]
+    >>> sorted(match_points(['ABC', 'DEF'], [5, 2], disqualified = ['ABC']).items())
+    [('ABC', (0, 0)), ('DEF', (4, 2))]
+    """
+    ranked = sorted((score for tla, score in zip(teams, scores)
+                         if tla not in disqualified), reverse = True)
+    awarded = {}
+    for tla, score in zip(teams, scores):
+        if tla in disqualified:
+            awarded[tla] = (0, 0)
+            continue
+        position = ranked.index(score)
+        points = POSITION_POINTS[position] if position < len(POSITION_POINTS) else 0
+        awarded[tla] = (points, score)
+    return awarded
+
+def ranking_score(league_points, game_points):
+    return league_points * GAME_POINTS_LIMIT + game_points
+
+def decode_ranking(score):
+    """Split a ranking score back into (league points, game points).
+
+    >>> decode_ranking(ranking_score(11, 42))
+    (11, 42)
+    """
+    return divmod(int(round(score)), GAME_POINTS_LIMIT)
+
+def award_deltas(awarded, previous = None):
+    """The change in each team's ranking score from a match now awarding
+    awarded, where it previously awarded previous.
+
+    >>> sorted(award_deltas({'ABC': (4, 7), 'DEF': (3, 2)},
+    ...                     {'ABC': (4, 5), 'DEF': (4, 6)}).items())
+    [('ABC', 2), ('DEF', -100004)]
+    """
+    previous = previous or {}
+    deltas = {}
+    for tla in set(awarded) | set(previous):
+        delta = (ranking_score(*awarded.get(tla, (0, 0))) -
+                 ranking_score(*previous.get(tla, (0, 0))))
+        if delta:
+            deltas[tla] = delta
+    return deltas
+
+def tally(awards):
+    """Total the ranking scores of each team over the awards of many
+    matches."""
+    totals = {}
+    for awarded in awards:
+        for tla, (league_points, game_points) in awarded.iteritems():
+            totals[tla] = (totals.get(tla, 0) +
+                           ranking_score(league_points, game_points))
+    return totals
+
+def decode_awards(data):
+    if data is None:
+        return {}
+    return dict((tla, tuple(points)) for tla, points in json.loads(data).items())
+
+def is_finalised(match, state, current, match_state):
+    """Whether a match's scores are final: it has completed, or it is the
+    current match and is settling."""
+    return state == 'COMPLETED' or (match == current and match_state == 'SETTLE')
+
+def read_standings(r):
+    """Read the standings, best first, as a list of (tla, league points, game
+    points). Disqualified teams are left out."""
+    ranking = r.zrevrange(RANKING_KEY, 0, -1, withscores = True)
+    if not ranking:
+        return []
+    flags = r.mget(['teams.{0}.disqualified'.format(tla) for tla, _ in ranking])
+    return [(tla,) + decode_ranking(score)
+                for (tla, score), flag in zip(ranking, flags) if flag != 'true']
@@ -1,7 +1,11 @@
 from play_track import play_track, play_file, discover_song_description
 from controller import Controller
 from twisted.internet import reactor
-import random
+import random, time
+
+# tracks older than this many seconds are trimmed from music.history, unless
+# overridden by music.history.retention
+MUSIC_HISTORY_RETENTION = 3 * 24 * 60 * 60
 
 class MusicController(Controller):
     name = "music"
@@ -13,6 +17,7 @@ class MusicController(Controller):
         self.stopped_for_fail = None
         self.start_on_live = False
         self.fail_cancel = None
+        self._compact_history()
         if self.r.get('comp.state.global') == 'FAIL':
             self.play_fail_klaxon()
 
@@ -86,14 +91,41 @@ class MusicController(Controller):
                 self.next()
         self.current_track = uri
         self.current_track_cancel = play_track(uri, completed)
-        import time
-        self.r.rpush('music.history', '{0} {1}'.format(time.time(),
-                                                       uri))
+        self._record_history(time.time(), uri)
         if not self._get_description(uri):
             def got_description(desc):
                 self.r.hsetnx('music.descriptions', uri, desc)
             discover_song_description(uri, got_description)
 
+    def _history_retention(self):
+        retention = self.r.get('music.history.retention')
+        if retention is None:
+            return MUSIC_HISTORY_RETENTION
+        return int(retention)
+
+    def _record_history(self, timestamp, uri):
+        # music.history is a sorted set scored by start time, so queries by
+        # time range and trimming old entries are both logarithmic
+        pipe = self.r.pipeline()
+        pipe.zadd('music.history', timestamp,
+                  '{0} {1}'.format(timestamp, uri))
+        pipe.zremrangebyscore('music.history', '-inf',
+                              '({0}'.format(timestamp - self._history_retention()))
+        pipe.execute()
+
+    def _compact_history(self):
+        # convert a history from older versions, which was an unbounded list
+        if self.r.type('music.history') == 'list':
+            tracks = self.r.lrange('music.history', 0, -1)
+            pipe = self.r.pipeline()
+            pipe.delete('music.history')
+            for track in tracks:
+                start_time, _ = track.split(' ', 1)
+                pipe.zadd('music.history', float(start_time), track)
+            pipe.execute()
+        self.r.zremrangebyscore('music.history', '-inf',
+                                '({0}'.format(time.time() - self._history_retention()))
+
     def stop(self):
         if self.current_track_cancel:
             self.current_track_cancel()
@@ -165,6 +197,10 @@ class MusicController(Controller):
     def command_music_playlist(self, playlist):
         self.playlist = playlist
 
+    def command_music_history_retention(self, seconds):
+        self.r.set('music.history.retention', int(seconds))
+        self._compact_history()
+
     def command_sound_effect(self, effect):
         self.play_effect(effect)
 
@@ -0,0 +1,6 @@
+"""
+The internal locales used by L{parsedatetime_consts.Constants} when PyICU
+is not available or not requested, one module per locale ID.  Each is only
+imported the first time it is looked up in
+L{parsedatetime_consts.pdtLocales}.
+"""
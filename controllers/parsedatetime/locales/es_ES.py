@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+es_ES Locale constants for parsedatetime, loaded by L{parsedatetime_consts}
+when the locale is first used.
+"""
+
+__license__ = """
+Copyright (c) 2004-2008 Mike Taylor
+Copyright (c) 2006-2008 Darshana Chhajed
+Copyright (c)      2007 Bernd Zeimetz <bzed@debian.org>
+All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+class pdtLocale_es:
+    """
+    es Locale constants
+
+    This class will be used to initialize L{Constants} if PyICU is not located.
+
+    Defined as class variables are the lists and strings needed by parsedatetime
+    to evaluate strings in Spanish
+
+    Note that I don't speak Spanish so many of the items below are still in English
+    """
+
+    localeID      = 'es'   # don't use a unicode string
+    dateSep       = [ u'/' ]
+    timeSep       = [ u':' ]
+    meridian      = []
+    usesMeridian  = False
+    uses24        = True
+
+    Weekdays      = [ u'lunes', u'martes', u'mi\xe9rcoles',
+                      u'jueves', u'viernes', u's\xe1bado', u'domingo',
+                    ]
+    shortWeekdays = [ u'lun', u'mar', u'mi\xe9',
+                      u'jue', u'vie', u's\xe1b', u'dom',
+                    ]
+    Months        = [ u'enero', u'febrero', u'marzo',
+                      u'abril', u'mayo', u'junio',
+                      u'julio', u'agosto', u'septiembre',
+                      u'octubre', u'noviembre', u'diciembre'
+                    ]
+    shortMonths   = [ u'ene', u'feb', u'mar',
+                      u'abr', u'may', u'jun',
+                      u'jul', u'ago', u'sep',
+                      u'oct', u'nov', u'dic'
+                    ]
+    dateFormats   = { 'full':   "EEEE d' de 'MMMM' de 'yyyy",
+                      'long':   "d' de 'MMMM' de 'yyyy",
+                      'medium': "dd-MMM-yy",
+                      'short':  "d/MM/yy",
+                    }
+    timeFormats   = { 'full':   "HH'H'mm' 'ss z",
+                      'long':   "HH:mm:ss z",
+                      'medium': "HH:mm:ss",
+                      'short':  "HH:mm",
+                    }
+
+    dp_order = [ u'd', u'm', u'y' ]
+
+      # this will be added to re_consts later
+    units = { 'seconds': [ 'second', 'sec' ],
+              'minutes': [ 'minute', 'min' ],
+              'hours':   [ 'hour',   'hr'  ],
+              'days':    [ 'day',    'dy'  ],
+              'weeks':   [ 'week',   'wk'  ],
+              'months':  [ 'month',  'mth' ],
+              'years':   [ 'year',   'yr'  ],
+            }
+
+      # text constants to be used by regex's later
+    re_consts     = { 'specials':       'in|on|of|at',
+                      'timeseperator':  timeSep,
+                      'dateseperator':  dateSep,
+                      'rangeseperator': '-',
+                      'daysuffix':      'rd|st|nd|th',
+                      'qunits':         'h|m|s|d|w|m|y',
+                      'now':            [ 'now' ],
+                    }
+
+      # Used to adjust the returned date before/after the source
+    modifiers = { 'from':      1,
+                  'before':   -1,
+                  'after':     1,
+                  'ago':       1,
+                  'prior':    -1,
+                  'prev':     -1,
+                  'last':     -1,
+                  'next':      1,
+                  'previous': -1,
+                  'in a':      2,
+                  'end of':    0,
+                  'eo':        0,
+                }
+
+    dayoffsets = { 'tomorrow':   1,
+                   'today':      0,
+                   'yesterday': -1,
+                 }
+
+      # special day and/or times, i.e. lunch, noon, evening
+      # each element in the dictionary is a dictionary that is used
+      # to fill in any value to be replace - the current date/time will
+      # already have been populated by the method buildSources
+    re_sources    = { 'noon':      { 'hr': 12, 'mn': 0, 'sec': 0 },
+                      'lunch':     { 'hr': 12, 'mn': 0, 'sec': 0 },
+                      'morning':   { 'hr':  6, 'mn': 0, 'sec': 0 },
+                      'breakfast': { 'hr':  8, 'mn': 0, 'sec': 0 },
+                      'dinner':    { 'hr': 19, 'mn': 0, 'sec': 0 },
+                      'evening':   { 'hr': 18, 'mn': 0, 'sec': 0 },
+                      'midnight':  { 'hr':  0, 'mn': 0, 'sec': 0 },
+                      'night':     { 'hr': 21, 'mn': 0, 'sec': 0 },
+                      'tonight':   { 'hr': 21, 'mn': 0, 'sec': 0 },
+                      'eod':       { 'hr': 17, 'mn': 0, 'sec': 0 },
+                    }
@@ -29,6 +29,7 @@ import re
 import time
 import datetime
 import rfc822
+import threading
 import parsedatetime_consts
 
 
@@ -176,42 +177,98 @@ _additional_timezones = {'AT': -400, 'ET': -500,
 rfc822._timezones.update(_additional_timezones)
 
 
-class Calendar:
+class _ParseState(threading.local):
+    """
+    The flags used by L{Calendar} while parsing a single string.
+
+    Parsing recurses through L{Calendar.parse} and the flags are shared
+    between the levels of a single parse, so they are kept per-thread rather
+    than on the L{Calendar} itself.  That way one L{Calendar} can be shared
+    between threads.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.reset()
+
+    def reset(self):
+        self.weekdyFlag    = False  # monday/tuesday/...
+        self.dateStdFlag   = False  # 07/21/06
+        self.dateStrFlag   = False  # July 21st, 2006
+        self.timeStdFlag   = False  # 5:50 
+        self.meridianFlag  = False  # am/pm
+        self.dayStrFlag    = False  # tomorrow/yesterday/today/..
+        self.timeStrFlag   = False  # lunch/noon/breakfast/...
+        self.modifierFlag  = False  # after/before/prev/next/..
+        self.modifier2Flag = False  # after/before/prev/next/..
+        self.unitsFlag     = False  # hrs/weeks/yrs/min/..
+        self.qunitsFlag    = False  # h/m/t/d..
+
+        self.timeFlag      = 0
+        self.dateFlag      = 0
+
+
+def _stateFlag(name):
+    """
+    Build a property which reads and writes the named flag of the
+    current L{_ParseState}.
+    """
+    def get(self):
+        return getattr(self._state, name)
+
+    def set(self, value):
+        setattr(self._state, name, value)
+
+    return property(get, set)
+
+
+_tokenPatterns = [ (kind, 'CRE_%s' % kind)
+                   for kind in parsedatetime_consts.tokenKinds ]
+
+
+class Calendar(object):
     """
     A collection of routines to input, parse and manipulate date and times.
     The text can either be 'normal' date values or it can be human readable.
+
+    A L{Calendar} may be shared between threads: the state of a parse in
+    progress is kept per-thread, and is reset at the start of every call
+    to L{parse()}.
     """
 
+    weekdyFlag    = _stateFlag('weekdyFlag')
+    dateStdFlag   = _stateFlag('dateStdFlag')
+    dateStrFlag   = _stateFlag('dateStrFlag')
+    timeStdFlag   = _stateFlag('timeStdFlag')
+    meridianFlag  = _stateFlag('meridianFlag')
+    dayStrFlag    = _stateFlag('dayStrFlag')
+    timeStrFlag   = _stateFlag('timeStrFlag')
+    modifierFlag  = _stateFlag('modifierFlag')
+    modifier2Flag = _stateFlag('modifier2Flag')
+    unitsFlag     = _stateFlag('unitsFlag')
+    qunitsFlag    = _stateFlag('qunitsFlag')
+    timeFlag      = _stateFlag('timeFlag')
+    dateFlag      = _stateFlag('dateFlag')
+
     def __init__(self, constants=None):
         """
         Default constructor for the L{Calendar} class.
 
         @type  constants: object
-        @param constants: Instance of the class L{parsedatetime_consts.Constants}
+        @param constants: Instance of the class L{parsedatetime_consts.Constants};
+                          if not given, the shared en_US instance from
+                          L{parsedatetime_consts.getConstants} is used
 
         @rtype:  object
         @return: L{Calendar} instance
         """
           # if a constants reference is not included, use default
         if constants is None:
-            self.ptc = parsedatetime_consts.Constants()
+            self.ptc = parsedatetime_consts.getConstants()
         else:
             self.ptc = constants
 
-        self.weekdyFlag    = False  # monday/tuesday/...
-        self.dateStdFlag   = False  # 07/21/06
-        self.dateStrFlag   = False  # July 21st, 2006
-        self.timeStdFlag   = False  # 5:50 
-        self.meridianFlag  = False  # am/pm
-        self.dayStrFlag    = False  # tomorrow/yesterday/today/..
-        self.timeStrFlag   = False  # lunch/noon/breakfast/...
-        self.modifierFlag  = False  # after/before/prev/next/..
-        self.modifier2Flag = False  # after/before/prev/next/..
-        self.unitsFlag     = False  # hrs/weeks/yrs/min/..
-        self.qunitsFlag    = False  # h/m/t/d..
-
-        self.timeFlag      = 0
-        self.dateFlag      = 0
+        self._state = _ParseState()
 
 
     def _convertUnitAsWords(self, unitText):
@@ -1158,6 +1215,45 @@ class Calendar:
         return sourceTime
 
 
+    def _scanTokens(self, s):
+        """
+        Find the highest priority kind of pattern from
+        L{parsedatetime_consts.tokenKinds} that matches C{s}, in a single
+        pass over the patterns which stops at the first match.
+
+        @type  s: string
+        @param s: date/time text to scan
+
+        @rtype:  tuple
+        @return: tuple of: the kind found, or C{None}, and its match
+        """
+        ptc = self.ptc
+
+          # every pattern needs more than whitespace, and once the last
+          # chunk has been taken out of a string that is all that is left
+        if s.isspace():
+            return (None, None)
+
+        for kind, name in _tokenPatterns:
+            if kind == 'DATE3':
+                for match in ptc.CRE_DATE3.finditer(s):
+                    # to prevent "HH:MM(:SS) time strings" expressions from
+                    # triggering this regex, we checks if the month field
+                    # exists in the searched expression, if it doesn't
+                    # exist, the date field is not valid
+                    if match.group('mthname'):
+                        return (kind, ptc.CRE_DATE3.search(s, match.start()))
+                continue
+
+            m = getattr(ptc, name).search(s)
+            if m is not None:
+                if kind == 'WEEKDAY' and s in ptc.dayOffsets:
+                    continue
+                return (kind, m)
+
+        return (None, None)
+
+
     def parse(self, datetimeString, sourceTime=None):
         """
         Splits the given C{datetimeString} into tokens, finds the regex
@@ -1184,6 +1280,24 @@ class Calendar:
         @rtype:  tuple
         @return: tuple of: modified C{sourceTime} and the result flag
         """
+        state = self._state
+
+        if state.depth == 0:
+            state.reset()
+
+        state.depth += 1
+        try:
+            return self._parse(datetimeString, sourceTime)
+        finally:
+            state.depth -= 1
+
+
+    def _parse(self, datetimeString, sourceTime=None):
+        """
+        Implementation of L{parse()}, which runs with the parse state already
+        set up.
+        """
+        state = self._state
 
         if sourceTime:
             if isinstance(sourceTime, datetime.datetime):
@@ -1201,12 +1315,12 @@ class Calendar:
 
         if s == '' :
             if sourceTime is not None:
-                return (sourceTime, self.dateFlag + self.timeFlag)
+                return (sourceTime, state.dateFlag + state.timeFlag)
             else:
                 return (time.localtime(), 0)
 
-        self.timeFlag = 0
-        self.dateFlag = 0
+        state.timeFlag = 0
+        state.dateFlag = 0
 
         while len(s) > 0:
             flag   = False
@@ -1217,211 +1331,184 @@ class Calendar:
                 print 'parse (top of loop): [%s][%s]' % (s, parseStr)
 
             if parseStr == '':
+                kind, m = self._scanTokens(s)
+            else:
+                kind = None
+
+            if kind == 'MODIFIER':
                 # Modifier like next\prev..
-                m = self.ptc.CRE_MODIFIER.search(s)
-                if m is not None:
-                    self.modifierFlag = True
-                    if (m.group('modifier') != s):
-                        # capture remaining string
-                        parseStr = m.group('modifier')
-                        chunk1   = s[:m.start('modifier')].strip()
-                        chunk2   = s[m.end('modifier'):].strip()
-                        flag     = True
-                    else:
-                        parseStr = s
+                state.modifierFlag = True
+                if (m.group('modifier') != s):
+                    # capture remaining string
+                    parseStr = m.group('modifier')
+                    chunk1   = s[:m.start('modifier')].strip()
+                    chunk2   = s[m.end('modifier'):].strip()
+                    flag     = True
+                else:
+                    parseStr = s
 
-            if parseStr == '':
+            elif kind == 'MODIFIER2':
                 # Modifier like from\after\prior..
-                m = self.ptc.CRE_MODIFIER2.search(s)
-                if m is not None:
-                    self.modifier2Flag = True
-                    if (m.group('modifier') != s):
-                        # capture remaining string
-                        parseStr = m.group('modifier')
-                        chunk1   = s[:m.start('modifier')].strip()
-                        chunk2   = s[m.end('modifier'):].strip()
-                        flag     = True
-                    else:
-                        parseStr = s
-
-            if parseStr == '':
-                valid_date = False
-                for match in self.ptc.CRE_DATE3.finditer(s):
-                    # to prevent "HH:MM(:SS) time strings" expressions from triggering
-                    # this regex, we checks if the month field exists in the searched 
-                    # expression, if it doesn't exist, the date field is not valid
-                    if match.group('mthname'):
-                        m = self.ptc.CRE_DATE3.search(s, match.start())
-                        valid_date = True
-                        break
+                state.modifier2Flag = True
+                if (m.group('modifier') != s):
+                    # capture remaining string
+                    parseStr = m.group('modifier')
+                    chunk1   = s[:m.start('modifier')].strip()
+                    chunk2   = s[m.end('modifier'):].strip()
+                    flag     = True
+                else:
+                    parseStr = s
 
+            elif kind == 'DATE3':
                 # String date format
-                if valid_date:
-                    self.dateStrFlag = True
-                    self.dateFlag    = 1
-                    if (m.group('date') != s):
-                        # capture remaining string
-                        parseStr = m.group('date')
-                        chunk1   = s[:m.start('date')]
-                        chunk2   = s[m.end('date'):]
-                        s        = '%s %s' % (chunk1, chunk2)
-                        flag     = True
-                    else:
-                        parseStr = s
+                state.dateStrFlag = True
+                state.dateFlag    = 1
+                if (m.group('date') != s):
+                    # capture remaining string
+                    parseStr = m.group('date')
+                    chunk1   = s[:m.start('date')]
+                    chunk2   = s[m.end('date'):]
+                    s        = '%s %s' % (chunk1, chunk2)
+                    flag     = True
+                else:
+                    parseStr = s
 
-            if parseStr == '':
+            elif kind == 'DATE':
                 # Standard date format
-                m = self.ptc.CRE_DATE.search(s)
-                if m is not None:
-                    self.dateStdFlag = True
-                    self.dateFlag    = 1
-                    if (m.group('date') != s):
-                        # capture remaining string
-                        parseStr = m.group('date')
-                        chunk1   = s[:m.start('date')]
-                        chunk2   = s[m.end('date'):]
-                        s        = '%s %s' % (chunk1, chunk2)
-                        flag     = True
-                    else:
-                        parseStr = s
+                state.dateStdFlag = True
+                state.dateFlag    = 1
+                if (m.group('date') != s):
+                    # capture remaining string
+                    parseStr = m.group('date')
+                    chunk1   = s[:m.start('date')]
+                    chunk2   = s[m.end('date'):]
+                    s        = '%s %s' % (chunk1, chunk2)
+                    flag     = True
+                else:
+                    parseStr = s
 
-            if parseStr == '':
+            elif kind == 'DAY':
                 # Natural language day strings
-                m = self.ptc.CRE_DAY.search(s)
-                if m is not None:
-                    self.dayStrFlag = True
-                    self.dateFlag   = 1
-                    if (m.group('day') != s):
-                        # capture remaining string
-                        parseStr = m.group('day')
-                        chunk1   = s[:m.start('day')]
-                        chunk2   = s[m.end('day'):]
-                        s        = '%s %s' % (chunk1, chunk2)
-                        flag     = True
-                    else:
-                        parseStr = s
+                state.dayStrFlag = True
+                state.dateFlag   = 1
+                if (m.group('day') != s):
+                    # capture remaining string
+                    parseStr = m.group('day')
+                    chunk1   = s[:m.start('day')]
+                    chunk2   = s[m.end('day'):]
+                    s        = '%s %s' % (chunk1, chunk2)
+                    flag     = True
+                else:
+                    parseStr = s
 
-            if parseStr == '':
+            elif kind == 'UNITS':
                 # Quantity + Units
-                m = self.ptc.CRE_UNITS.search(s)
-                if m is not None:
-                    self.unitsFlag = True
-                    if (m.group('qty') != s):
-                        # capture remaining string
-                        parseStr = m.group('qty')
-                        chunk1   = s[:m.start('qty')].strip()
-                        chunk2   = s[m.end('qty'):].strip()
-
-                        if chunk1[-1:] == '-':
-                            parseStr = '-%s' % parseStr
-                            chunk1   = chunk1[:-1]
-
-                        s    = '%s %s' % (chunk1, chunk2)
-                        flag = True
-                    else:
-                        parseStr = s
+                state.unitsFlag = True
+                if (m.group('qty') != s):
+                    # capture remaining string
+                    parseStr = m.group('qty')
+                    chunk1   = s[:m.start('qty')].strip()
+                    chunk2   = s[m.end('qty'):].strip()
 
-            if parseStr == '':
+                    if chunk1[-1:] == '-':
+                        parseStr = '-%s' % parseStr
+                        chunk1   = chunk1[:-1]
+
+                    s    = '%s %s' % (chunk1, chunk2)
+                    flag = True
+                else:
+                    parseStr = s
+
+            elif kind == 'QUNITS':
                 # Quantity + Units
-                m = self.ptc.CRE_QUNITS.search(s)
-                if m is not None:
-                    self.qunitsFlag = True
+                state.qunitsFlag = True
 
-                    if (m.group('qty') != s):
-                        # capture remaining string
-                        parseStr = m.group('qty')
-                        chunk1   = s[:m.start('qty')].strip()
-                        chunk2   = s[m.end('qty'):].strip()
+                if (m.group('qty') != s):
+                    # capture remaining string
+                    parseStr = m.group('qty')
+                    chunk1   = s[:m.start('qty')].strip()
+                    chunk2   = s[m.end('qty'):].strip()
 
-                        if chunk1[-1:] == '-':
-                            parseStr = '-%s' % parseStr
-                            chunk1   = chunk1[:-1]
+                    if chunk1[-1:] == '-':
+                        parseStr = '-%s' % parseStr
+                        chunk1   = chunk1[:-1]
 
-                        s    = '%s %s' % (chunk1, chunk2)
-                        flag = True
-                    else:
-                        parseStr = s 
+                    s    = '%s %s' % (chunk1, chunk2)
+                    flag = True
+                else:
+                    parseStr = s 
 
-            if parseStr == '':
+            elif kind == 'WEEKDAY':
                 # Weekday
-                m = self.ptc.CRE_WEEKDAY.search(s)
-                if m is not None:
-                    gv = m.group('weekday')
-                    if s not in self.ptc.dayOffsets:
-                        self.weekdyFlag = True
-                        self.dateFlag   = 1
-                        if (gv != s):
-                            # capture remaining string
-                            parseStr = gv
-                            chunk1   = s[:m.start('weekday')]
-                            chunk2   = s[m.end('weekday'):]
-                            s        = '%s %s' % (chunk1, chunk2)
-                            flag     = True
-                        else:
-                            parseStr = s
+                gv = m.group('weekday')
+                state.weekdyFlag = True
+                state.dateFlag   = 1
+                if (gv != s):
+                    # capture remaining string
+                    parseStr = gv
+                    chunk1   = s[:m.start('weekday')]
+                    chunk2   = s[m.end('weekday'):]
+                    s        = '%s %s' % (chunk1, chunk2)
+                    flag     = True
+                else:
+                    parseStr = s
 
-            if parseStr == '':
+            elif kind == 'TIME':
                 # Natural language time strings
-                m = self.ptc.CRE_TIME.search(s)
-                if m is not None:
-                    self.timeStrFlag = True
-                    self.timeFlag    = 2
-                    if (m.group('time') != s):
-                        # capture remaining string
-                        parseStr = m.group('time')
-                        chunk1   = s[:m.start('time')]
-                        chunk2   = s[m.end('time'):]
-                        s        = '%s %s' % (chunk1, chunk2)
-                        flag     = True
-                    else:
-                        parseStr = s
+                state.timeStrFlag = True
+                state.timeFlag    = 2
+                if (m.group('time') != s):
+                    # capture remaining string
+                    parseStr = m.group('time')
+                    chunk1   = s[:m.start('time')]
+                    chunk2   = s[m.end('time'):]
+                    s        = '%s %s' % (chunk1, chunk2)
+                    flag     = True
+                else:
+                    parseStr = s
 
-            if parseStr == '':
+            elif kind == 'TIMEHMS2':
                 # HH:MM(:SS) am/pm time strings
-                m = self.ptc.CRE_TIMEHMS2.search(s)
-                if m is not None:
-                    self.meridianFlag = True
-                    self.timeFlag     = 2
-                    if m.group('minutes') is not None:
-                        if m.group('seconds') is not None:
-                            parseStr = '%s:%s:%s %s' % (m.group('hours'),
-                                                        m.group('minutes'),
-                                                        m.group('seconds'),
-                                                        m.group('meridian'))
-                        else:
-                            parseStr = '%s:%s %s' % (m.group('hours'),
-                                                     m.group('minutes'),
-                                                     m.group('meridian'))
+                state.meridianFlag = True
+                state.timeFlag     = 2
+                if m.group('minutes') is not None:
+                    if m.group('seconds') is not None:
+                        parseStr = '%s:%s:%s %s' % (m.group('hours'),
+                                                    m.group('minutes'),
+                                                    m.group('seconds'),
+                                                    m.group('meridian'))
                     else:
-                        parseStr = '%s %s' % (m.group('hours'),
-                                              m.group('meridian'))
+                        parseStr = '%s:%s %s' % (m.group('hours'),
+                                                 m.group('minutes'),
+                                                 m.group('meridian'))
+                else:
+                    parseStr = '%s %s' % (m.group('hours'),
+                                          m.group('meridian'))
 
-                    chunk1 = s[:m.start('hours')]
-                    chunk2 = s[m.end('meridian'):]
+                chunk1 = s[:m.start('hours')]
+                chunk2 = s[m.end('meridian'):]
 
-                    s    = '%s %s' % (chunk1, chunk2)
-                    flag = True
+                s    = '%s %s' % (chunk1, chunk2)
+                flag = True
 
-            if parseStr == '':
+            elif kind == 'TIMEHMS':
                 # HH:MM(:SS) time strings
-                m = self.ptc.CRE_TIMEHMS.search(s)
-                if m is not None:
-                    self.timeStdFlag = True
-                    self.timeFlag    = 2
-                    if m.group('seconds') is not None:
-                        parseStr = '%s:%s:%s' % (m.group('hours'),
-                                                 m.group('minutes'),
-                                                 m.group('seconds'))
-                        chunk1   = s[:m.start('hours')]
-                        chunk2   = s[m.end('seconds'):]
-                    else:
-                        parseStr = '%s:%s' % (m.group('hours'),
-                                              m.group('minutes'))
-                        chunk1   = s[:m.start('hours')]
-                        chunk2   = s[m.end('minutes'):]
+                state.timeStdFlag = True
+                state.timeFlag    = 2
+                if m.group('seconds') is not None:
+                    parseStr = '%s:%s:%s' % (m.group('hours'),
+                                             m.group('minutes'),
+                                             m.group('seconds'))
+                    chunk1   = s[:m.start('hours')]
+                    chunk2   = s[m.end('seconds'):]
+                else:
+                    parseStr = '%s:%s' % (m.group('hours'),
+                                          m.group('minutes'))
+                    chunk1   = s[:m.start('hours')]
+                    chunk2   = s[m.end('minutes'):]
 
-                    s    = '%s %s' % (chunk1, chunk2)
-                    flag = True
+                s    = '%s %s' % (chunk1, chunk2)
+                flag = True
 
             # if string does not match any regex, empty string to
             # come out of the while loop
@@ -1431,37 +1518,37 @@ class Calendar:
             if _debug:
                 print 'parse (bottom) [%s][%s][%s][%s]' % (s, parseStr, chunk1, chunk2)
                 print 'weekday %s, dateStd %s, dateStr %s, time %s, timeStr %s, meridian %s' % \
-                       (self.weekdyFlag, self.dateStdFlag, self.dateStrFlag, self.timeStdFlag, self.timeStrFlag, self.meridianFlag)
+                       (state.weekdyFlag, state.dateStdFlag, state.dateStrFlag, state.timeStdFlag, state.timeStrFlag, state.meridianFlag)
                 print 'dayStr %s, modifier %s, modifier2 %s, units %s, qunits %s' % \
-                       (self.dayStrFlag, self.modifierFlag, self.modifier2Flag, self.unitsFlag, self.qunitsFlag)
+                       (state.dayStrFlag, state.modifierFlag, state.modifier2Flag, state.unitsFlag, state.qunitsFlag)
 
             # evaluate the matched string
             if parseStr != '':
-                if self.modifierFlag == True:
+                if state.modifierFlag == True:
                     t, totalTime = self._evalModifier(parseStr, chunk1, chunk2, totalTime)
                     # t is the unparsed part of the chunks.
                     # If it is not date/time, return current
                     # totalTime as it is; else return the output
                     # after parsing t.
                     if (t != '') and (t != None):
-                        tempDateFlag       = self.dateFlag
-                        tempTimeFlag       = self.timeFlag
+                        tempDateFlag       = state.dateFlag
+                        tempTimeFlag       = state.timeFlag
                         (totalTime2, flag) = self.parse(t, totalTime)
 
                         if flag == 0 and totalTime is not None:
-                            self.timeFlag = tempTimeFlag
-                            self.dateFlag = tempDateFlag
+                            state.timeFlag = tempTimeFlag
+                            state.dateFlag = tempDateFlag
 
-                            return (totalTime, self.dateFlag + self.timeFlag)
+                            return (totalTime, state.dateFlag + state.timeFlag)
                         else:
-                            return (totalTime2, self.dateFlag + self.timeFlag)
+                            return (totalTime2, state.dateFlag + state.timeFlag)
 
-                elif self.modifier2Flag == True:
+                elif state.modifier2Flag == True:
                     totalTime, invalidFlag = self._evalModifier2(parseStr, chunk1, chunk2, totalTime)
 
                     if invalidFlag == True:
-                        self.dateFlag = 0
-                        self.timeFlag = 0
+                        state.dateFlag = 0
+                        state.timeFlag = 0
 
                 else:
                     totalTime = self._evalString(parseStr, totalTime)
@@ -1470,10 +1557,10 @@ class Calendar:
         # String is not parsed at all
         if totalTime is None or totalTime == sourceTime:
             totalTime     = time.localtime()
-            self.dateFlag = 0
-            self.timeFlag = 0
+            state.dateFlag = 0
+            state.timeFlag = 0
 
-        return (totalTime, self.dateFlag + self.timeFlag)
+        return (totalTime, state.dateFlag + state.timeFlag)
 
 
     def inc(self, source, month=None, year=None):
@@ -1539,3 +1626,52 @@ class Calendar:
 
         return source + (d - source)
 
+
+def parse_many(strings, sourceTime=None, calendar=None):
+    """
+    Parse a sequence of date/time strings, all relative to the same
+    C{sourceTime}, and return the times they represent in seconds since
+    the epoch.
+
+    This is intended for parsing many similar strings at once, such as the
+    start times of a day of matches: inputs which are the same once
+    stripped and lowercased are only parsed once, and a single
+    L{Calendar} and source time are used throughout, so relative strings
+    such as "+5 minutes" are all taken from the same moment.
+
+    @type  strings:    sequence of strings
+    @param strings:    date/time text to evaluate
+    @type  sourceTime: struct_time or datetime
+    @param sourceTime: value to use as the base, defaulting to the current time
+    @type  calendar:   L{Calendar}
+    @param calendar:   calendar to parse with, if not a default one
+
+    @rtype:  list
+    @return: for each string, an integer number of seconds since the
+             epoch, or C{None} if the string was not parsed as a time
+    """
+    if calendar is None:
+        calendar = Calendar()
+
+    if sourceTime is None:
+        sourceTime = time.localtime()
+    elif isinstance(sourceTime, datetime.datetime):
+        sourceTime = sourceTime.timetuple()
+
+    parsed = {}
+    result = []
+
+    for s in strings:
+        key = s.strip().lower()
+
+        if key not in parsed:
+            t, flag = calendar.parse(key, sourceTime)
+
+            if flag & 2:
+                parsed[key] = int(time.mktime(t))
+            else:
+                parsed[key] = None
+
+        result.append(parsed[key])
+
+    return result
@@ -37,443 +37,56 @@ import datetime
 import calendar
 import time
 import re
+import threading
 
 
-class pdtLocale_en:
+class _pdtLocaleMap:
     """
-    en_US Locale constants
-
-    This class will be used to initialize L{Constants} if PyICU is not located.
-
-    Defined as class variables are the lists and strings needed by parsedatetime
-    to evaluate strings for USA
+    Maps locale IDs to the internal pdt Locale classes, importing each
+    class from its module in the C{locales} package the first time it is
+    looked up, so only the locales that are used are ever loaded.
     """
+    def __init__(self, classes):
+        self.classes = classes
+        self.loaded  = {}
 
-    localeID      = 'en_US'   # don't use a unicode string
-    dateSep       = [ u'/', u'.' ]
-    timeSep       = [ u':' ]
-    meridian      = [ u'AM', u'PM' ]
-    usesMeridian  = True
-    uses24        = False
-
-    Weekdays      = [ u'monday', u'tuesday', u'wednesday',
-                      u'thursday', u'friday', u'saturday', u'sunday',
-                    ]
-    shortWeekdays = [ u'mon', u'tues', u'wed',
-                      u'thu', u'fri', u'sat', u'sun',
-                    ]
-    Months        = [ u'january', u'february', u'march',
-                      u'april',   u'may',      u'june',
-                      u'july',    u'august',   u'september',
-                      u'october', u'november', u'december',
-                    ]
-    shortMonths   = [ u'jan', u'feb', u'mar',
-                      u'apr', u'may', u'jun',
-                      u'jul', u'aug', u'sep',
-                      u'oct', u'nov', u'dec',
-                    ]
-    dateFormats   = { 'full':   'EEEE, MMMM d, yyyy',
-                      'long':   'MMMM d, yyyy',
-                      'medium': 'MMM d, yyyy',
-                      'short':  'M/d/yy',
-                    }
-    timeFormats   = { 'full':   'h:mm:ss a z',
-                      'long':   'h:mm:ss a z',
-                      'medium': 'h:mm:ss a',
-                      'short':  'h:mm a',
-                    }
-
-    dp_order = [ u'm', u'd', u'y' ]
-
-      # this will be added to re_consts later
-    units = { 'seconds': [ 'second', 'sec' ],
-              'minutes': [ 'minute', 'min' ],
-              'hours':   [ 'hour',   'hr'  ],
-              'days':    [ 'day',    'dy'  ],
-              'weeks':   [ 'week',   'wk'  ],
-              'months':  [ 'month',  'mth' ],
-              'years':   [ 'year',   'yr'  ],
-            }
-
-      # text constants to be used by regex's later
-    re_consts     = { 'specials':       'in|on|of|at',
-                      'timeseperator':  ':',
-                      'rangeseperator': '-',
-                      'daysuffix':      'rd|st|nd|th',
-                      'meridian':       'am|pm|a.m.|p.m.|a|p',
-                      'qunits':         'h|m|s|d|w|m|y',
-                      'now':            [ 'now' ],
-                    }
-
-      # Used to adjust the returned date before/after the source
-    modifiers = { 'from':       1,
-                  'before':    -1,
-                  'after':      1,
-                  'ago':       -1,
-                  'prior':     -1,
-                  'prev':      -1,
-                  'last':      -1,
-                  'next':       1,
-                  'previous':  -1,
-                  'in a':       2,
-                  'end of':     0,
-                  'eod':        0,
-                  'eo':         0
-                }
-
-    dayoffsets = { 'tomorrow':   1,
-                   'today':      0,
-                   'yesterday': -1,
-                 }
-
-      # special day and/or times, i.e. lunch, noon, evening
-      # each element in the dictionary is a dictionary that is used
-      # to fill in any value to be replace - the current date/time will
-      # already have been populated by the method buildSources
-    re_sources    = { 'noon':      { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      'lunch':     { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      'morning':   { 'hr':  6, 'mn': 0, 'sec': 0 },
-                      'breakfast': { 'hr':  8, 'mn': 0, 'sec': 0 },
-                      'dinner':    { 'hr': 19, 'mn': 0, 'sec': 0 },
-                      'evening':   { 'hr': 18, 'mn': 0, 'sec': 0 },
-                      'midnight':  { 'hr':  0, 'mn': 0, 'sec': 0 },
-                      'night':     { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      'tonight':   { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      'eod':       { 'hr': 17, 'mn': 0, 'sec': 0 },
-                    }
-
-
-class pdtLocale_au:
-    """
-    en_AU Locale constants
+    def __contains__(self, localeID):
+        return localeID in self.classes
 
-    This class will be used to initialize L{Constants} if PyICU is not located.
+    def __getitem__(self, localeID):
+        if localeID not in self.loaded:
+            name   = self.classes[localeID]
+            module = __import__('locales.%s' % localeID, globals(), {}, [ name ])
 
-    Defined as class variables are the lists and strings needed by parsedatetime
-    to evaluate strings for Australia
-    """
+            self.loaded[localeID] = getattr(module, name)
 
-    localeID      = 'en_AU'   # don't use a unicode string
-    dateSep       = [ u'-', u'/' ]
-    timeSep       = [ u':' ]
-    meridian      = [ u'AM', u'PM' ]
-    usesMeridian  = True
-    uses24        = False
-
-    Weekdays      = [ u'monday', u'tuesday', u'wednesday',
-                      u'thursday', u'friday', u'saturday', u'sunday',
-                    ]
-    shortWeekdays = [ u'mon', u'tues', u'wed',
-                      u'thu', u'fri', u'sat', u'sun',
-                    ]
-    Months        = [ u'january', u'february', u'march',
-                      u'april',   u'may',      u'june',
-                      u'july',    u'august',   u'september',
-                      u'october', u'november', u'december',
-                    ]
-    shortMonths   = [ u'jan', u'feb', u'mar',
-                      u'apr', u'may', u'jun',
-                      u'jul', u'aug', u'sep',
-                      u'oct', u'nov', u'dec',
-                    ]
-    dateFormats   = { 'full':   'EEEE, d MMMM yyyy',
-                      'long':   'd MMMM yyyy',
-                      'medium': 'dd/MM/yyyy',
-                      'short':  'd/MM/yy',
-                    }
-    timeFormats   = { 'full':   'h:mm:ss a z',
-                      'long':   'h:mm:ss a',
-                      'medium': 'h:mm:ss a',
-                      'short':  'h:mm a',
-                    }
-
-    dp_order = [ u'd', u'm', u'y' ]
-
-      # this will be added to re_consts later
-    units = { 'seconds': [ 'second', 'sec' ],
-              'minutes': [ 'minute', 'min' ],
-              'hours':   [ 'hour',   'hr'  ],
-              'days':    [ 'day',    'dy'  ],
-              'weeks':   [ 'week',   'wk'  ],
-              'months':  [ 'month',  'mth' ],
-              'years':   [ 'year',   'yr'  ],
-            }
-
-      # text constants to be used by regex's later
-    re_consts     = { 'specials':       'in|on|of|at',
-                      'timeseperator':  ':',
-                      'rangeseperator': '-',
-                      'daysuffix':      'rd|st|nd|th',
-                      'meridian':       'am|pm|a.m.|p.m.|a|p',
-                      'qunits':         'h|m|s|d|w|m|y',
-                      'now':            [ 'now' ],
-                    }
-
-      # Used to adjust the returned date before/after the source
-    modifiers = { 'from':       1,
-                  'before':    -1,
-                  'after':      1,
-                  'ago':        1,
-                  'prior':     -1,
-                  'prev':      -1,
-                  'last':      -1,
-                  'next':       1,
-                  'previous':  -1,
-                  'in a':       2,
-                  'end of':     0,
-                  'eo':         0,
-                }
-
-    dayoffsets = { 'tomorrow':   1,
-                   'today':      0,
-                   'yesterday': -1,
-                 }
-
-      # special day and/or times, i.e. lunch, noon, evening
-      # each element in the dictionary is a dictionary that is used
-      # to fill in any value to be replace - the current date/time will
-      # already have been populated by the method buildSources
-    re_sources    = { 'noon':      { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      'lunch':     { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      'morning':   { 'hr':  6, 'mn': 0, 'sec': 0 },
-                      'breakfast': { 'hr':  8, 'mn': 0, 'sec': 0 },
-                      'dinner':    { 'hr': 19, 'mn': 0, 'sec': 0 },
-                      'evening':   { 'hr': 18, 'mn': 0, 'sec': 0 },
-                      'midnight':  { 'hr':  0, 'mn': 0, 'sec': 0 },
-                      'night':     { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      'tonight':   { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      'eod':       { 'hr': 17, 'mn': 0, 'sec': 0 },
-                    }
-
-
-class pdtLocale_es:
-    """
-    es Locale constants
+        return self.loaded[localeID]
 
-    This class will be used to initialize L{Constants} if PyICU is not located.
+    def keys(self):
+        return self.classes.keys()
 
-    Defined as class variables are the lists and strings needed by parsedatetime
-    to evaluate strings in Spanish
+    def __iter__(self):
+        return iter(self.classes)
 
-    Note that I don't speak Spanish so many of the items below are still in English
-    """
 
-    localeID      = 'es'   # don't use a unicode string
-    dateSep       = [ u'/' ]
-    timeSep       = [ u':' ]
-    meridian      = []
-    usesMeridian  = False
-    uses24        = True
-
-    Weekdays      = [ u'lunes', u'martes', u'mi\xe9rcoles',
-                      u'jueves', u'viernes', u's\xe1bado', u'domingo',
-                    ]
-    shortWeekdays = [ u'lun', u'mar', u'mi\xe9',
-                      u'jue', u'vie', u's\xe1b', u'dom',
-                    ]
-    Months        = [ u'enero', u'febrero', u'marzo',
-                      u'abril', u'mayo', u'junio',
-                      u'julio', u'agosto', u'septiembre',
-                      u'octubre', u'noviembre', u'diciembre'
-                    ]
-    shortMonths   = [ u'ene', u'feb', u'mar',
-                      u'abr', u'may', u'jun',
-                      u'jul', u'ago', u'sep',
-                      u'oct', u'nov', u'dic'
-                    ]
-    dateFormats   = { 'full':   "EEEE d' de 'MMMM' de 'yyyy",
-                      'long':   "d' de 'MMMM' de 'yyyy",
-                      'medium': "dd-MMM-yy",
-                      'short':  "d/MM/yy",
-                    }
-    timeFormats   = { 'full':   "HH'H'mm' 'ss z",
-                      'long':   "HH:mm:ss z",
-                      'medium': "HH:mm:ss",
-                      'short':  "HH:mm",
-                    }
-
-    dp_order = [ u'd', u'm', u'y' ]
-
-      # this will be added to re_consts later
-    units = { 'seconds': [ 'second', 'sec' ],
-              'minutes': [ 'minute', 'min' ],
-              'hours':   [ 'hour',   'hr'  ],
-              'days':    [ 'day',    'dy'  ],
-              'weeks':   [ 'week',   'wk'  ],
-              'months':  [ 'month',  'mth' ],
-              'years':   [ 'year',   'yr'  ],
-            }
-
-      # text constants to be used by regex's later
-    re_consts     = { 'specials':       'in|on|of|at',
-                      'timeseperator':  timeSep,
-                      'dateseperator':  dateSep,
-                      'rangeseperator': '-',
-                      'daysuffix':      'rd|st|nd|th',
-                      'qunits':         'h|m|s|d|w|m|y',
-                      'now':            [ 'now' ],
-                    }
-
-      # Used to adjust the returned date before/after the source
-    modifiers = { 'from':      1,
-                  'before':   -1,
-                  'after':     1,
-                  'ago':       1,
-                  'prior':    -1,
-                  'prev':     -1,
-                  'last':     -1,
-                  'next':      1,
-                  'previous': -1,
-                  'in a':      2,
-                  'end of':    0,
-                  'eo':        0,
-                }
-
-    dayoffsets = { 'tomorrow':   1,
-                   'today':      0,
-                   'yesterday': -1,
-                 }
-
-      # special day and/or times, i.e. lunch, noon, evening
-      # each element in the dictionary is a dictionary that is used
-      # to fill in any value to be replace - the current date/time will
-      # already have been populated by the method buildSources
-    re_sources    = { 'noon':      { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      'lunch':     { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      'morning':   { 'hr':  6, 'mn': 0, 'sec': 0 },
-                      'breakfast': { 'hr':  8, 'mn': 0, 'sec': 0 },
-                      'dinner':    { 'hr': 19, 'mn': 0, 'sec': 0 },
-                      'evening':   { 'hr': 18, 'mn': 0, 'sec': 0 },
-                      'midnight':  { 'hr':  0, 'mn': 0, 'sec': 0 },
-                      'night':     { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      'tonight':   { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      'eod':       { 'hr': 17, 'mn': 0, 'sec': 0 },
-                    }
-
-
-class pdtLocale_de:
-    """
-    de_DE Locale constants
+pdtLocales = _pdtLocaleMap({ 'en_US': 'pdtLocale_en',
+                             'en_AU': 'pdtLocale_au',
+                             'es_ES': 'pdtLocale_es',
+                             'de_DE': 'pdtLocale_de',
+                           })
 
-    This class will be used to initialize L{Constants} if PyICU is not located.
 
-    Contributed by Debian parsedatetime package maintainer Bernd Zeimetz <bzed@debian.org>
-
-    Defined as class variables are the lists and strings needed by parsedatetime
-    to evaluate strings for German
+def _pdtLocaleID(localeID, fallbackLocales):
+    """
+    Return the ID of the internal pdt Locale to use for C{localeID}, which
+    is the first of C{fallbackLocales} if C{localeID} is not one of them.
     """
+    if not localeID in pdtLocales:
+        for localeID in fallbackLocales:
+            if localeID in pdtLocales:
+                break
 
-    localeID      = 'de_DE'   # don't use a unicode string
-    dateSep       = [ u'.' ]
-    timeSep       = [ u':' ]
-    meridian      = [ ]
-    usesMeridian  = False
-    uses24        = True
-
-    Weekdays      = [ u'montag', u'dienstag', u'mittwoch',
-                      u'donnerstag', u'freitag', u'samstag', u'sonntag',
-                    ]
-    shortWeekdays = [ u'mo', u'di', u'mi',
-                      u'do', u'fr', u'sa', u'so',
-                    ]
-    Months        = [ u'januar',  u'februar',  u'm\xe4rz',
-                      u'april',   u'mai',      u'juni',
-                      u'juli',    u'august',   u'september',
-                      u'oktober', u'november', u'dezember',
-                    ]
-    shortMonths   = [ u'jan', u'feb', u'mrz',
-                      u'apr', u'mai', u'jun',
-                      u'jul', u'aug', u'sep',
-                      u'okt', u'nov', u'dez',
-                    ]
-    dateFormats   = { 'full':   u'EEEE, d. MMMM yyyy',
-                      'long':   u'd. MMMM yyyy',
-                      'medium': u'dd.MM.yyyy',
-                      'short':  u'dd.MM.yy'
-                    }
-
-    timeFormats   = { 'full':   u'HH:mm:ss v',
-                      'long':   u'HH:mm:ss z',
-                      'medium': u'HH:mm:ss',
-                      'short':  u'HH:mm'
-                    }
-
-    dp_order = [ u'd', u'm', u'y' ]
-
-      # this will be added to re_consts later
-    units = { 'seconds': [ 'sekunden', 'sek',  's' ],
-              'minutes': [ 'minuten',  'min' , 'm' ],
-              'hours':   [ 'stunden',  'std',  'h' ],
-              'days':    [ 'tage',     't' ],
-              'weeks':   [ 'wochen',   'w' ],
-              'months':  [ 'monate' ], #the short version would be a capital M,
-                                       #as I understand it we can't distinguis
-                                       #between m for minutes and M for months.
-              'years':   [ 'jahre',    'j' ],
-            }
-
-      # text constants to be used by regex's later
-    re_consts     = { 'specials':       'am|dem|der|im|in|den|zum',
-                      'timeseperator':  ':',
-                      'rangeseperator': '-',
-                      'daysuffix':      '',
-                      'qunits':         'h|m|s|t|w|m|j',
-                      'now':            [ 'jetzt' ],
-                    }
-
-      # Used to adjust the returned date before/after the source
-      #still looking for insight on how to translate all of them to german.
-    modifiers = { u'from':         1,
-                  u'before':      -1,
-                  u'after':        1,
-                  u'vergangener': -1,
-                  u'vorheriger':  -1,
-                  u'prev':        -1,
-                  u'letzter':     -1,
-                  u'n\xe4chster':  1,
-                  u'dieser':       0,
-                  u'previous':    -1,
-                  u'in a':         2,
-                  u'end of':       0,
-                  u'eod':          0,
-                  u'eo':           0,
-                }
-
-     #morgen/abermorgen does not work, see http://code.google.com/p/parsedatetime/issues/detail?id=19
-    dayoffsets = { u'morgen':        1,
-                   u'heute':         0,
-                   u'gestern':      -1,
-                   u'vorgestern':   -2,
-                   u'\xfcbermorgen': 2,
-                 }
-
-      # special day and/or times, i.e. lunch, noon, evening
-      # each element in the dictionary is a dictionary that is used
-      # to fill in any value to be replace - the current date/time will
-      # already have been populated by the method buildSources
-    re_sources    = { u'mittag':      { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      u'mittags':     { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      u'mittagessen': { 'hr': 12, 'mn': 0, 'sec': 0 },
-                      u'morgen':      { 'hr':  6, 'mn': 0, 'sec': 0 },
-                      u'morgens':     { 'hr':  6, 'mn': 0, 'sec': 0 },
-                      u'fr\e4hst\xe4ck': { 'hr':  8, 'mn': 0, 'sec': 0 },
-                      u'abendessen':  { 'hr': 19, 'mn': 0, 'sec': 0 },
-                      u'abend':       { 'hr': 18, 'mn': 0, 'sec': 0 },
-                      u'abends':      { 'hr': 18, 'mn': 0, 'sec': 0 },
-                      u'mitternacht': { 'hr':  0, 'mn': 0, 'sec': 0 },
-                      u'nacht':       { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      u'nachts':      { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      u'heute abend': { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      u'heute nacht': { 'hr': 21, 'mn': 0, 'sec': 0 },
-                      u'feierabend':  { 'hr': 17, 'mn': 0, 'sec': 0 },
-                    }
-
-
-pdtLocales = { 'en_US': pdtLocale_en,
-               'en_AU': pdtLocale_au,
-               'es_ES': pdtLocale_es,
-               'de_DE': pdtLocale_de,
-             }
+    return localeID
 
 
 def _initLocale(ptc):
@@ -500,6 +113,7 @@ def _initLocale(ptc):
                 if ptc.icuLocale is not None:
                     break
 
+        ptc.locale     = None
         ptc.icuSymbols = pyicu.DateFormatSymbols(ptc.icuLocale)
 
           # grab ICU list of weekdays, skipping first entry which
@@ -537,13 +151,7 @@ def _initLocale(ptc):
                             'short':  ptc.icu_tf['short'].toPattern(),
                           }
     else:
-        if not ptc.localeID in pdtLocales:
-            for id in range(0, len(ptc.fallbackLocales)):
-                ptc.localeID  = ptc.fallbackLocales[id]
-
-                if ptc.localeID in pdtLocales:
-                    break
-
+        ptc.localeID = _pdtLocaleID(ptc.localeID, ptc.fallbackLocales)
         ptc.locale   = pdtLocales[ptc.localeID]
         ptc.usePyICU = False
 
@@ -838,6 +446,11 @@ def _initPatterns(ptc):
     ptc.TIMERNG4 = ptc.TIMERNG4 % ptc.re_values
 
 
+# The patterns that Calendar.parse() looks for, highest priority first
+tokenKinds = [ 'MODIFIER', 'MODIFIER2', 'DATE3', 'DATE', 'DAY', 'UNITS',
+               'QUNITS', 'WEEKDAY', 'TIME', 'TIMEHMS2', 'TIMEHMS' ]
+
+
 def _initConstants(ptc):
     """
     Create localized versions of the units, week and month names
@@ -895,7 +508,6 @@ class Constants:
 
           # define non-locale specific constants
 
-        self.locale   = None
         self.usePyICU = usePyICU
 
         # starting cache of leap years
@@ -1056,6 +668,14 @@ class Constants:
         self.cre_keys = self.cre_source.keys()
 
 
+    def compilePatterns(self):
+        """
+        Compile all of the regular expressions up front, rather than each
+        one on first use.
+        """
+        for name in self.cre_keys:
+            getattr(self, name)
+
     def __getattr__(self, name):
         if name in self.cre_keys:
             value = re.compile(self.cre_source[name], self.re_option)
@@ -1117,3 +737,31 @@ class Constants:
 
         return sources
 
+
+
+_constantsCache = {}
+_constantsLock  = threading.Lock()
+
+def getConstants(localeID=None, usePyICU=True, fallbackLocales=['en_US']):
+    """
+    Return a shared L{Constants} instance for the given locale settings.
+
+    Building a L{Constants} is expensive, so one instance is built per set of
+    arguments and then reused.  Its regular
+    expressions are compiled the first time each is used; if two threads
+    race to compile one they get equivalent patterns, so this is safe.
+
+    The instance is shared, so it must not be modified: code which wants to
+    change settings such as C{DOWParseStyle} should construct its own
+    L{Constants}.
+    """
+    key = (localeID, usePyICU, tuple(fallbackLocales))
+
+    _constantsLock.acquire()
+    try:
+        if key not in _constantsCache:
+            ptc = Constants(localeID, usePyICU, list(fallbackLocales))
+            _constantsCache[key] = ptc
+        return _constantsCache[key]
+    finally:
+        _constantsLock.release()
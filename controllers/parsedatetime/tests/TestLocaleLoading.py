@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+"""
+Test loading locales on demand
+"""
+
+import unittest
+import parsedatetime.parsedatetime_consts as ptc
+
+
+class test(unittest.TestCase):
+    def testLocalesLoadedOnDemand(self):
+        locales = ptc._pdtLocaleMap({ 'en_US': 'pdtLocale_en',
+                                      'de_DE': 'pdtLocale_de' })
+
+        self.assertTrue('de_DE' in locales)
+        self.assertFalse('fr_FR' in locales)
+        self.assertEqual(locales['en_US'].localeID, 'en_US')
+        self.assertEqual(locales.loaded.keys(), [ 'en_US' ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""
+Test parsing of many strings at once
+"""
+
+import unittest, time, datetime
+import parsedatetime.parsedatetime as pt
+
+
+class test(unittest.TestCase):
+    def setUp(self):
+        self.cal   = pt.Calendar()
+        self.start = datetime.datetime(2012, 4, 14, 11, 30, 0)
+
+    def _epoch(self, dt):
+        return int(time.mktime(dt.timetuple()))
+
+    def testMatchesParse(self):
+        phrases = [ '10:30', 'tomorrow 14:00', '+5 minutes', '3pm', 'noon tomorrow', '2 hours' ]
+        results = pt.parse_many(phrases, self.start)
+
+        for phrase, result in zip(phrases, results):
+            t, flag = self.cal.parse(phrase, self.start.timetuple())
+            self.assertEqual(result, int(time.mktime(t)))
+
+    def testValues(self):
+        results = pt.parse_many([ '10:30', '+5 minutes', 'tomorrow 14:00' ], self.start)
+
+        self.assertEqual(results, [ self._epoch(datetime.datetime(2012, 4, 14, 10, 30, 0)),
+                                    self._epoch(datetime.datetime(2012, 4, 14, 11, 35, 0)),
+                                    self._epoch(datetime.datetime(2012, 4, 15, 14, 0, 0)) ])
+
+    def testDuplicates(self):
+        results = pt.parse_many([ '10:30', ' 10:30', '10:30 ', 'TOMORROW 9:00', 'tomorrow 9:00' ], self.start)
+
+        self.assertEqual(len(set(results[:3])), 1)
+        self.assertEqual(results[3], results[4])
+
+    def testUnparsed(self):
+          # dates without a time are not usable as times
+        self.assertEqual(pt.parse_many([ 'tomorrow', 'bogus', '' ], self.start), [ None, None, None ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+Test sharing of Constants and Calendar instances
+"""
+
+import unittest, time, datetime, threading
+import parsedatetime.parsedatetime as pt
+import parsedatetime.parsedatetime_consts as ptc
+
+
+class test(unittest.TestCase):
+    def setUp(self):
+        self.cal   = pt.Calendar()
+        self.start = datetime.datetime(2012, 4, 14, 11, 30, 0).timetuple()
+
+    def testConstantsAreShared(self):
+        self.assertTrue(ptc.getConstants() is ptc.getConstants())
+        self.assertTrue(pt.Calendar().ptc is pt.Calendar().ptc)
+        self.assertTrue(ptc.getConstants('en_AU', usePyICU=False) is not ptc.getConstants())
+
+    def testSharedConstantsCompileOnce(self):
+        c = ptc.getConstants()
+
+        for name in c.cre_keys:
+            self.assertTrue(getattr(c, name) is getattr(c, name))
+            self.assertTrue(name in c.__dict__)
+
+    def testStateIsPerCall(self):
+        target = datetime.datetime(2012, 4, 14, 11, 35, 0).timetuple()
+
+          # flags left over from anything before the call must be ignored
+        self.cal.meridianFlag = True
+        self.cal.dateFlag     = 1
+
+        self.assertEqual(self.cal.parse('5 minutes', self.start), (target, 2))
+        self.assertFalse(self.cal.meridianFlag)
+
+    def testSharedBetweenThreads(self):
+        phrases  = [ '5 minutes', 'tomorrow', '10:30', 'noon', 'next week', '3pm', '+2 hours' ]
+        expected = [ self.cal.parse(phrase, self.start) for phrase in phrases ]
+        failures = []
+
+        def worker():
+            for n in range(50):
+                for phrase, result in zip(phrases, expected):
+                    if self.cal.parse(phrase, self.start) != result:
+                        failures.append(phrase)
+
+        threads = [ threading.Thread(target=worker) for n in range(4) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(failures, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
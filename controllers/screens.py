@@ -1,12 +1,13 @@
 import redis
-from collections import defaultdict
-import re, json
-from controller import Controller
+from collections import defaultdict, deque
+import re, json, socket
+from controller import Controller, scores_key, decode_scores
 from controller import ENTER_TIME, BOOT_TIME, LIVE_TIME, SETTLE_TIME
 from controller import FULL_MATCH_INTERVAL, PRE_START_INTERVAL, POST_START_INTERVAL
-from twisted.internet import reactor, task
-from twisted.web import server, resource, static, error
+from twisted.internet import reactor
+from twisted.web import server, resource, error, util, http
 import random
+import static_assets
 
 class Screen(object):
     def __init__(self, controller, id):
@@ -53,8 +54,9 @@ class Screen(object):
     zone = property(_get_zone,
                     _set_zone)
 
-def match_time(controller, match):
-    start = int(controller.r.get('match.schedule.{0}.start'.format(match)))
+def match_time(controller, match, start = None):
+    if start is None:
+        start = int(controller.r.get('match.schedule.{0}.start'.format(match)))
     offset = controller.competition_time - start
     if 0 <= offset <= LIVE_TIME:
         return '{0}:{1:02d}'.format(offset // 60, offset % 60)
@@ -65,9 +67,53 @@ def match_time(controller, match):
     else:
         return ''
 
+def match_clock(controller, match, id = 'time'):
+    # the screen keeps the match timer running itself, from the start time
+    # and its clock sync
+    start = int(controller.r.get('match.schedule.{0}.start'.format(match)))
+    return '<span id="{0}" data-clock="match" data-start="{1}">{2}</span>'.format(
+               id, start, match_time(controller, match, start))
+
+# screens reload themselves on a message of any other version, to pick up
+# the page which understands it
+PROTOCOL_VERSION = 1
+
+def message(op, **fields):
+    """Build a message for a screen. The operations are:
+
+        replace(id, html): replace the contents of an element
+        text(id, text): replace the text of an element
+        row(table, key, cells, before): update, insert before the row keyed
+            before (or at the end), or remove if cells is None, the row of a
+            table keyed key; cells are [style, html] pairs
+        clock(sync): set the base from which the screen runs its clocks
+    """
+    fields['v'] = PROTOCOL_VERSION
+    fields['op'] = op
+    return fields
+
+def table_messages(table, previous, rows):
+    """Messages updating the rows of a table from previous to rows, or None
+    if rows in both have changed order."""
+    keys = set(key for key, _ in rows)
+    old = dict(previous)
+    if ([key for key, _ in previous if key in keys] !=
+            [key for key, _ in rows if key in old]):
+        return None
+    messages = [message('row', table = table, key = key, cells = None)
+                    for key, _ in previous if key not in keys]
+    before = None
+    for key, cells in reversed(rows):
+        if old.get(key) != cells:
+            messages.append(message('row', table = table, key = key,
+                                    cells = cells, before = before))
+        before = key
+    return messages
+
 class Content(object):
     def __init__(self):
         self.controller = None
+        self.tables = {}
 
     def content(self, screen):
         raise NotImplemented
@@ -75,6 +121,25 @@ class Content(object):
     def action_for_event(self, event):
         return None
 
+    def table(self, id, rows):
+        """Render the rows of a table which can later be updated row by row,
+        given a list of (key, cells), where cells are (style, html) pairs."""
+        self.tables[id] = rows
+        return ''.join('<tr data-key="{0}">{1}</tr>'.format(key,
+                           ''.join('<td style="{0}">{1}</td>'.format(style, html)
+                                       for style, html in cells))
+                           for key, cells in rows)
+
+    def update_table(self, screen, id, rows):
+        """Update a table rendered by table, sending only the rows which
+        have changed. If it cannot be updated, the whole content is."""
+        previous = self.controller.sent_tables(screen).get(id)
+        messages = table_messages(id, previous, rows) if previous is not None else None
+        if messages is None:
+            return self.content(screen)
+        self.tables[id] = rows
+        return messages
+
 class UninitialisedContent(Content):
     def content(self, screen):
         return '<h1>{0}</h1>'.format(screen.id)
@@ -85,7 +150,7 @@ class OverriddenContent(Content):
 
 class NoEntryContent(Content):
     def content(self, screen):
-        return '<div style="text-align: center; width: 100%; margin-left: auto; margin-right: auto;"><object type="image/svg+xml" data="images/no-entry.svg" style="width: 420px; height: 420px;" alt="NO ENTRY"></object>'
+        return '<div style="text-align: center; width: 100%; margin-left: auto; margin-right: auto;"><object type="image/svg+xml" data="{0}" style="width: 420px; height: 420px;" alt="NO ENTRY"></object>'.format(self.controller.assets.url('images/no-entry.svg'))
 
 class BlankContent(Content):
     def content(self, screen):
@@ -94,18 +159,11 @@ class BlankContent(Content):
 class ClockContent(Content):
     def clock_display(self):
         import time
-        return '<h2 style="font-family: fixed-width; left: -1em">{0}</h2><!-- <br><small>Competition time: {1}</small> -->'.format(time.strftime('%H:%M:%S'), self.controller.competition_time)
-
-    def update(self, screen):
-        return {'clock': self.clock_display()}
+        return '<h2 style="font-family: fixed-width; left: -1em" data-clock="wall">{0}</h2><!-- <br><small>Competition time: {1}</small> -->'.format(time.strftime('%H:%M:%S', time.localtime(self.controller.clock.seconds())), self.controller.competition_time)
 
     def content(self, screen):
         return '<div id="clock">{0}</div>'.format(self.clock_display())
 
-    def action_for_event(self, event):
-        if event == 'heartbeat':
-            return self.update
-
 class NextMatchContent(Content):
     def content(self, screen):
         for i in xrange(1, 12):
@@ -152,23 +210,37 @@ class ZoneContent(Content):
             return '?'
         team = self.controller.r.lindex("match.schedule.{0}.teams".format(match), screen.zone)
         name = self.controller.r.get("teams.{0}.name".format(team))
-        time = match_time(self.controller, match)
-        return '<h2>{0}</h2><h3 id="time">{1}</h3>'.format(name, time)
+        return '<h2 id="zone-team">{0}</h2><h3>{1}</h3><h3 id="zone-score">{2}</h3>'.format(
+                   name, match_clock(self.controller, match), self.score(screen, match))
 
-    def update(self, screen):
+    def score(self, screen, match):
+        scores = self.controller.match_scores(match)
+        if scores is None or screen.zone is None or screen.zone >= len(scores):
+            return ''
+        return str(scores[screen.zone])
+
+    def update_score(self, screen):
         match = self.controller.r.get('match.current')
         if match is None:
-            return {}
-        return {'time': match_time(self.controller, match)}
+            return None
+        return [message('text', id = 'zone-score', text = self.score(screen, match))]
+
+    def update_team(self, screen):
+        match = self.controller.r.get('match.current')
+        if match is None:
+            return self.content(screen)
+        team = self.controller.r.lindex("match.schedule.{0}.teams".format(match), screen.zone)
+        name = self.controller.r.get("teams.{0}.name".format(team))
+        return [message('text', id = 'zone-team', text = name)]
 
     def action_for_event(self, event):
         if event == 'team':
-            return self.content
-        elif event in ('heartbeat', 'score'):
-            return self.update
+            return self.update_team
+        elif event == 'score':
+            return self.update_score
 
 class InfoContent(Content):
-    def content(self, screen):
+    def schedule_rows(self):
         import time
         # TODO: add league
         match_keys = self.controller.r.keys('match.schedule.*.start')
@@ -176,23 +248,33 @@ class InfoContent(Content):
         for key in match_keys:
             match = key.split('.')[2]
             match_starts[self.controller.competition_time_to_real_time(int(self.controller.r.get(key)))] = match
-        rt = time.time()
-        sched = '<div width="100%" height="100%"><table>'
-        sched += '<col style="width: 8em; font-size: x-large;">'
-        sched += '<col style="width: 20em; font-size: x-large;">'
-        sched += '<tr><th>Time</th><th>Teams</th></tr>'
+        rt = self.controller.clock.seconds()
+        rows = []
         for t, match in sorted(match_starts.items()):
             teams = self.controller.r.lrange("match.schedule.{0}.teams".format(match), 0, -1)
             if rt - 30*60 < t < rt + 40*60:
-                sched += '<tr><td style="color: {2}; font-size: x-large;">{0}</td><td style="color: {2}; font-size: x-large;">{1}</td></tr>'.format(time.strftime('%H:%M:%S', time.localtime(t)), ', '.join(teams), 'black' if t > rt else '#666666')
+                style = 'color: {0}; font-size: x-large;'.format('black' if t > rt else '#666666')
+                rows.append((match, [(style, time.strftime('%H:%M:%S', time.localtime(t))),
+                                     (style, ', '.join(teams))]))
+        return rows
+
+    def content(self, screen):
+        sched = '<div width="100%" height="100%"><table id="schedule">'
+        sched += '<col style="width: 8em; font-size: x-large;">'
+        sched += '<col style="width: 20em; font-size: x-large;">'
+        sched += '<tr><th>Time</th><th>Teams</th></tr>'
+        sched += self.table('schedule', self.schedule_rows())
         sched += '</table></div>'
         return sched
 
+    def update(self, screen):
+        return self.update_table(screen, 'schedule', self.schedule_rows())
+
     def action_for_event(self, event):
         if event in ('offset', 'team', 'schedule'):
-            return self.content
+            return self.update
         elif event == 'heartbeat' and random.random() < 0.05:
-            return self.content
+            return self.update
 
 class JudgeStatsContent(Content):
     def content(self, screen):
@@ -202,19 +284,13 @@ class JudgeStatsContent(Content):
         state = self.controller.r.get('comp.state.match')
         teams = self.controller.r.lrange("match.schedule.{0}.teams".format(match), 0, -1)
         stats = '<h4>Match {0}</h4>'.format(match)
-        stats += '<h4>{0} <span id="time">{1}</span></h4><hr>'.format(state, match_time(self.controller, match))
-        stats += '<table>'
+        stats += '<h4>{0} {1}</h4><hr>'.format(state, match_clock(self.controller, match))
+        stats += '<table id="teams">'
         stats += '<col style="width: 10em">'
         stats += '<col style="width: 10em;">'
         stats += '<col style="width: 40em;">'
         stats += '<tr><th>Team</th><th>College</th><th>Notes</th></tr>'
-        for team in teams:
-            name = self.controller.r.get('teams.{0}.name'.format(team))
-            if name is None:
-                raise ValueError("team {0} does not exist".format(name))
-            college = self.controller.r.get('teams.{0}.college'.format(team))
-            notes = self.controller.r.get('teams.{0}.notes'.format(team)).strip()
-            stats += '<tr><td style="font-weight: bold;">{0}: {1}</td><td>{2}</td><td style="text-align: justify;">{3}</td></tr>'.format(team, name, college, notes)
+        stats += self.table('teams', self.team_rows(teams))
         stats += '</table>'
         next_match, _ = self.controller.match_at_competition_time(self.controller.competition_time + FULL_MATCH_INTERVAL)
         stats += '<br>Next match: '
@@ -225,17 +301,31 @@ class JudgeStatsContent(Content):
             stats += '<strong>{0}</strong>'.format(' '.join(next_teams))
         return stats
 
-    def update(self, screen):
+    def team_rows(self, teams):
+        rows = []
+        for team in teams:
+            name = self.controller.r.get('teams.{0}.name'.format(team))
+            if name is None:
+                raise ValueError("team {0} does not exist".format(name))
+            college = self.controller.r.get('teams.{0}.college'.format(team))
+            notes = self.controller.r.get('teams.{0}.notes'.format(team)).strip()
+            rows.append((team, [('font-weight: bold;', '{0}: {1}'.format(team, name)),
+                                ('', college),
+                                ('text-align: justify;', notes)]))
+        return rows
+
+    def update_teams(self, screen):
         match = self.controller.r.get('match.current')
         if match is None:
-            return {}
-        return {'time': match_time(self.controller, match)}
+            return self.content(screen)
+        teams = self.controller.r.lrange("match.schedule.{0}.teams".format(match), 0, -1)
+        return self.update_table(screen, 'teams', self.team_rows(teams))
 
     def action_for_event(self, event):
-        if event in ('team', 'schedule'):
+        if event == 'team':
+            return self.update_teams
+        elif event == 'schedule':
             return self.content
-        elif event in ('heartbeat', 'score'):
-            return self.update
 
 def content_for_configuration(screen, gstate, astate):
     flavour = screen.flavour
@@ -276,18 +366,144 @@ def action_for_screen(controller, screen, event):
     content = content_class()
     content.controller = controller
     if event is None:
-        return content.content
+        return content, content.content
     else:
-        return content.action_for_event(event)
+        return content, content.action_for_event(event)
+
+HTTP_PORT = 8080
+
+# how long an unconfigured screen may stay disconnected before its id is
+# released, so that one which is merely reconnecting keeps its id; updates
+# are kept for a screen this long for it to resume from
+RELEASE_GRACE = 60
+
+# how many of the latest updates to each screen are kept to replay to it
+# when it reconnects
+REPLAY_BUFFER = 64
+
+# the range of reconnection delays suggested to screens, in milliseconds,
+# spread so that screens which all lose their connection at once do not all
+# reconnect at once
+RETRY_MIN = 1000
+RETRY_MAX = 5000
+
+# idle connections are closed after this many seconds; event streams are
+# sent a comment every SSE_KEEPALIVE seconds, so that they are never idle
+# and dead ones are noticed
+HTTP_IDLE_TIMEOUT = 120
+SSE_KEEPALIVE = 15
+
+# how long the screens may cache versioned assets
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+# hands out the lowest released screen id, or failing that the next from the
+# counter, skipping any id which has since been configured by hand; each
+# time an id is handed out its lease is renewed, so that a page still
+# holding it from before can be told apart
+ALLOCATE_SCREEN_ID = """
+while true do
+    local id = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    if id then
+        redis.call('ZREM', KEYS[1], id)
+    else
+        id = redis.call('INCR', KEYS[2])
+    end
+    if redis.call('EXISTS', 'screens.' .. id .. '.flavour') == 0 then
+        return {tonumber(id), redis.call('HINCRBY', KEYS[3], id, 1)}
+    end
+end
+"""
+
+# takes back a released screen id for a page reconnecting with it, unless it
+# has been handed out again since; the page's lease is checked if it has one
+RECLAIM_SCREEN_ID = """
+if ARGV[2] ~= '' and redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+if ARGV[3] ~= '' then
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+end
+return 1
+"""
+
+class AssetResource(resource.Resource):
+    """Serves a static asset, in the encoding the screen accepts, revalidated
+    with its ETag unless it is immutable."""
+    isLeaf = True
+    def __init__(self, asset, immutable = False):
+        resource.Resource.__init__(self)
+        self.asset = asset
+        self.immutable = immutable
+
+    def render_GET(self, request):
+        encoding, etag, body = self.asset.variant(
+                                   request.getHeader('accept-encoding'))
+        request.setHeader("Content-type", self.asset.content_type)
+        request.setHeader("Vary", "Accept-Encoding")
+        if self.immutable:
+            request.setHeader("Cache-Control",
+                              "public, max-age={0}, immutable".format(ASSET_MAX_AGE))
+        else:
+            # cached, but checked with the ETag before each use
+            request.setHeader("Cache-Control", "no-cache")
+        if request.setETag(etag) == http.CACHED:
+            return ''
+        if encoding != 'identity':
+            request.setHeader("Content-Encoding", encoding)
+        request.setHeader("Content-Length", str(len(body)))
+        return body
 
 class ScreenController(Controller):
     name = "screens"
 
+    def __init__(self, worker = None, listen_fd = None, http = True, **options):
+        # when scaled out, each worker is named for heartbeats and acks, and
+        # serves the screens it owns on a port of its own
+        self.worker = worker
+        if worker is not None:
+            self.name = 'screens-{0}'.format(worker)
+            self.port = HTTP_PORT + worker
+            # every worker applies the screen commands, but only the first
+            # logs them
+            self.logs_commands = worker == 1
+        else:
+            self.port = HTTP_PORT
+        self.listen_fd = listen_fd
+        self.http = http
+        Controller.__init__(self, **options)
+
     def configure(self):
+        snapshot = self.load_snapshot()
         self.competition_time = 0
+        if snapshot.llen('comp.sync'):
+            # pick up the time now rather than at the next heartbeat
+            self.competition_time = self.competition_time_at(int(self.clock.seconds()),
+                                                             snapshot)
         self._screen_connections = defaultdict(lambda: [])
         self._screens = {}
-        self._run_http_server()
+        self._heartbeat_update = None
+        self._clock_sync_key = None
+        self._scores = None
+        self._sent_content = {}
+        self._tables = defaultdict(dict)
+        # event ids are prefixed with the time this controller started, so
+        # that ones from before a restart are never mistaken for ours
+        self._epoch = '{0:x}'.format(int(self.clock.seconds() * 1000))
+        self._replay = {}
+        self._disconnected_at = {}
+        self.assets = static_assets.AssetCatalogue()
+        self._allocate_screen_id = self.r.register_script(ALLOCATE_SCREEN_ID)
+        self._reclaim_screen_id = self.r.register_script(RECLAIM_SCREEN_ID)
+        for key in snapshot.keys('screens.*.flavour'):
+            self[int(key.split('.')[1])]
+        if self.http:
+            self._run_http_server()
+        if self.worker is not None:
+            self.r.hset('screens.instances', self.name, self.port)
+            reactor.addSystemEventTrigger('before', 'shutdown',
+                                          self.r.hdel, 'screens.instances',
+                                          self.name)
 
     def _register_subscriptions(self, ps):
         ps.psubscribe('teams.*')
@@ -302,31 +518,162 @@ class ScreenController(Controller):
             ps.subscribe(channel)
 
     def next_screen_id(self):
-        highest_connected = max([0] + self._screens.keys())
-        highest_connected += 1
-        while self.r.get('screens.{0}.flavour'.format(highest_connected)) is not None:
-            highest_connected += 1
-        return highest_connected
+        """Allocate a screen id, returning it with its lease."""
+        # allocated by a script, atomically across every instance, so screens
+        # booting at once are never handed the same id
+        id, lease = self._allocate_screen_id(keys = ['screens.free_ids',
+                                                     'screens.next_id',
+                                                     'screens.leases'])
+        return int(id), int(lease)
+
+    def reclaim_screen_id(self, screen, lease = None):
+        """Take back the id of a screen connecting with it, in case it was
+        released while the screen was away. Returns False if the id has
+        been handed to another screen since, and the one connecting must
+        ask for a new one."""
+        owner = self.name if self.worker is not None else ''
+        return bool(self._reclaim_screen_id(keys = ['screens.free_ids',
+                                                    'screens.leases',
+                                                    'screens.shards'],
+                                            args = [screen.id, lease or '', owner]))
+
+    def release_screen_id(self, screen):
+        """Release the id of a screen which is unconfigured and no longer
+        connected to its owner, for reuse by the next screen to boot."""
+        if self._screen_connections.get(screen.id):
+            return
+        if screen.flavour != 'UNINITIALISED':
+            return
+        if (self.worker is not None and
+                self.r.hget('screens.shards', screen.id) != self.name):
+            return
+        pipe = self.r.pipeline()
+        pipe.zadd('screens.free_ids', screen.id, screen.id)
+        pipe.hdel('screens.shards', screen.id)
+        pipe.execute()
+
+    def assign_screen(self, id, instances = None):
+        """Assign a screen to the live instance owning fewest screens, and
+        return the name of that instance."""
+        if instances is None:
+            instances = self.r.hgetall('screens.instances')
+        load = dict((name, 0) for name in instances)
+        for owner in self.r.hvals('screens.shards'):
+            if owner in load:
+                load[owner] += 1
+        owner = min(sorted(load), key = load.get)
+        self.r.hset('screens.shards', id, owner)
+        return owner
+
+    def screen_owner(self, id):
+        """The name and port of the instance which owns a screen. Screens
+        owned by an instance which is no longer running are reassigned."""
+        if self.worker is None:
+            return self.name, self.port
+        pipe = self.r.pipeline(transaction = False)
+        pipe.hget('screens.shards', id)
+        pipe.hgetall('screens.instances')
+        owner, instances = pipe.execute()
+        if owner not in instances:
+            owner = self.assign_screen(id, instances)
+        return owner, int(instances[owner])
 
     def status_message(self):
         return '{0} screen(s) connected'.format(len(self._screen_connections))
 
     def receive_heartbeat(self, real_time, competition_time):
         self.competition_time = competition_time
+        # heartbeats caught up after a stall arrive together, so the screens
+        # are updated once for all of them
+        if self._heartbeat_update is None:
+            self._heartbeat_update = self.clock.callLater(0, self._update_on_heartbeat)
+
+    def _update_on_heartbeat(self):
+        self._heartbeat_update = None
         self.trigger_all('heartbeat')
 
     def handle_channel_message(self, channel, data):
         if channel.startswith('teams.'):
             self.trigger_all('team')
         elif channel == 'comp.offset_shift':
+            self.send_clock_sync()
             self.trigger_all('offset')
         elif channel in ('comp.state', 'comp.arena', 'comp.kickoff'):
+            self.send_clock_sync()
             self.trigger_all()
         elif channel == 'match.current.scores':
-            self.trigger_all('score')
+            if self._receive_scores(json.loads(data)):
+                self.trigger_all('score')
         elif channel == 'match.reschedule':
             self.trigger_all('schedule')
 
+    def clock_sync(self):
+        """The base from which the screens run their clocks: the real time,
+        the competition time at that moment and whether it is paused, along
+        with the local time zone offset and the length of a match."""
+        import time, calendar
+        real = self.clock.seconds()
+        competition = None
+        if self.r.llen('comp.sync'):
+            competition = self.competition_time_at(real)
+        return {'real': real,
+                'competition': competition,
+                'paused': self.r.get('comp.pause') is not None,
+                'utc_offset': calendar.timegm(time.localtime(real)) - int(real),
+                'live_time': LIVE_TIME}
+
+    def send_clock_sync(self, screens = None):
+        sync = self.clock_sync()
+        if screens is None:
+            # the clocks the screens are running only need correcting if the
+            # offset between real and competition time has changed
+            if sync['competition'] is None:
+                key = None
+            elif sync['paused']:
+                key = (True, sync['competition'])
+            else:
+                key = (False, int(round(sync['competition'] - sync['real'])))
+            if key == self._clock_sync_key:
+                return
+            self._clock_sync_key = key
+            screens = self.active_screens
+        for screen in screens:
+            self.send(screen, message('clock', sync = sync))
+
+    def _receive_scores(self, update):
+        """Apply an update from the score stream to the current scores,
+        returning whether they changed."""
+        current = self._scores
+        if 'scores' in update:
+            self._scores = (update['match'], update['seq'], update['scores'])
+        elif current is None or current[0] != update['match'] or \
+                update['seq'] > current[1] + 1:
+            # an update has been missed
+            self._scores = self._load_scores(update['match'])
+        elif update['seq'] == current[1] + 1:
+            scores = list(current[2])
+            scores[update['zone']] = update['score']
+            self._scores = (update['match'], update['seq'], scores)
+        else:
+            return False
+        return True
+
+    def _load_scores(self, match):
+        pipe = self.r.pipeline()
+        pipe.hgetall(scores_key(match))
+        pipe.llen('match.schedule.{0}.teams'.format(match))
+        fields, team_count = pipe.execute()
+        if not fields:
+            return None
+        seq, scores = decode_scores(fields, team_count)
+        return match, seq, scores
+
+    def match_scores(self, match):
+        """The scores of a match by zone, or None if it has none yet."""
+        if self._scores is None or self._scores[0] != match:
+            self._scores = self._load_scores(match)
+        return self._scores[2] if self._scores is not None else None
+
     def command_screen_redraw(self):
         self.trigger_all()
 
@@ -341,6 +688,7 @@ class ScreenController(Controller):
         del screen.override
         screen.flavour = "UNINITIALISED"
         self.trigger(screen)
+        self.release_screen_id(screen)
 
     def command_screen_override(self, id, message):
         screen = self[id]
@@ -366,9 +714,11 @@ class ScreenController(Controller):
             isLeaf = True
             def render_POST(self, request):
                 request.setHeader("Content-type", "text/plain; charset=UTF-8")
-                id = controller.next_screen_id()
+                id, lease = controller.next_screen_id()
                 controller[id] # create it
-                return str(id)
+                if controller.worker is not None:
+                    controller.assign_screen(id)
+                return '{0} {1}'.format(id, lease)
 
         class EventStreamResource(resource.Resource):
             isLeaf = True
@@ -377,14 +727,30 @@ class ScreenController(Controller):
                 self.screen = screen
 
             def render_GET(self, request):
+                # screens are redirected here from other instances' ports
+                request.setHeader("Access-Control-Allow-Origin", "*")
+                lease = request.args.get('lease', [None])[0]
+                if not controller.reclaim_screen_id(self.screen, lease):
+                    # the page reloads, and is given a new id
+                    request.setResponseCode(410)
+                    request.setHeader("Content-type", "text/plain; charset=UTF-8")
+                    return "screen id reallocated"
                 request.setHeader("Content-type", "text/event-stream")
-                controller.add_sse_stream(self.screen, request)
+                controller.add_sse_stream(self.screen, request,
+                                          request.getHeader('last-event-id'))
                 return server.NOT_DONE_YET
 
         class EventDirResource(resource.Resource):
             def getChild(self, path, request):
                 try:
                     screen = int(path)
+                    owner, port = controller.screen_owner(screen)
+                    if owner != controller.name:
+                        # keeping the screen's lease, in the query
+                        query = request.uri.partition('?')[1:]
+                        return util.Redirect('http://{0}:{1}/events/{2}{3}'.format(
+                                    request.getRequestHostname(), port, screen,
+                                    ''.join(query)))
                     return EventStreamResource(controller[screen])
                 except ValueError:
                     if path == '':
@@ -401,57 +767,166 @@ class ScreenController(Controller):
                 request.setHeader("Content-type", "text/plain; charset=UTF-8")
                 return str("OK")
 
+        class AssetDirResource(resource.Resource):
+            isLeaf = True
+            def __init__(self, directory = None):
+                resource.Resource.__init__(self)
+                self.directory = directory
+
+            def render_GET(self, request):
+                path = request.postpath
+                immutable = False
+                if self.directory is None:
+                    # v/[version]/[directory]/[name]; the assets of an older
+                    # version are not kept, so the current ones are served,
+                    # but not cached for long
+                    if not path:
+                        return error.NoResource().render(request)
+                    immutable = path[0] == controller.assets.version
+                    path = path[1:]
+                else:
+                    path = [self.directory] + path
+                asset = controller.assets.lookup('/'.join(path))
+                if asset is None:
+                    return error.NoResource().render(request)
+                return AssetResource(asset, immutable).render(request)
+
         class BaseResource(resource.Resource):
             def getChild(self, path, request):
-                if path == 'images':
-                    return static.File('images')
+                if path in static_assets.ASSET_DIRECTORIES:
+                    return AssetDirResource(path)
+                elif path == 'v':
+                    return AssetDirResource()
                 elif path == 'events':
                     return EventDirResource()
                 elif path == 'favicon.ico':
-                    return static.File('images/favicon.ico', 'image/vnd.microsoft.icon')
-                elif path == 'assets':
-                    return static.File('assets')
+                    asset = controller.assets.lookup('images/favicon.ico')
+                    if asset is None:
+                        return error.NoResource()
+                    return AssetResource(asset)
                 elif path == 'id':
                     return IDGetterResource()
                 elif path == 'panic':
                     return PanicTriggerResource()
                 elif path == '':
-                    return static.File('screen.html', 'text/html; charset=UTF-8')
+                    return AssetResource(controller.assets.page)
                 else:
                     return error.NoResource()
 
-        reactor.listenTCP(8080, server.Site(BaseResource()))
-
-    def update(self, screen, element, content):
-        sse_event = "data: {0}\r\n\r\n".format(json.dumps((element, content)))
-        for connection in self._screen_connections[screen.id]:
+        site = server.Site(BaseResource(), timeout = HTTP_IDLE_TIMEOUT)
+        if self.listen_fd is None:
+            reactor.listenTCP(HTTP_PORT, site)
+        else:
+            # a port opened by the compd supervisor, shared between workers
+            reactor.adoptStreamPort(self.listen_fd, socket.AF_INET, site)
+        if self.port != HTTP_PORT:
+            reactor.listenTCP(self.port, site)
+        self.looping_call(SSE_KEEPALIVE, self._keep_streams_alive, now = False)
+
+    def send(self, screen, message):
+        sse_event = "data: {0}\r\n\r\n".format(json.dumps(message))
+        replay = self._replay.get(screen.id)
+        if replay is not None:
+            replay['last'] += 1
+            sse_event = "id: {0}-{1}\r\n{2}".format(self._epoch, replay['last'],
+                                                    sse_event)
+            replay['events'].append((replay['last'], sse_event))
+        self._write(screen.id, sse_event)
+
+    def _write(self, id, data):
+        for connection in list(self._screen_connections[id]):
             try:
-                connection.write(sse_event)
+                connection.write(data)
             except Exception as e: # gotta catch 'em all
                 print e
-                self._screen_connections[screen.id].remove(connection)
+                self._screen_connections[id].remove(connection)
                 try:
                     connection.finish()
                 except Exception:
                     pass
 
+    def _keep_streams_alive(self):
+        for id in self._screen_connections.keys():
+            self._write(id, ":\r\n\r\n")
+
     def trigger(self, screen, event = None):
-        action = action_for_screen(self, screen, event)
+        if (not self._screen_connections.get(screen.id) and
+                screen.id not in self._replay):
+            return # not connected here, possibly owned by another instance
+        content, action = action_for_screen(self, screen, event)
         try:
             result = action(screen) if action else None
             if isinstance(result, str):
-                self.update(screen, 'content', result)
+                self._tables[screen.id] = content.tables
+                # only send the content if it has changed
+                if result != self._sent_content.get(screen.id):
+                    self._sent_content[screen.id] = result
+                    self.send(screen, message('replace', id = 'content',
+                                              html = result))
             elif result is not None:
-                for k, v in result.iteritems():
-                    self.update(screen, k, v)
+                # the content on the screen no longer matches what was sent
+                self._sent_content.pop(screen.id, None)
+                self._tables[screen.id].update(content.tables)
+                for update in result:
+                    self.send(screen, update)
         except Exception as e:
             print "Caught exception updating screen {0}".format(screen.id)
             print e
 
-    def add_sse_stream(self, screen, stream):
+    def sent_tables(self, screen):
+        """The rows of the tables last sent to a screen, by table id."""
+        return self._tables[screen.id]
+
+    def add_sse_stream(self, screen, stream, last_event_id = None):
+        stream.write("retry: {0}\r\n\r\n".format(random.randint(RETRY_MIN, RETRY_MAX)))
+        missed = self._missed_events(screen, last_event_id)
         self._screen_connections[screen.id].append(stream)
+        self._disconnected_at.pop(screen.id, None)
+        stream.notifyFinish().addBoth(self._sse_stream_finished, screen, stream)
+        if missed is not None:
+            # the screen is resuming, so it only needs what it missed
+            for sse_event in missed:
+                stream.write(sse_event)
+            return
+        self._replay.setdefault(screen.id, {'last': 0,
+                                            'events': deque(maxlen = REPLAY_BUFFER)})
+        self._sent_content.pop(screen.id, None)
+        self.send_clock_sync([screen])
         self.trigger(screen)
 
+    def _missed_events(self, screen, last_event_id):
+        """The events sent to a screen since the given event id, or None if
+        they are not all in its replay buffer."""
+        replay = self._replay.get(screen.id)
+        if replay is None or last_event_id is None:
+            return None
+        epoch, _, last = last_event_id.partition('-')
+        if epoch != self._epoch or not last.isdigit():
+            return None
+        last = int(last)
+        if last > replay['last']:
+            return None
+        if last < replay['last'] and replay['events'][0][0] > last + 1:
+            return None
+        return [sse_event for id, sse_event in replay['events'] if id > last]
+
+    def _sse_stream_finished(self, _, screen, stream):
+        if stream in self._screen_connections[screen.id]:
+            self._screen_connections[screen.id].remove(stream)
+        if not self._screen_connections[screen.id]:
+            self._disconnected_at[screen.id] = self.clock.seconds()
+            self.clock.callLater(RELEASE_GRACE, self._screen_gone, screen)
+
+    def _screen_gone(self, screen):
+        disconnected = self._disconnected_at.get(screen.id)
+        if disconnected is None or self.clock.seconds() - disconnected < RELEASE_GRACE:
+            return # it has reconnected since
+        del self._disconnected_at[screen.id]
+        self._replay.pop(screen.id, None)
+        self._sent_content.pop(screen.id, None)
+        self._tables.pop(screen.id, None)
+        self.release_screen_id(screen)
+
     def __getitem__(self, key):
         if key not in self._screens:
             self._screens[key] = Screen(self, key)
@@ -459,8 +934,10 @@ class ScreenController(Controller):
 
     @property
     def active_screens(self):
+        # screens which have disconnected are still updated for a while, so
+        # that they can resume where they left off
         return [self[screen] for screen in self._screen_connections
-                    if self._screen_connections[screen]]
+                    if self._screen_connections[screen] or screen in self._replay]
 
     refresh = trigger
 
@@ -469,6 +946,10 @@ class ScreenController(Controller):
             self.trigger(screen, *args, **kwargs)
 
 if __name__ == "__main__":
-    controller = ScreenController()
+    import sys
+    options = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+    worker, listen_fd = options.get('--worker'), options.get('--listen-fd')
+    controller = ScreenController(int(worker) if worker is not None else None,
+                                  int(listen_fd) if listen_fd is not None else None)
     reactor.run()
 
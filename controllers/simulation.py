@@ -0,0 +1,262 @@
+"""Simulate a competition day, faster than real time.
+
+The state, arena and screen controllers are run against a scratch redis
+server of the simulation's own, each with a simulated clock in place of the
+reactor. Rather than their pub/sub threads, the simulation delivers them
+their messages: in a fixed order, with everything published in each second
+handled before the clocks move on to the next. Run from the same seed, a
+simulation sends the same commands to redis, in the same order, every time.
+
+The day is a league of randomly scored matches, interrupted by a pause, a
+panic and a delay to the schedule, followed by a knockout of the top teams,
+all watched by a screen of each flavour.
+"""
+import os, time, json, random, shutil, tempfile, subprocess
+import redis
+from twisted.internet import task, defer
+
+from controller import FULL_MATCH_INTERVAL, REDIS_PROBE_INTERVAL, REDIS_PROBE_TIMEOUT
+from controller import redis_ready, RedisNotReady, InstrumentedRedis
+from compd import SERVER_COMMAND
+from eventlog import EventLog
+from state import StateController
+from arena import ArenaController
+from screens import ScreenController
+
+SIMULATION_PORT = 6390
+# 09:00 UTC on the Saturday of a competition
+START_TIME = 1365843600
+SEED = 2013
+
+# delivered after everything else published in the same round
+SENTINEL = 'simulation.sentinel'
+
+SCREENS = [('CLOCK', None), ('LAYOUT', None), ('MATCH-INFO', None),
+           ('JUDGE', None), ('BLANK', None)] + [('ZONE', zone) for zone in xrange(4)]
+# the chance of a score in each second of a live match
+SCORE_RATE = 0.1
+
+class ScratchRedis(object):
+    """A redis server for the simulation alone, on a port of its own, in a
+    temporary directory which is removed when it stops."""
+    def __init__(self, port = SIMULATION_PORT):
+        self.port = port
+        self.directory = None
+        self.process = None
+
+    def start(self):
+        self.directory = tempfile.mkdtemp(prefix = 'compd-simulation-')
+        config = os.path.join(self.directory, 'redis.conf')
+        with open(config, 'w') as f:
+            f.write('port {0}\ndir {1}\nlogfile redis.log\n'.format(self.port,
+                                                                  self.directory))
+        self.process = subprocess.Popen([SERVER_COMMAND, config])
+        r = redis.StrictRedis(port = self.port)
+        deadline = time.time() + REDIS_PROBE_TIMEOUT
+        while not redis_ready(r):
+            if time.time() > deadline or self.process.poll() is not None:
+                self.stop()
+                raise RedisNotReady('scratch redis not ready on port {0}'.format(self.port))
+            time.sleep(REDIS_PROBE_INTERVAL)
+        return r
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors = True)
+
+class SimulatedStream(object):
+    """Stands in for a screen's event stream, counting what it is sent."""
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+        self._finished = defer.Deferred()
+
+    def write(self, data):
+        self.events += 1
+        self.bytes += len(data)
+
+    def notifyFinish(self):
+        return self._finished
+
+    def finish(self):
+        pass
+
+class SimulatedController(object):
+    """A controller under simulation, with its clock, its messages and what
+    it has cost."""
+    def __init__(self, controller_class, port, start, log_path, **options):
+        self.clock = task.Clock()
+        self.clock.advance(start)
+        self.r = InstrumentedRedis(port = port)
+        self.seconds = 0.0
+        self.messages = 0
+        self.controller = self.run(controller_class, clock = self.clock,
+                                   r = self.r, subscribe = False,
+                                   log = EventLog(controller_class.name, log_path),
+                                   **options)
+        ps = self.r.pubsub()
+        self.controller.subscribe(ps)
+        ps.subscribe(SENTINEL)
+        self._listener = ps.listen()
+
+    def run(self, function, *args, **kwargs):
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.seconds += time.time() - start
+
+    def deliver(self):
+        """Deliver the messages published before the latest sentinel,
+        returning how many there were."""
+        delivered = 0
+        for message in self._listener:
+            if message['type'] not in ('message', 'pmessage'):
+                continue
+            if message['channel'] == SENTINEL:
+                break
+            delivered += 1
+            self.run(self.controller._handle_channel_message,
+                     message['channel'], message['data'])
+        self.messages += delivered
+        return delivered
+
+    def advance(self, to):
+        self.run(self.clock.advance, to - self.clock.seconds())
+
+    def due(self):
+        return any(call.getTime() <= self.clock.seconds()
+                       for call in self.clock.getDelayedCalls())
+
+    def stats(self):
+        return dict(self.r.stats.as_dict(), seconds = self.seconds,
+                    messages = self.messages)
+
+class Simulation(object):
+    """A competition day, run against the scratch redis server on port."""
+    def __init__(self, port = SIMULATION_PORT, seed = SEED, start = START_TIME):
+        # the screens' reconnection delays are chosen at random
+        random.seed(seed)
+        self.rng = random.Random(seed)
+        self.now = start
+        self.admin = redis.StrictRedis(port = port)
+        self.admin.flushdb()
+        self.directory = tempfile.mkdtemp(prefix = 'compd-simulation-log-')
+        log_path = os.path.join(self.directory, 'competition.log')
+        self.state = SimulatedController(StateController, port, start, log_path)
+        self.arena = SimulatedController(ArenaController, port, start, log_path)
+        self.screens = SimulatedController(ScreenController, port, start, log_path,
+                                           http = False)
+        self.simulated = [self.state, self.arena, self.screens]
+        self.streams = []
+        self._events = []
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors = True)
+
+    def command(self, command, **fields):
+        """Issue a command, as compdctl would."""
+        fields['command'] = command
+        self.admin.publish('comp.command', json.dumps(fields))
+
+    def at(self, real_time, function, *args, **kwargs):
+        """Do something once the simulation reaches real_time."""
+        self._events.append((real_time, len(self._events), function, args, kwargs))
+        self._events.sort()
+
+    def deliver(self):
+        self.admin.publish(SENTINEL, '')
+        return sum(simulated.deliver() for simulated in self.simulated)
+
+    def settle(self):
+        """Deliver every message, and run every call due, until there are
+        none left."""
+        while True:
+            for simulated in self.simulated:
+                simulated.advance(self.now)
+            if not self.deliver() and not any(simulated.due()
+                                                  for simulated in self.simulated):
+                return
+
+    def run_until(self, end):
+        """Run the simulation a second at a time up to real time end."""
+        self.settle()
+        while self.now < end:
+            self.now += 1
+            for simulated in self.simulated:
+                simulated.advance(self.now)
+            while self._events and self._events[0][0] <= self.now:
+                _, _, function, args, kwargs = self._events.pop(0)
+                function(*args, **kwargs)
+            self._score_at_random()
+            self.settle()
+
+    def _score_at_random(self):
+        if (self.admin.get('comp.state.match') != 'LIVE' or
+                self.admin.get('comp.state.global') != 'MATCH'):
+            return
+        if self.rng.random() < SCORE_RATE:
+            match = self.admin.get('match.current')
+            zones = self.admin.llen('match.schedule.{0}.teams'.format(match))
+            self.command('score-add', zone = self.rng.randrange(zones),
+                         points = self.rng.randint(1, 3))
+
+    def connect_screens(self):
+        controller = self.screens.controller
+        for id, (flavour, zone) in enumerate(SCREENS, 1):
+            self.command('screen-add', id = id, flavour = flavour, zone = zone)
+            self.settle()
+            stream = SimulatedStream()
+            self.screens.run(controller.add_sse_stream, controller[id], stream)
+            self.streams.append(stream)
+
+    def _delay_from(self, match, by):
+        start = int(self.admin.get('match.schedule.{0}.start'.format(match)))
+        real_time = self.state.controller.competition_time_to_real_time(
+                        start, self.admin)
+        self.command('delay-matches', start = real_time, by = by)
+
+    def day(self, matches = 60, teams = 32):
+        """Run a competition day of a league of matches between teams, and
+        a knockout. Returns the real time the day took."""
+        started = time.time()
+        self.command('start-competition')
+        self.run_until(self.now + 1)
+        self.connect_screens()
+        tlas = ['T{0:02d}'.format(n) for n in xrange(teams)]
+        league_start = self.now + 600
+        self.command('import-schedule',
+                     teams = [{'tla': tla, 'name': 'Team {0}'.format(tla)}
+                                  for tla in tlas],
+                     matches = [{'name': 'L{0}'.format(n), 'type': 'LEAGUE',
+                                 'start': league_start + n * FULL_MATCH_INTERVAL,
+                                 'teams': self.rng.sample(tlas, 4)}
+                                    for n in xrange(matches)])
+        self.run_until(self.now + 1)
+        league_time = matches * FULL_MATCH_INTERVAL
+        # a pause, a panic and a delay, each a while into the league
+        pause = league_start + league_time / 4
+        self.at(pause, self.command, 'pause')
+        self.at(pause + 300, self.command, 'unpause')
+        panic = league_start + league_time / 2
+        self.at(panic, self.command, 'panic')
+        self.at(panic + 120, self.command, 'panic-over')
+        later = 'L{0}'.format(min(matches * 3 / 4 + 2, matches - 1))
+        self.at(league_start + league_time * 3 / 4, self._delay_from, later, 120)
+        league_end = league_start + league_time + 420 + 120 + FULL_MATCH_INTERVAL
+        self.run_until(league_end)
+        self.command('generate-knockout', start = self.now + 600, stages = 2)
+        self.run_until(self.now + 600 + 4 * FULL_MATCH_INTERVAL)
+        return time.time() - started
+
+    def report(self):
+        screens = {'events': sum(stream.events for stream in self.streams),
+                   'bytes': sum(stream.bytes for stream in self.streams)}
+        return {'controllers': dict((simulated.controller.name, simulated.stats())
+                                        for simulated in self.simulated),
+                'screens': screens,
+                'league': self.admin.zrevrange('league.ranking', 0, 4,
+                                               withscores = True)}
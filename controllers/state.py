@@ -1,9 +1,13 @@
-import time
-from controller import Controller
-from twisted.internet import reactor, task
+import bisect, json
+from controller import Controller, MATCH_INDEX
+from heartbeat import HeartbeatScheduler, monotonic
+from league import read_standings
+from knockout import generate_bracket, FEEDS_KEY, SEEDS_KEY
+from eventlog import COMPACT_INTERVAL
+from twisted.internet import reactor, threads, defer
 
-def get_real_time():
-    return int(time.time())
+def get_real_time(clock = reactor):
+    return int(clock.seconds())
 
 from controller import ENTER_TIME, BOOT_TIME, LIVE_TIME, SETTLE_TIME
 from controller import FULL_MATCH_INTERVAL, PRE_START_INTERVAL, POST_START_INTERVAL
@@ -12,37 +16,98 @@ class StateController(Controller):
     name = "state"
 
     def configure(self):
-        self.real_time = get_real_time()
+        self.real_time = get_real_time(self.clock)
         self.competition_time = 0
-        if self.r.get('comp.state.global') is not None:
-            self._start_master_heartbeat()
+        self.heartbeat = None
+        snapshot = self.load_snapshot()
+        self._index_schedule(snapshot)
+        # the state controller compacts the log on behalf of them all
+        self.looping_call(COMPACT_INTERVAL, self._compact_log, now = False)
+        if snapshot.get('comp.state.global') is not None:
+            self._start_master_heartbeat(snapshot)
+
+    def _compact_log(self):
+        # folding the whole log takes a while, so it is done off the reactor,
+        # lest the master heartbeat stall; under simulation, there are no
+        # threads to hand it to
+        if self.clock is reactor:
+            compacted = threads.deferToThread(self.log.compact)
+        else:
+            compacted = defer.maybeDeferred(self.log.compact)
+        # a failure is reported, and the next compaction goes ahead regardless
+        compacted.addErrback(self._compaction_failed)
+        return compacted
+
+    def _compaction_failed(self, failure):
+        print "error compacting the competition log:", failure.getErrorMessage()
+
+    def _index_schedule(self, snapshot):
+        # schedules from older versions have no index
+        if self.r.exists(MATCH_INDEX):
+            return
+        keys = snapshot.keys('match.schedule.*.start')
+        if keys:
+            self.r.zadd(MATCH_INDEX, *[value for key in keys
+                                             for value in (int(snapshot.get(key)),
+                                                           key.split('.')[2])])
 
     def status_message(self):
-        return 'paused' if self.r.get('comp.pause') is not None else 'running'
+        status = 'paused' if self.r.get('comp.pause') is not None else 'running'
+        if self.heartbeat is not None:
+            stats = self.heartbeat.stats()
+            if stats['mean'] is not None:
+                status += ', tick jitter {0:.1f}ms mean, {1:.1f}ms p99, {2:.1f}ms max'.format(
+                              stats['mean'] * 1000, stats['p99'] * 1000,
+                              stats['max'] * 1000)
+            status += ', {0} tick(s) missed, {1} skipped'.format(stats['missed'],
+                                                               stats['skipped'])
+        return status
 
-    def _start_master_heartbeat(self):
-        t = task.LoopingCall(self._master_heartbeat)
-        t.start(1.0)
+    def _start_master_heartbeat(self, snapshot = None):
+        if self.heartbeat is not None:
+            return
+        # lateness is measured on the monotonic clock, unless simulated
+        self.heartbeat = HeartbeatScheduler(self._master_heartbeat, self.clock,
+                                            wall_clock = self.clock.seconds,
+                                            clock = monotonic if self.clock is reactor
+                                                        else self.clock.seconds)
+        if snapshot is not None:
+            # catch up on restart from the snapshot rather than reading the
+            # schedule back key by key
+            self._master_heartbeat(get_real_time(self.clock), snapshot)
+            self.heartbeat.start()
+        else:
+            self.heartbeat.start(get_real_time(self.clock))
 
-    def _master_heartbeat(self):
-        self._update_real_time()
-        self._recompute_competition_time()
+    def _master_heartbeat(self, real_time, source = None):
+        if source is None:
+            source = self.r
+        self.real_time = real_time
+        self._recompute_competition_time(source)
         self.r.publish('comp.heartbeat',
                        '{0} {1}'.format(self.real_time, self.competition_time))
-        if self.r.get('comp.pause') is None:
-            actual_match, actual_mstate = self.match_at_competition_time(self.competition_time)
-            expected_match = self.r.get('match.current')
-            expected_mstate = self.r.get('comp.state.match')
-            gstate = self.r.get('comp.state.global')
+        if source.get('comp.pause') is None:
+            actual_match, actual_mstate = self.match_at_competition_time(self.competition_time, source)
+            expected_match = source.get('match.current')
+            expected_mstate = source.get('comp.state.match')
             if actual_match != expected_match:
+                records = []
                 if expected_match:
                     self.r.set('match.schedule.{0}.state'.format(expected_match), 'COMPLETED')
+                    records.append({'kind': 'match-state', 'name': expected_match,
+                                    'state': 'COMPLETED'})
                 if actual_match:
                     self.r.set('match.schedule.{0}.state'.format(actual_match), 'IN-PROGRESS')
                     self.r.set('match.current', actual_match)
-                    self._set_state('MATCH', actual_mstate)
+                    records.append({'kind': 'match-state', 'name': actual_match,
+                                    'state': 'IN-PROGRESS'})
                 else:
                     self.r.delete('match.current')
+                records.append({'kind': 'current', 'match': actual_match})
+                self.log.extend(records)
+                if actual_match:
+                    self._set_state('MATCH', actual_mstate)
+                else:
                     self._set_state('DOWNTIME', 'SETTLE')
             elif actual_mstate != expected_mstate:
                 self._set_state('MATCH', actual_mstate)
@@ -50,7 +115,7 @@ class StateController(Controller):
             self._warn_offset()
 
     def _update_real_time(self):
-        self.real_time = get_real_time()
+        self.real_time = get_real_time(self.clock)
 
     def command_panic(self):
         self.pause()
@@ -65,12 +130,15 @@ class StateController(Controller):
 
     def pause(self):
         self.r.set('comp.pause', self.competition_time)
+        self.log.append('pause', competition = self.competition_time)
+        self._warn_offset()
 
     def unpause(self):
         pause_time = self.r.get('comp.pause')
         if pause_time is None:
             return
         self.r.delete('comp.pause')
+        self.log.append('unpause')
         self._record_sync(pause_time)
 
     command_pause = pause
@@ -79,6 +147,8 @@ class StateController(Controller):
     def _record_sync(self, competition_time):
         self.r.rpush('comp.sync', "{0} {1}".format(self.real_time,
                                                    competition_time))
+        self.log.append('sync', real = self.real_time,
+                        competition = int(competition_time))
         self._warn_offset()
 
     def _set_state(self, gstate, mstate = None):
@@ -87,21 +157,22 @@ class StateController(Controller):
             mstate = self.r.get('comp.state.match')
         else:
             self.r.set('comp.state.match', mstate)
+        self.log.append('state', **{'global': gstate, 'match': mstate})
         self.r.publish('comp.state', '{0} {1}'.format(gstate, mstate))
         print "changing state to: {0}, {1}".format(gstate, mstate)
 
     def delay_matches(self, ct, by):
         string = self.match_string_at_competition_time(ct)
         for match in string:
-            self.r.set('match.schedule.{0}.start'.format(match),
-                       str(int(self.r.get('match.schedule.{0}.start'.format(match))) + by))
+            start = int(self.r.get('match.schedule.{0}.start'.format(match))) + by
+            pipe = self.r.pipeline()
+            pipe.set('match.schedule.{0}.start'.format(match), str(start))
+            pipe.zadd(MATCH_INDEX, start, match)
+            pipe.execute()
+            self.log.append('match-start', name = match, start = start)
 
-    def _recompute_competition_time(self):
-        pause_time = self.r.get('comp.pause')
-        if pause_time is not None:
-            self.competition_time = int(pause_time)
-        else:
-            self.competition_time = self.real_time_to_competition_time(self.real_time)
+    def _recompute_competition_time(self, source = None):
+        self.competition_time = self.competition_time_at(self.real_time, source)
 
     def _warn_offset(self):
         self.r.publish('comp.offset_shift', 'trigger')
@@ -111,9 +182,11 @@ class StateController(Controller):
         self.r.publish('comp.kickoff', 'trigger')
         print "setting up CT sync records..."
         self.r.delete('comp.sync')
+        self.log.append('sync-reset')
         self._record_sync(0)
         print "configuring state..."
         self.r.set('comp.state.tinker', 'true')
+        self.log.append('tinker', tinker = True)
         self._set_state('DOWNTIME', 'SETTLE')
         print "starting master heartbeat..."
         self._start_master_heartbeat()
@@ -121,26 +194,40 @@ class StateController(Controller):
 
     # team shenanigans
     def command_add_team(self, tla, name, college = None, info = ''):
-        self.r.set('teams.{0}.name'.format(tla), name)
+        pipe = self.r.pipeline()
+        record = self._write_team(pipe, tla, name, college, info)
+        pipe.publish('teams.{0}'.format(tla), 'new')
+        pipe.execute()
+        self.log.extend([record])
+
+    def _write_team(self, pipe, tla, name, college = None, info = ''):
+        pipe.set('teams.{0}.name'.format(tla), name)
         if college is None:
             college = name
-        self.r.set('teams.{0}.college'.format(tla), college)
-        self.r.set('teams.{0}.info'.format(tla), info)
-        self.r.set('teams.{0}.disqualified'.format(tla), 'false')
-        self.r.set('teams.{0}.notes'.format(tla), '')
-        self.r.publish('teams.{0}'.format(tla), 'new')
+        pipe.set('teams.{0}.college'.format(tla), college)
+        pipe.set('teams.{0}.info'.format(tla), info)
+        pipe.set('teams.{0}.disqualified'.format(tla), 'false')
+        pipe.set('teams.{0}.notes'.format(tla), '')
+        return {'kind': 'team', 'tla': tla, 'name': name, 'college': college,
+                'info': info, 'notes': '', 'disqualified': False}
 
     def command_update_team(self, tla, name = None, college = None,
                                   info = None, notes = None, disqualified = False):
+        record = {'kind': 'team', 'tla': tla, 'disqualified': bool(disqualified)}
         if name:
             self.r.set('teams.{0}.name'.format(tla), name)
+            record['name'] = name
         if college:
             self.r.set('teams.{0}.college'.format(tla), college)
+            record['college'] = college
         if info is not None:
             self.r.set('teams.{0}.info'.format(tla), info)
+            record['info'] = info
         if notes is not None:
             self.r.set('teams.{0}.notes'.format(tla), notes)
+            record['notes'] = notes
         self.r.set('teams.{0}.disqualified'.format(tla), 'true' if disqualified else 'false')
+        self.log.extend([record])
         self.r.publish('teams.{0}'.format(tla), 'updated')
 
     def command_remove_team(self, tla):
@@ -149,39 +236,125 @@ class StateController(Controller):
         self.r.delete('teams.{0}.info'.format(tla))
         self.r.delete('teams.{0}.notes'.format(tla))
         self.r.delete('teams.{0}.disqualified'.format(tla))
+        self.log.append('team-remove', tla = tla)
         self.r.publish('teams.{0}'.format(tla), 'gone')
 
     def command_schedule_match(self, name, type, start, stage = None, teams = None):
         start_ct = self.real_time_to_competition_time(start)
         if start_ct <= self.competition_time + PRE_START_INTERVAL:
-            return
+            raise ValueError('match {0} would begin in the past'.format(name))
         if self.r.get('match.schedule.{0}.type'.format(name)) is not None:
-            return
+            raise ValueError('match {0} already exists'.format(name))
         previous, _ = self.match_at_competition_time(start_ct)
         if previous is not None:
             prev_start = int(self.r.get('match.schedule.{0}.start'.format(previous)))
             start_ct = prev_start + POST_START_INTERVAL
         self.delay_matches(start_ct, FULL_MATCH_INTERVAL)
-        self.r.set('match.schedule.{0}.type'.format(name), type)
-        self.r.set('match.schedule.{0}.start'.format(name), start_ct)
-        self.r.set('match.schedule.{0}.state'.format(name), 'UPCOMING')
+        pipe = self.r.pipeline()
+        record = self._write_match(pipe, name, type, start_ct, stage, teams)
+        pipe.publish('match.reschedule', 'trigger')
+        pipe.execute()
+        self.log.extend([record])
+
+    def _write_match(self, pipe, name, type, start_ct, stage = None, teams = None):
+        pipe.set('match.schedule.{0}.type'.format(name), type)
+        pipe.set('match.schedule.{0}.start'.format(name), start_ct)
+        pipe.zadd(MATCH_INDEX, start_ct, name)
+        pipe.set('match.schedule.{0}.state'.format(name), 'UPCOMING')
         if stage is not None:
-            self.r.set('match.schedule.{0}.stage'.format(name), stage)
-        if teams is not None:
-            for team in teams:
-                self.r.rpush('match.schedule.{0}.teams'.format(name), team)
-        self.r.publish('match.reschedule', 'trigger')
+            pipe.set('match.schedule.{0}.stage'.format(name), stage)
+        if teams:
+            pipe.rpush('match.schedule.{0}.teams'.format(name), *teams)
+        return {'kind': 'match', 'name': name, 'type': type, 'start': start_ct,
+                'stage': stage, 'teams': teams}
+
+    def _place_matches(self, matches):
+        # load the existing schedule in one go rather than scanning it for
+        # every new match
+        keys = self.r.keys('match.schedule.*.start')
+        existing_names = set(key.split('.')[2] for key in keys)
+        taken = sorted(int(start) for start in self.r.mget(keys)) if keys else []
+        offset = self.real_time_to_competition_time(self.real_time) - self.real_time
+        placed = []
+        for match in sorted(matches, key = lambda match: match['start']):
+            name = match['name']
+            if name in existing_names:
+                raise ValueError('match {0} already exists'.format(name))
+            existing_names.add(name)
+            start_ct = match['start'] + offset
+            if start_ct <= self.competition_time + PRE_START_INTERVAL:
+                raise ValueError('match {0} is in the past'.format(name))
+            # matches which would overlap an earlier one are pushed back
+            # until they fit
+            index = bisect.bisect_left(taken, start_ct - FULL_MATCH_INTERVAL + 1)
+            while index < len(taken) and taken[index] < start_ct + FULL_MATCH_INTERVAL:
+                start_ct = taken[index] + FULL_MATCH_INTERVAL
+                index += 1
+            bisect.insort(taken, start_ct)
+            placed.append((match, start_ct))
+        return placed
+
+    def command_import_schedule(self, teams = (), matches = ()):
+        # a rejected import raises, and nothing is written
+        placed = self._place_matches(matches)
+        pipe = self.r.pipeline()
+        records = []
+        for team in teams:
+            records.append(self._write_team(pipe, team['tla'], team['name'],
+                                            team.get('college'), team.get('info', '')))
+        for match, start_ct in placed:
+            records.append(self._write_match(pipe, match['name'], match['type'], start_ct,
+                                             match.get('stage'), match.get('teams')))
+        if teams:
+            pipe.publish('teams.imported',
+                         ' '.join(team['tla'] for team in teams))
+        if placed:
+            pipe.publish('match.reschedule', 'trigger')
+        pipe.execute()
+        self.log.extend(records)
+        print "imported {0} team(s) and {1} match(es)".format(len(teams), len(placed))
+
+    def command_generate_knockout(self, start, stages = None, prefix = 'K'):
+        seeds = [tla for tla, _, _ in read_standings(self.r)]
+        bracket = generate_bracket(seeds, stages, prefix)
+        for index, match in enumerate(bracket):
+            match['type'] = 'KNOCKOUT'
+            match['start'] = start + index * FULL_MATCH_INTERVAL
+        placed = self._place_matches(bracket)
+        # the whole bracket is scheduled at once
+        pipe = self.r.pipeline()
+        records = []
+        for match, start_ct in placed:
+            records.append(self._write_match(pipe, match['name'], match['type'],
+                                             start_ct, match['stage'], match['teams']))
+        pipe.delete(FEEDS_KEY, SEEDS_KEY)
+        feeds = dict((match['name'], match['feeds'])
+                         for match in bracket if match['feeds'])
+        seed_numbers = dict((tla, seed) for seed, tla in enumerate(seeds))
+        if feeds:
+            pipe.hmset(FEEDS_KEY, dict((name, json.dumps(upstream))
+                                           for name, upstream in feeds.items()))
+        pipe.hmset(SEEDS_KEY, seed_numbers)
+        pipe.publish('match.reschedule', 'trigger')
+        pipe.execute()
+        records.append({'kind': 'knockout', 'feeds': feeds, 'seeds': seed_numbers})
+        self.log.extend(records)
+        print "scheduled a knockout of {0} match(es)".format(len(placed))
 
     def command_cancel_match(self, name):
-        start_ct = int(self.r.get('match.schedule.{0}.start'.format(name)))
-        begin_ct = start_ct - PRE_START_INTERVAL
-        if begin_ct >= self.competition_time:
-            return # do not cancel matches in the past
+        start = self.r.get('match.schedule.{0}.start'.format(name))
+        if start is None:
+            raise ValueError('there is no match {0}'.format(name))
+        begin_ct = int(start) - PRE_START_INTERVAL
+        if int(start) + POST_START_INTERVAL <= self.competition_time:
+            raise ValueError('match {0} is over'.format(name))
         self.r.delete('match.schedule.{0}.type'.format(name))
         self.r.delete('match.schedule.{0}.start'.format(name))
         self.r.delete('match.schedule.{0}.state'.format(name))
         self.r.delete('match.schedule.{0}.stage'.format(name))
         self.r.delete('match.schedule.{0}.teams'.format(name))
+        self.r.zrem(MATCH_INDEX, name)
+        self.log.append('match-cancel', name = name)
         # shift matches back to fill the hole
         self.delay_matches(begin_ct, -FULL_MATCH_INTERVAL)
         self.r.publish('match.reschedule', 'trigger')
@@ -189,7 +362,7 @@ class StateController(Controller):
     def command_delay_matches(self, start, by):
         ct = self.real_time_to_competition_time(start)
         if ct <= self.competition_time:
-            return
+            raise ValueError('cannot delay matches from the past')
         self.delay_matches(ct, by)
         self.r.publish('match.reschedule', 'trigger')
 
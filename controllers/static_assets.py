@@ -0,0 +1,116 @@
+"""The static files served to the screens.
+
+Every file is read, hashed and compressed once, when the screen controller
+starts. Each file has an ETag derived from its content. The whole set has a
+version, derived from every file's content, so URLs under
+v/[version]/ can be cached by the screens indefinitely: any change to any
+file changes the version, and the page links to the new URLs.
+"""
+import os, gzip, zlib, hashlib, StringIO
+
+ASSET_DIRECTORIES = ('assets', 'images')
+PAGE = 'screen.html'
+
+CONTENT_TYPES = {'.html': 'text/html; charset=UTF-8',
+                 '.css': 'text/css; charset=UTF-8',
+                 '.js': 'application/javascript; charset=UTF-8',
+                 '.svg': 'image/svg+xml',
+                 '.ttf': 'application/x-font-ttf',
+                 '.ico': 'image/vnd.microsoft.icon',
+                 '.png': 'image/png'}
+
+# compressed variants are only kept if they are at least this much smaller
+MIN_COMPRESSION = 0.9
+
+def gzip_compress(body):
+    buffer = StringIO.StringIO()
+    # a fixed mtime keeps the output, and so the ETag, stable across restarts
+    with gzip.GzipFile(fileobj = buffer, mode = 'wb', compresslevel = 9,
+                       mtime = 0) as compressed:
+        compressed.write(body)
+    return buffer.getvalue()
+
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into the set of acceptable content
+    codings.
+
+    >>> sorted(accepted_encodings('gzip, deflate;q=0.5, br;q=0'))
+    ['deflate', 'gzip']
+    >>> sorted(accepted_encodings(None))
+    []
+    """
+    encodings = set()
+    for item in (header or '').split(','):
+        parts = [part.strip() for part in item.split(';')]
+        if not parts[0]:
+            continue
+        quality = 1.0
+        for parameter in parts[1:]:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            encodings.add(parts[0].lower())
+    return encodings
+
+class Asset(object):
+    """A static file, with its compressed variants."""
+    def __init__(self, path, body):
+        self.path = path
+        extension = os.path.splitext(path)[1].lower()
+        self.content_type = CONTENT_TYPES.get(extension, 'application/octet-stream')
+        self.hash = hashlib.sha1(body).hexdigest()
+        self.variants = {'identity': body}
+        compressed = gzip_compress(body)
+        if len(compressed) < len(body) * MIN_COMPRESSION:
+            self.variants['gzip'] = compressed
+            self.variants['deflate'] = zlib.compress(body, 9)
+
+    def variant(self, accept_encoding):
+        """Choose the variant to send for the given Accept-Encoding header,
+        returning (content coding, ETag, body)."""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('gzip', 'deflate'):
+            if encoding in self.variants and encoding in accepted:
+                break
+        else:
+            encoding = 'identity'
+        # the ETag is strong, so each variant needs one of its own
+        suffix = '' if encoding == 'identity' else '-' + encoding
+        etag = '"{0}{1}"'.format(self.hash[:20], suffix)
+        return encoding, etag, self.variants[encoding]
+
+class AssetCatalogue(object):
+    """All the static files served to the screens, keyed by their path
+    relative to the controllers directory."""
+    def __init__(self, root = '.'):
+        self.assets = {}
+        for directory in ASSET_DIRECTORIES:
+            for name in sorted(os.listdir(os.path.join(root, directory))):
+                path = '{0}/{1}'.format(directory, name)
+                with open(os.path.join(root, directory, name), 'rb') as f:
+                    self.assets[path] = Asset(path, f.read())
+        self.version = hashlib.sha1(''.join(
+                           asset.hash for _, asset in sorted(self.assets.items())
+                       )).hexdigest()[:12]
+        with open(os.path.join(root, PAGE), 'rb') as f:
+            page = f.read()
+        # link the page to the versioned URLs
+        for directory in ASSET_DIRECTORIES:
+            page = page.replace('"{0}/'.format(directory),
+                                '"{0}{1}/'.format(self.prefix, directory))
+        self.page = Asset(PAGE, page)
+
+    @property
+    def prefix(self):
+        return 'v/{0}/'.format(self.version)
+
+    def lookup(self, path):
+        """Look up an asset by path, or None if there is no such asset."""
+        return self.assets.get(path)
+
+    def url(self, path):
+        """The versioned URL of an asset, relative to the page."""
+        return self.prefix + path